@@ -129,7 +129,7 @@ def launch(request):
 @require_POST
 def kill(request, name):
     container = client.list(filters={'name': name})[0]
-    client.kill(container)
+    client.remove_container(container)
     return HttpResponseRedirect('/')
 
 
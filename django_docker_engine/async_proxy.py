@@ -0,0 +1,483 @@
+"""
+asyncio counterpart of proxy.Proxy, for use under Django's ASGI handler.
+WebSocket upgrades are tunnelled through to the container, so an open
+browser tab does not hold a thread.
+
+Requires Python 3, and Django >= 3.1 for async views. HTTP response
+bodies are read in full before they are returned, up to max_body_bytes:
+Streaming them needs Django >= 4.2, which proxy.Proxy does not support.
+"""
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+import struct
+from http.cookies import SimpleCookie
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf.urls import url
+from django.http import HttpResponse
+from docker.errors import NotFound
+
+from .container_managers.docker_engine import DockerEngineManagerError
+from .prober import READY, STARTING
+from .proxy import Proxy
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+_HOP_BY_HOP = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailer', 'trailers', 'transfer-encoding', 'upgrade'
+}
+_WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+_CHUNK_SIZE = 64 * 1024
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+_OP_CONTINUATION = 0x0
+_OP_TEXT = 0x1
+_OP_BINARY = 0x2
+_OP_CLOSE = 0x8
+_OP_PING = 0x9
+_OP_PONG = 0xA
+
+
+class UpstreamError(Exception):
+    pass
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+_TRANSIENT_ERRORS = (
+    DockerEngineManagerError, NotFound, UpstreamError, OSError,
+    asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+    asyncio.TimeoutError
+)
+
+
+class AsyncProxy(Proxy):
+    """
+    Takes the same arguments as Proxy, and url_patterns() can be included
+    the same way. For WebSockets, which Django does not route, wrap the
+    Django ASGI application with asgi_application().
+
+    Also takes max_body_bytes: Larger responses from the container are
+    answered with 502, rather than buffered.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.max_body_bytes = kwargs.pop('max_body_bytes', MAX_BODY_BYTES)
+        super(AsyncProxy, self).__init__(*args, **kwargs)
+        self.connect_timeout_seconds = kwargs.get('connect_timeout_seconds')
+        self.read_timeout_seconds = kwargs.get('read_timeout_seconds')
+
+    def url_patterns(self):
+        async def proxy_view(request, container_name, url):
+            return await self._async_proxy_view(request, container_name, url)
+        if self.csrf_exempt:
+            proxy_view.csrf_exempt = True
+        proxy_url = url(r'^(?P<container_name>[^/]*)/(?P<url>.*)$', proxy_view)
+        patterns = super(AsyncProxy, self).url_patterns()
+        return patterns[:-1] + [proxy_url]
+
+    def asgi_application(self, django_application, path_prefix='/docker/'):
+        """
+        :param django_application: eg. django.core.asgi.get_asgi_application()
+        :param path_prefix: Where url_patterns() are included.
+        :return: An ASGI application which tunnels WebSockets under
+        path_prefix to the containers, and passes everything else to Django.
+        """
+        async def application(scope, receive, send):
+            if scope['type'] == 'websocket' \
+                    and scope['path'].startswith(path_prefix):
+                (container_name, _, path) = \
+                    scope['path'][len(path_prefix):].partition('/')
+                await self._websocket(scope, receive, send,
+                                      container_name, path)
+            else:
+                await django_application(scope, receive, send)
+        return application
+
+    async def _route(self, container_name):
+        route = self.route_cache.get(container_name)
+        if route is None:
+            route = await sync_to_async(
+                self._fetch_route, thread_sensitive=False)(container_name)
+        return route
+
+    async def _async_starting_view(self, request, container_name):
+        # Like _starting_view, but parks on a future, not a thread.
+        if self.prober is None or \
+                self.prober.state(container_name) != STARTING:
+            return None
+        if self.park_seconds:
+            loop = asyncio.get_event_loop()
+            done = loop.create_future()
+
+            def resolve():
+                if not done.done():
+                    done.set_result(None)
+            self.prober.on_done(
+                container_name, lambda: loop.call_soon_threadsafe(resolve))
+            try:
+                await asyncio.wait_for(done, self.park_seconds)
+            except asyncio.TimeoutError:
+                pass
+            if self.prober.state(container_name) == READY:
+                return None
+        view = self._please_wait_view_factory('Starting').as_view()
+        return view(request)
+
+    async def _async_proxy_view(self, request, container_name, url):
+        starting = await self._async_starting_view(request, container_name)
+        if starting is not None:
+            return starting
+        try:
+            route = await self._route(container_name)
+            await sync_to_async(
+                self.historian.record, thread_sensitive=False)(route.id, url)
+            if self.metrics is None:
+                return await self._upstream_response(request, route, url)
+            with self.metrics.timed('proxy_request_seconds', (
+                    ('image', route.image or ''),)):
+                return await self._upstream_response(request, route, url)
+        except BodyTooLarge as e:
+            logger.warn(
+                'Response not proxied. '
+                'Container: %s, Exception: %s', container_name, e)
+            return HttpResponse('Response too large', status=502)
+        except _TRANSIENT_ERRORS as e:
+            logger.info(
+                'Normal transient error. '
+                'Container: %s, Exception: %s', container_name, e)
+            self.route_cache.invalidate(container_name)
+            view = self._please_wait_view_factory(e).as_view()
+            return view(request)
+
+    async def _open(self, route):
+        return await asyncio.wait_for(
+            asyncio.open_connection(route.host, int(route.port)),
+            self.connect_timeout_seconds)
+
+    async def _upstream_response(self, request, route, url):
+        headers = await self._request_headers(request)
+        headers['Host'] = '{}:{}'.format(route.host, route.port)
+        headers['Connection'] = 'close'
+        body = request.body
+        if body:
+            headers['Content-Length'] = str(len(body))
+        path = '/' + quote(url, safe='/;:@&=+$,%~!*\'()')
+        query = request.META.get('QUERY_STRING')
+        if query:
+            path += '?' + query
+
+        (reader, writer) = await self._open(route)
+        try:
+            writer.write(_request_head(request.method, path, headers) + body)
+            await writer.drain()
+            (status, reason, response_headers) = await self._read_head(reader)
+            content = await _read_body(
+                reader, request.method, status, response_headers,
+                self.read_timeout_seconds, self.max_body_bytes)
+        finally:
+            writer.close()
+
+        response = HttpResponse(content or b'', status=status)
+        response.reason_phrase = reason
+        upstream_host = 'http://{}:{}'.format(route.host, route.port)
+        for (key, value) in response_headers:
+            lower_key = key.lower()
+            if lower_key in _HOP_BY_HOP:
+                continue
+            if lower_key == 'content-length' and content is not None:
+                continue  # Set for the content as read.
+            if lower_key == 'set-cookie':
+                response.cookies.load(SimpleCookie(value))
+                continue
+            if lower_key == 'location':
+                value = value.replace(
+                    upstream_host,
+                    '{}://{}'.format(request.scheme, request.get_host()))
+            response[key] = value
+        return response
+
+    async def _read_head(self, reader):
+        head = await asyncio.wait_for(
+            reader.readuntil(b'\r\n\r\n'), self.read_timeout_seconds)
+        return _parse_head(head)
+
+    async def _request_headers(self, request):
+        headers = {}
+        for (key, value) in request.META.items():
+            if key.startswith('HTTP_'):
+                name = key[5:].replace('_', '-').title()
+            elif key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                name = key.replace('_', '-').title()
+            else:
+                continue
+            if value and name.lower() not in _HOP_BY_HOP:
+                headers[name] = value
+        headers.pop('Content-Length', None)
+        if hasattr(request, 'user'):
+            # Checking the user may hit the session store.
+            username = await sync_to_async(_remote_user)(request)
+            if username:
+                headers['REMOTE_USER'] = username
+        return headers
+
+    async def _websocket(self, scope, receive, send, container_name, path):
+        message = await receive()
+        if message['type'] != 'websocket.connect':  # pragma: no cover
+            return
+        try:
+            route = await self._route(container_name)
+            (reader, writer) = await self._open(route)
+            subprotocol = await self._websocket_handshake(
+                reader, writer, route, scope, path)
+        except _TRANSIENT_ERRORS as e:
+            logger.info(
+                'WebSocket not available. '
+                'Container: %s, Exception: %s', container_name, e)
+            await send({'type': 'websocket.close', 'code': 1013})
+            return
+        await send({'type': 'websocket.accept', 'subprotocol': subprotocol})
+        await sync_to_async(self.historian.record, thread_sensitive=False)(
+            route.id, path)
+
+        client_to_upstream = asyncio.ensure_future(
+            _pump_client_to_upstream(receive, writer))
+        upstream_to_client = asyncio.ensure_future(
+            _pump_upstream_to_client(reader, writer, send))
+        (done, pending) = await asyncio.wait(
+            [client_to_upstream, upstream_to_client],
+            return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        writer.close()
+        for task in done:
+            if task.exception() is not None:
+                logger.warn(
+                    'WebSocket closed by error. '
+                    'Container: %s, Exception: %r',
+                    container_name, task.exception())
+        if upstream_to_client in done and upstream_to_client.exception():
+            # The client was not told the tunnel closed.
+            await send({'type': 'websocket.close', 'code': 1011})
+
+    async def _websocket_handshake(self, reader, writer, route, scope, path):
+        key = base64.b64encode(os.urandom(16))
+        headers = {
+            'Host': '{}:{}'.format(route.host, route.port),
+            'Upgrade': 'websocket',
+            'Connection': 'Upgrade',
+            'Sec-WebSocket-Key': key.decode('ascii'),
+            'Sec-WebSocket-Version': '13'
+        }
+        for (name, value) in scope.get('headers', []):
+            name = name.decode('latin-1').title()
+            if name in ('Origin', 'Cookie', 'User-Agent',
+                        'Sec-Websocket-Protocol'):
+                headers[name] = value.decode('latin-1')
+        target = '/' + quote(path, safe='/;:@&=+$,%~!*\'()')
+        if scope.get('query_string'):
+            target += '?' + scope['query_string'].decode('latin-1')
+        writer.write(_request_head('GET', target, headers))
+        await writer.drain()
+
+        (status, reason, response_headers) = await self._read_head(reader)
+        response_headers = {k.lower(): v for (k, v) in response_headers}
+        if status != 101:
+            raise UpstreamError('Upgrade refused: {} {}'.format(status, reason))
+        expected = base64.b64encode(hashlib.sha1(key + _WEBSOCKET_GUID).digest())
+        if response_headers.get('sec-websocket-accept') \
+                != expected.decode('ascii'):
+            raise UpstreamError('Bad Sec-WebSocket-Accept')
+        return response_headers.get('sec-websocket-protocol')
+
+
+def _remote_user(request):
+    user = request.user
+    if user.is_active:
+        return user.get_username()
+
+
+def _request_head(method, target, headers):
+    lines = ['{} {} HTTP/1.1'.format(method, target)] + [
+        '{}: {}'.format(key, value) for (key, value) in headers.items()]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+def _parse_head(head):
+    lines = head.decode('latin-1').split('\r\n')
+    status_line = lines[0].split(' ', 2)
+    if len(status_line) < 2 or not status_line[0].startswith('HTTP/'):
+        raise UpstreamError('Bad status line: {}'.format(lines[0]))
+    reason = status_line[2] if len(status_line) > 2 else ''
+    headers = []
+    for line in lines[1:]:
+        if line:
+            (key, _, value) = line.partition(':')
+            headers.append((key.strip(), value.strip()))
+    return (int(status_line[1]), reason, headers)
+
+
+async def _read_body(reader, method, status, headers, timeout, max_bytes):
+    """
+    :return: The response body, or None if the response can not have one:
+    Responses to HEAD, and 1xx, 204 and 304 responses, whatever their
+    headers say.
+    :raises BodyTooLarge: If the body is more than max_bytes.
+    """
+    if method == 'HEAD' or status < 200 or status in (204, 304):
+        return None
+    headers = {k.lower(): v for (k, v) in headers}
+    chunks = _Chunks(max_bytes)
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        while True:
+            size_line = await asyncio.wait_for(
+                reader.readuntil(b'\r\n'), timeout)
+            size = int(size_line.split(b';')[0].strip(), 16)
+            if size == 0:
+                break
+            chunks.check(chunks.size + size)
+            chunks.append(await asyncio.wait_for(
+                reader.readexactly(size), timeout))
+            await reader.readexactly(2)  # CRLF after each chunk
+    elif 'content-length' in headers:
+        remaining = int(headers['content-length'])
+        chunks.check(remaining)
+        while remaining > 0:
+            chunk = await asyncio.wait_for(
+                reader.read(min(remaining, _CHUNK_SIZE)), timeout)
+            if not chunk:
+                raise asyncio.IncompleteReadError(b'', remaining)
+            remaining -= len(chunk)
+            chunks.append(chunk)
+    else:
+        while True:
+            chunk = await asyncio.wait_for(reader.read(_CHUNK_SIZE), timeout)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b''.join(chunks)
+
+
+class _Chunks(list):
+
+    def __init__(self, max_bytes):
+        super(_Chunks, self).__init__()
+        self.max_bytes = max_bytes
+        self.size = 0
+
+    def check(self, size):
+        if self.max_bytes is not None and size > self.max_bytes:
+            raise BodyTooLarge(
+                'More than {} bytes'.format(self.max_bytes))
+
+    def append(self, chunk):
+        self.size += len(chunk)
+        self.check(self.size)
+        super(_Chunks, self).append(chunk)
+
+
+def encode_frame(opcode, payload, mask=True):
+    """
+    Encodes a single, final WebSocket frame. Frames sent by a client to a
+    server must be masked.
+    """
+    head = bytearray([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    length = len(payload)
+    if length < 126:
+        head.append(mask_bit | length)
+    elif length < 2 ** 16:
+        head.append(mask_bit | 126)
+        head.extend(struct.pack('!H', length))
+    else:
+        head.append(mask_bit | 127)
+        head.extend(struct.pack('!Q', length))
+    if not mask:
+        return bytes(head) + payload
+    mask_key = os.urandom(4)
+    return bytes(head) + mask_key + _apply_mask(payload, mask_key)
+
+
+async def read_frame(reader):
+    """
+    :return: (fin, opcode, payload) for the next WebSocket frame.
+    """
+    (first, second) = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        (length,) = struct.unpack('!H', await reader.readexactly(2))
+    elif length == 127:
+        (length,) = struct.unpack('!Q', await reader.readexactly(8))
+    mask_key = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask_key:
+        payload = _apply_mask(payload, mask_key)
+    return (bool(first & 0x80), first & 0x0F, payload)
+
+
+def _apply_mask(payload, mask_key):
+    # One XOR of the whole payload, against the key repeated to its length.
+    length = len(payload)
+    if not length:
+        return payload
+    key = (mask_key * (length // 4 + 1))[:length]
+    masked = int.from_bytes(payload, 'big') ^ int.from_bytes(key, 'big')
+    return masked.to_bytes(length, 'big')
+
+
+async def _pump_client_to_upstream(receive, writer):
+    while True:
+        message = await receive()
+        if message['type'] == 'websocket.disconnect':
+            code = message.get('code', 1000)
+            writer.write(encode_frame(_OP_CLOSE, struct.pack('!H', code)))
+            await writer.drain()
+            return
+        if message.get('bytes') is not None:
+            writer.write(encode_frame(_OP_BINARY, message['bytes']))
+        else:
+            writer.write(encode_frame(
+                _OP_TEXT, message.get('text', '').encode('utf-8')))
+        await writer.drain()
+
+
+async def _pump_upstream_to_client(reader, writer, send):
+    fragments = []
+    fragments_opcode = None
+    while True:
+        try:
+            (fin, opcode, payload) = await read_frame(reader)
+        except asyncio.IncompleteReadError:
+            await send({'type': 'websocket.close', 'code': 1006})
+            return
+        if opcode == _OP_PING:
+            writer.write(encode_frame(_OP_PONG, payload))
+            await writer.drain()
+            continue
+        if opcode == _OP_PONG:
+            continue
+        if opcode == _OP_CLOSE:
+            code = struct.unpack('!H', payload[:2])[0] \
+                if len(payload) >= 2 else 1000
+            await send({'type': 'websocket.close', 'code': code})
+            return
+        if opcode != _OP_CONTINUATION:
+            fragments_opcode = opcode
+        fragments.append(payload)
+        if not fin:
+            continue
+        message = b''.join(fragments)
+        fragments = []
+        if fragments_opcode == _OP_TEXT:
+            await send({'type': 'websocket.send',
+                        'text': message.decode('utf-8')})
+        else:
+            await send({'type': 'websocket.send', 'bytes': message})
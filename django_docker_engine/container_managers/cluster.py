@@ -0,0 +1,264 @@
+import threading
+import uuid
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+from time import time
+
+import docker
+
+from django_docker_engine.tracing import propagate
+
+from .base import BaseManager
+from .docker_engine import DockerEngineManager, DockerEngineManagerError
+
+_MEM_RESERVATION_MB = '.mem_reservation_mb'
+
+DeferredVolume = namedtuple('DeferredVolume', ['name'])
+
+
+class NoEngineFits(DockerEngineManagerError):
+    pass
+
+
+class ClusterManager(BaseManager):
+    """
+    Manages containers across several Docker Engines, as if they were one.
+    New containers are placed by best-fit bin-packing of their
+    mem_reservation_mb label: The engine with the least room which still
+    fits the container is chosen, so large gaps are kept for large
+    containers. Lookups are routed to the engine which has the container.
+
+    The memory in use on each engine is kept in memory: It is refreshed
+    whenever every container is listed, and otherwise only when nothing
+    seems to fit, since containers may have been removed. Placements are
+    made one at a time, and counted until their container is listed, so
+    concurrent launches do not both claim the same room.
+    """
+
+    def __init__(self, root_label, clients, mem_limits_mb=None):
+        """
+        :param string root_label:
+        :param clients: List of docker.DockerClient, one for each engine.
+        :param mem_limits_mb: Optional list, parallel to clients, of the
+        memory available on each engine. If none has room for a container,
+        NoEngineFits is raised, rather than overcommitting one: The run
+        wrapper evicts against the sum of the limits, so this can happen
+        below its limit, when the free memory is split across engines.
+        """
+        self._root_label = root_label
+        self._managers = [
+            DockerEngineManager(root_label, client=client)
+            for client in clients
+        ]
+        self._mem_limits_mb = mem_limits_mb or \
+            [float('inf')] * len(self._managers)
+        assert len(self._mem_limits_mb) == len(self._managers)
+        self._placement = {}  # Container name or id -> manager
+        self._deferred_labels = {}  # Volume name -> labels
+        self._usage = None  # Container name -> (engine, MB, placed_at)
+        self._pending = {}  # Launch -> (engine, MB), while launching
+        self._lock = threading.Lock()
+        self._placing = threading.Lock()
+
+    def _each(self, f):
+        """
+        Applies f to each manager concurrently, and returns the results in
+        order of the managers.
+        """
+        if len(self._managers) == 1:
+            return [f(self._managers[0])]
+        pool = ThreadPool(len(self._managers))
+        try:
+            return pool.map(propagate(f), self._managers)
+        finally:
+            pool.close()
+
+    def _mem_reservation_mb(self, container):
+        mem_string = container.labels.get(self._root_label + _MEM_RESERVATION_MB)
+        try:
+            return float(mem_string)
+        except (TypeError, ValueError):
+            return 0
+
+    def _place(self, launch, mem_reservation_mb):
+        """
+        Chooses the engine, and counts the reservation against it until
+        _placed is called for the launch.
+        """
+        with self._placing:
+            if self._usage is None:
+                self.list()
+            engine = self._best_fit(mem_reservation_mb)
+            if engine is None:
+                self.list()  # Perhaps some have been removed.
+                engine = self._best_fit(mem_reservation_mb)
+            if engine is None:
+                raise NoEngineFits('No engine has {}MB free: {}'.format(
+                    mem_reservation_mb, self._free()))
+            with self._lock:
+                self._pending[launch] = (engine, mem_reservation_mb)
+        return engine
+
+    def _placed(self, launch, container):
+        with self._lock:
+            (engine, mem_reservation_mb) = self._pending.pop(launch)
+            if container is not None:
+                self._usage[container.name] = (
+                    engine, mem_reservation_mb, time())
+
+    def _free(self):
+        used = [0] * len(self._managers)
+        with self._lock:
+            usage = dict(self._usage or {})
+            usage.update(self._pending)
+        for reservation in usage.values():
+            used[reservation[0]] += reservation[1]
+        return [limit - in_use
+                for (limit, in_use) in zip(self._mem_limits_mb, used)]
+
+    def _best_fit(self, mem_reservation_mb):
+        free = self._free()
+        fits = [i for i in range(len(free)) if free[i] >= mem_reservation_mb]
+        if not fits:
+            return None
+        return min(fits, key=lambda i: free[i])
+
+    def _locate(self, container_name_or_id):
+        with self._lock:
+            manager = self._placement.get(container_name_or_id)
+        if manager is not None:
+            try:
+                return (manager, manager.get_container(container_name_or_id))
+            except docker.errors.NotFound:
+                with self._lock:
+                    self._placement.pop(container_name_or_id, None)
+
+        def find(manager):
+            try:
+                return manager.get_container(container_name_or_id)
+            except docker.errors.NotFound:
+                return None
+        for (manager, container) in zip(self._managers, self._each(find)):
+            if container is not None:
+                self._remember(manager, container)
+                return (manager, container)
+        raise docker.errors.NotFound(
+            'No such container: {}'.format(container_name_or_id))
+
+    def _remember(self, manager, container):
+        with self._lock:
+            self._placement[container.name] = manager
+            self._placement[container.id] = manager
+
+    def run(self, image_name, **kwargs):
+        labels = kwargs.get('labels') or {}
+        try:
+            mem_reservation_mb = float(
+                labels.get(self._root_label + _MEM_RESERVATION_MB))
+        except (TypeError, ValueError):
+            mem_reservation_mb = 0
+        launch = uuid.uuid4().hex
+        engine = self._place(launch, mem_reservation_mb)
+        manager = self._managers[engine]
+        container = None
+        try:
+            for volume_name in kwargs.get('volumes') or {}:
+                with self._lock:
+                    labels = self._deferred_labels.pop(volume_name, None)
+                if labels is not None:
+                    manager.create_volume(name=volume_name, labels=labels)
+            container = manager.run(image_name, **kwargs)
+        finally:
+            self._placed(launch, container)
+        self._remember(manager, container)
+        return container
+
+    def pull(self, image_name, version="latest", progress=None):
+        """
+        Pulls onto every engine, and returns the Image from the first.
+        """
+        return self._each(lambda manager: manager.pull(
+            image_name, version=version, progress=progress))[0]
+
+    def create_volume(self, name=None, labels=None):
+        """
+        The engine is not chosen until the container runs, so this only
+        picks a name: The volume is created, with the labels, on the engine
+        chosen for the first container to mount it.
+        """
+        volume = DeferredVolume(
+            name=name or 'django-docker-{}'.format(uuid.uuid4().hex))
+        with self._lock:
+            self._deferred_labels[volume.name] = labels or {}
+        return volume
+
+    def remove_volume(self, volume_name):
+        with self._lock:
+            self._deferred_labels.pop(volume_name, None)
+
+        def remove(manager):
+            try:
+                manager.remove_volume(volume_name)
+            except docker.errors.NotFound:
+                pass
+        self._each(remove)
+
+    def list_volumes(self, filters={}):
+        return [volume for volumes in
+                self._each(lambda manager: manager.list_volumes(filters))
+                for volume in volumes]
+
+    def get_id(self, container_name):
+        return self._locate(container_name)[1].id
+
+    def get_container(self, container_name_or_id):
+        return self._locate(container_name_or_id)[1]
+
+    def get_url(self, container_name):
+        return self.get_route(container_name).url
+
+    def get_route(self, container_name):
+        (manager, container) = self._locate(container_name)
+        return manager.route(container)
+
+    def list(self, filters={}):
+        started = time()
+        lists = self._each(lambda manager: manager.list(filters))
+        containers = []
+        placement = {}
+        usage = {}
+        for (engine, engine_containers) in enumerate(lists):
+            manager = self._managers[engine]
+            for container in engine_containers:
+                placement[container.name] = manager
+                placement[container.id] = manager
+                usage[container.name] = (
+                    engine, self._mem_reservation_mb(container), None)
+            containers.extend(engine_containers)
+        with self._lock:
+            if set(filters) <= {'label'} and \
+                    filters.get('label', self._root_label) == self._root_label:
+                # Every container of ours: Forget those which are gone,
+                # but not those launched since the list began.
+                self._placement = placement
+                for (name, reservation) in (self._usage or {}).items():
+                    placed_at = reservation[2]
+                    if placed_at is not None and placed_at >= started:
+                        usage.setdefault(name, reservation)
+                self._usage = usage
+            else:
+                self._placement.update(placement)
+        return containers
+
+    def logs(self, container_name, **kwargs):
+        (manager, _) = self._locate(container_name)
+        return manager.logs(container_name, **kwargs)
+
+    def rename(self, container_name, new_name):
+        (manager, _) = self._locate(container_name)
+        manager.rename(container_name, new_name)
+        with self._lock:
+            self._placement.pop(container_name, None)
+            self._placement[new_name] = manager
+            if self._usage is not None and container_name in self._usage:
+                self._usage[new_name] = self._usage.pop(container_name)
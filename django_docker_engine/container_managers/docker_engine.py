@@ -1,4 +1,5 @@
 import re
+from collections import namedtuple
 
 import docker
 from requests.exceptions import ReadTimeout
@@ -35,6 +36,18 @@ class DockerContainerClientTimeout(DockerEngineManagerError):
     pass
 
 
+class ContainerRoute(namedtuple('ContainerRoute',
+                                ['id', 'host', 'port', 'image'])):
+    __slots__ = ()
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(self.host, self.port)
+
+
+ContainerRoute.__new__.__defaults__ = (None,)  # image is optional.
+
+
 class DockerEngineManager(BaseManager):
     """
     Manages interactions with a Docker Engine, running locally, or on a remote
@@ -45,6 +58,7 @@ class DockerEngineManager(BaseManager):
             self,
             root_label,
             client=docker.from_env(),
+            registry=None
     ):
         """
         :param string root_label:
@@ -52,12 +66,16 @@ class DockerEngineManager(BaseManager):
         The DOCKER_HOST environment variable specifies where the Docker Engine
         is. To override this, create a DockerClient with the correct base_url
         and provide it here.
+        :param registry: Optional ContainerRegistry: When it is synced,
+        lookups and lists of labelled containers are answered from memory.
         """
         self._base_url = client.api.base_url
+        self._api_client = client.api
         self._containers_client = client.containers
         self._images_client = client.images
         self._volumes_client = client.volumes
         self._root_label = root_label
+        self._registry = registry
 
     def _get_base_url_remote_host(self):
         remote_host_match = re.match(r'^http://([^:]+):\d+$', self._base_url)
@@ -81,57 +99,95 @@ class DockerEngineManager(BaseManager):
         except docker.errors.ImageNotFound as e:  # pragma: no cover
             raise PossiblyOutOfDiskSpace(e)
 
-    def pull(self, image_name, version="latest"):
+    def pull(self, image_name, version="latest", progress=None):
         """
         :param image_name:
         :param version:
-        :return:
+        :param progress: Optional function, called with each decoded
+        progress event from the daemon as the pull proceeds.
+        :return: The pulled Image
         """
         full_name = "{}:{}".format(image_name, version)
         try:
-            return self._images_client.pull(full_name)
+            if progress is None:
+                return self._images_client.pull(full_name)
+            for event in self._api_client.pull(
+                    image_name, tag=version, stream=True, decode=True):
+                if 'error' in event:
+                    raise docker.errors.APIError(event['error'])
+                progress(event)
+            return self._images_client.get(full_name)
         except docker.errors.ImageNotFound as e:
             raise PossiblyOutOfDiskSpace(e)
 
-    def create_volume(self):
-        return self._volumes_client.create(driver='local')
+    def create_volume(self, name=None, labels=None):
+        return self._volumes_client.create(
+            name=name, driver='local', labels=labels)
+
+    def remove_volume(self, volume_name):
+        self._api_client.remove_volume(volume_name)
+
+    def list_volumes(self, filters={}):
+        return self._volumes_client.list(filters=filters)
+
+    def _get_container(self, container_name_or_id):
+        if self._registry is not None and self._registry.synced:
+            entry = self._registry.get(container_name_or_id)
+            if entry is not None:
+                return entry.container
+        return self._containers_client.get(container_name_or_id)
 
     def get_id(self, container_name):
         """
         :param container_name:
         :return: container id
         """
-        return self._containers_client.get(container_name).id
+        return self._get_container(container_name).id
 
     def get_container(self, container_name_or_id):
         """
         :param container_name:
         :return: container id
         """
-        return self._containers_client.get(container_name_or_id)
+        return self._get_container(container_name_or_id)
 
     def get_url(self, container_name):
         """
         :param container_name:
         :return: container url
         """
-        remote_host = self._get_base_url_remote_host()
-        if remote_host:
-            host = remote_host  # pragma: no cover
-        elif self._is_base_url_local():
-            host = 'localhost'
-        else:  # pragma: no cover
-            raise RuntimeError('Unexpected base_url: %s', self._base_url)
+        return self.get_route(container_name).url
 
+    def get_route(self, container_name):
+        """
+        :param container_name:
+        :return: ContainerRoute with the id, host, and port of the container,
+        all from a single inspect.
+        """
         try:
-            container = self._containers_client.get(container_name)
+            container = self._get_container(container_name)
         except ReadTimeout as e:
             raise DockerContainerClientTimeout(
                 "Timed out while trying to get container: {} {}".format(
                     container_name, e
                 )
             )
+        return self.route(container)
 
+    def route(self, container):
+        """
+        :param container: An SDK Container, as already inspected.
+        :return: ContainerRoute for it, without inspecting it again.
+        """
+        remote_host = self._get_base_url_remote_host()
+        if remote_host:
+            host = remote_host  # pragma: no cover
+        elif self._is_base_url_local():
+            host = 'localhost'
+        else:  # pragma: no cover
+            raise RuntimeError('Unexpected base_url: %s', self._base_url)
+
+        container_name = container.name
         port_key = self._root_label + '.port'
         try:
             container_port = container.attrs['Config']['Labels'][port_key]
@@ -170,23 +226,42 @@ class DockerEngineManager(BaseManager):
         # TODO: Can we produce this condition in a test?
         assert len(http_port_info) == 1
         port_number = http_port_info[0]['HostPort']
-        return 'http://{}:{}'.format(host, port_number)
+        return ContainerRoute(id=container.id, host=host, port=port_number,
+                              image=container.attrs['Config'].get('Image'))
 
     def list(self, filters={}):
         """
         :param dict filters: Filters as described for the SDK:
         https://docker-py.readthedocs.io/en/stable/containers.html#docker.models.containers.ContainerCollection.list
-        :return: List of Docker SDK Containers
+        :return: List of Docker SDK Containers. Unless a label is given,
+        only those with the root label, whether or not the registry is used.
         """  # noqa
+        if 'label' not in filters:
+            filters = dict(filters, label=self._root_label)
+        if self._registry is not None and self._registry.synced:
+            # Only containers with the root label are tracked.
+            containers = self._registry.list(filters)
+            if containers is not None:
+                return containers
         return self._containers_client.list(all=True, filters=filters)
 
-    def logs(self, container_name):
+    def logs(self, container_name, **kwargs):
         """
         :param container_name:
-        :return: STDOUT and STDERR from the Docker container
+        :param kwargs: Passed to the SDK: stream, follow, tail, since, until
+        :return: STDOUT and STDERR from the Docker container, or if
+        stream=True, a generator of chunks
         """
         container = self._containers_client.get(container_name)
-        return container.logs(timestamps=True)
+        return container.logs(timestamps=True, **kwargs)
+
+    def rename(self, container_name, new_name):
+        """
+        Renames by name, rather than id, so that if two callers race to
+        rename the same container, only one can succeed: The other gets
+        docker.errors.NotFound.
+        """
+        self._api_client.rename(container_name, new_name)
 
 
 # TODO: At some point we need to be more abstract,
@@ -0,0 +1,168 @@
+import itertools
+import re
+import threading
+import time
+
+import docker
+from docker.models.containers import Container
+from docker.models.volumes import Volume
+
+from .base import BaseManager
+from .docker_engine import ContainerRoute
+
+
+class _RealClock():
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class _SimulatedContainer(Container):
+
+    def __init__(self, attrs, manager):
+        super(_SimulatedContainer, self).__init__(attrs=attrs)
+        self._manager = manager
+
+    def remove(self, **kwargs):
+        self._manager._remove(self)
+
+    def logs(self, **kwargs):
+        return b''
+
+    def reload(self):
+        pass
+
+
+class SimulatedManager(BaseManager):
+    """
+    Keeps containers in memory, and nothing runs: Only the bookkeeping of a
+    Docker Engine is imitated, with configurable latencies, so that the
+    wrappers can be exercised at scale without Docker. The containers are
+    SDK Container objects, with just the attrs the wrappers read.
+    """
+
+    def __init__(self, root_label, clock=None,
+                 run_seconds=0, inspect_seconds=0, remove_seconds=0,
+                 list_seconds=0):
+        """
+        :param clock: Object with time() and sleep(seconds); a VirtualClock
+        from django_docker_engine.simulator makes the latencies free to
+        simulate. Defaults to real time.
+        :param run_seconds: Latency of creating and starting a container.
+        :param inspect_seconds: Latency of each lookup.
+        :param remove_seconds: Latency of each removal.
+        :param list_seconds: Latency of each list.
+        """
+        self._root_label = root_label
+        self.clock = clock or _RealClock()
+        self.run_seconds = run_seconds
+        self.inspect_seconds = inspect_seconds
+        self.remove_seconds = remove_seconds
+        self.list_seconds = list_seconds
+        self._containers = {}
+        self._ids = itertools.count(1)
+        self._ports = itertools.count(32768)
+        self._lock = threading.Lock()
+        self.removed = []
+
+    def run(self, image_name, name=None, ports={}, labels={}, **kwargs):
+        self.clock.sleep(self.run_seconds)
+        with self._lock:
+            container_id = 'simulated-{}'.format(next(self._ids))
+            name = name or container_id
+            if any(c.name == name for c in self._containers.values()):
+                raise docker.errors.APIError(
+                    'Conflict: name {} is in use'.format(name))
+            container = _SimulatedContainer({
+                'Id': container_id,
+                'Name': '/' + name,
+                'Config': {'Image': image_name, 'Labels': dict(labels)},
+                'State': {'Status': 'running', 'StartedAt': time.strftime(
+                    '%Y-%m-%dT%H:%M:%S.000000000Z',
+                    time.gmtime(self.clock.time()))},
+                'NetworkSettings': {'Ports': {
+                    port: [{'HostIp': '0.0.0.0',
+                            'HostPort': str(next(self._ports))}]
+                    for port in ports}},
+                'Mounts': []
+            }, self)
+            self._containers[container_id] = container
+        return container
+
+    def pull(self, image_name, version="latest", progress=None):
+        return None
+
+    def create_volume(self, name=None, labels=None):
+        return Volume(attrs={
+            'Name': name or 'simulated-volume-{}'.format(next(self._ids)),
+            'Labels': labels or {}})
+
+    def remove_volume(self, volume_name):
+        pass
+
+    def list_volumes(self, filters={}):
+        return []
+
+    def _get(self, container_name_or_id):
+        self.clock.sleep(self.inspect_seconds)
+        with self._lock:
+            for container in self._containers.values():
+                if container_name_or_id in [container.id, container.name]:
+                    return container
+        raise docker.errors.NotFound(
+            'No such container: {}'.format(container_name_or_id))
+
+    def _remove(self, container):
+        self.clock.sleep(self.remove_seconds)
+        with self._lock:
+            self._containers.pop(container.id, None)
+            self.removed.append(container)
+
+    def is_running(self, container_id):
+        """
+        For the simulator's own bookkeeping: Takes no simulated time.
+        """
+        return container_id in self._containers
+
+    def get_id(self, container_name):
+        return self._get(container_name).id
+
+    def get_container(self, container_name_or_id):
+        return self._get(container_name_or_id)
+
+    def get_url(self, container_name):
+        return self.get_route(container_name).url
+
+    def get_route(self, container_name):
+        container = self._get(container_name)
+        port = container.labels[self._root_label + '.port']
+        port_info = container.attrs['NetworkSettings']['Ports'][
+            '{}/tcp'.format(port)]
+        return ContainerRoute(
+            id=container.id, host='localhost', port=port_info[0]['HostPort'],
+            image=container.attrs['Config']['Image'])
+
+    def list(self, filters={}):
+        self.clock.sleep(self.list_seconds)
+        with self._lock:
+            containers = list(self._containers.values())
+        label = filters.get('label')
+        if label:
+            (key, _, value) = label.partition('=')
+            containers = [c for c in containers if key in c.labels
+                          and (not value or c.labels[key] == value)]
+        name = filters.get('name')
+        if name:
+            containers = [c for c in containers
+                          if re.search(name, '/' + c.name)]
+        return containers
+
+    def logs(self, container_name, **kwargs):
+        return self._get(container_name).logs(**kwargs)
+
+    def rename(self, container_name, new_name):
+        container = self._get(container_name)
+        container.attrs['Name'] = '/' + new_name
@@ -1,7 +1,12 @@
+import hashlib
 import json
 import logging
 import os
+import tempfile
+import threading
+import uuid
 from datetime import datetime
+from multiprocessing.pool import ThreadPool
 from shutil import rmtree
 from time import time
 
@@ -9,11 +14,42 @@ import docker.errors
 
 from django_docker_engine.container_managers import docker_engine
 from django_docker_engine.historian import FileHistorian
+from django_docker_engine.input_store import in_store
+from django_docker_engine.metrics import InstrumentedManager, lookup_counters
+from django_docker_engine.prepull import ImagePrePuller, full_image_name
+from django_docker_engine.prober import DEFAULT_PROBER, READY, ReadinessProber
+from django_docker_engine.reaper import DEFAULT_REAPER
+from django_docker_engine.route_cache import DEFAULT_ROUTE_CACHE
+from django_docker_engine.stats_sampler import MemorySampler
+from django_docker_engine.tracing import propagate
+from django_docker_engine.volume_pool import VolumePool
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
 
 
+def _in_parallel(f, items, max_workers):
+    """
+    Applies f to each item with a bounded pool of threads, and returns
+    the results in order. An exception is logged and returned in place
+    of the result, rather than stopping the others.
+    """
+    def safe_f(item):
+        try:
+            return f(item)
+        except Exception as e:
+            logger.warn('Failed on {}: {}'.format(item, e))
+            return e
+    items = list(items)
+    if len(items) < 2:
+        return [safe_f(item) for item in items]
+    pool = ThreadPool(min(max_workers, len(items)))
+    try:
+        return pool.map(propagate(safe_f), items)
+    finally:
+        pool.close()
+
+
 class DockerContainerSpec():
 
     def __init__(self, image_name, container_name, mem_reservation_mb,
@@ -46,34 +82,83 @@ class DockerClientSpec():
 
     def __init__(self,
                  do_input_json_envvar=False,
-                 input_json_url=None):
-        assert do_input_json_envvar or input_json_url,\
+                 input_json_url=None,
+                 input_store=None):
+        assert do_input_json_envvar or input_json_url or input_store,\
             'Input must be provided to the container '\
-            'as an environment variable containing json '\
-            'or an environment variable containing a url pointing to json'
-        # Both can be specified: The container needs to be able
+            'as an environment variable containing json, '\
+            'or an environment variable containing a url pointing to json, '\
+            'or a file mounted from an InputStore'
+        # More than one can be specified: The container needs to be able
         # to read from at least one specified source. Limitations:
         # - do_input_json_envvar:
         #   Creates potentially problematic huge envvar
         # - input_json_url:
         #   World-readable URL could be an unwanted leak
+        # - input_store:
+        #   Docker Engine must be on the same host
         self.do_input_json_envvar = do_input_json_envvar
         self.input_json_url = input_json_url
+        self.input_store = input_store
 
 
+# For mem_policy:
+RESERVATION = 'reservation'
+OBSERVED = 'observed'
+MAX = 'max'
+
 _DEFAULT_MANAGER = docker_engine.DockerEngineManager
 _DEFAULT_LABEL = 'io.github.refinery-project.django_docker_engine'
 _MEM_RESERVATION_MB = '.mem_reservation_mb'
+_WARM = '.warm'
+_WARM_PREFIX = 'warm-'
+_VOLUME_POOL = '.volume_pool'
+_VOLUME = '.volume'
+INPUT_DIR_PREFIX = 'django-docker-input-'  # Warm pool input directories
+_INPUT_DIR = '/django_docker_engine_input'
+_INPUT_FILE = 'input.json'
 
 
 class DockerClientWrapper(object):
 
+    _ledger = None
+    _prepuller = None
+    _volume_pool = None
+    _input_store = None
+
     def __init__(self,
                  historian=None,
                  manager_class=_DEFAULT_MANAGER,
-                 root_label=_DEFAULT_LABEL):
+                 root_label=_DEFAULT_LABEL,
+                 registry=None,
+                 reaper=DEFAULT_REAPER,
+                 max_kill_workers=8,
+                 metrics=None):
+        """
+        :param metrics: Optional Metrics, to record the time spent in each
+        Docker call, and launches and evictions.
+        """
         self._historian = FileHistorian() if historian is None else historian
-        self._containers_manager = manager_class(root_label)
+        self.root_label = root_label
+        self._containers_manager = manager_class(
+            root_label, **self._manager_kwargs(registry))
+        if metrics is not None:
+            self._containers_manager = InstrumentedManager(
+                self._containers_manager, metrics)
+            if registry is not None:
+                metrics.add_collector(
+                    ('registry', id(registry)),
+                    lambda: lookup_counters('registry', registry), 'counter')
+        self._metrics = metrics
+        self._reaper = reaper
+        self._max_kill_workers = max_kill_workers
+
+    @staticmethod
+    def _manager_kwargs(registry):
+        manager_kwargs = {}
+        if registry is not None:
+            manager_kwargs['registry'] = registry
+        return manager_kwargs
 
     def is_live(self, container_name):
         try:
@@ -94,56 +179,166 @@ class DockerClientWrapper(object):
     def lookup_container_id(self, container_name):
         return self._containers_manager.get_id(container_name)
 
+    def lookup_container_route(self, container_name):
+        """
+        Given the name of a container, returns its id, host, and port,
+        with a single call to the manager.
+        """
+        return self._containers_manager.get_route(container_name)
+
     def list(self, filters={}):
         return self._containers_manager.list(filters)
 
-    def logs(self, container_name):
-        return self._containers_manager.logs(container_name)
+    def logs(self, container_name, **kwargs):
+        return self._containers_manager.logs(container_name, **kwargs)
+
+    @property
+    def historian(self):
+        return self._historian
+
+    @property
+    def input_store(self):
+        """
+        The InputStore of the DockerClientSpec, or None.
+        """
+        return self._input_store
+
+    def volume_label(self):
+        """
+        :return: Label key on the volumes made for extra_directories, when
+        they are not pooled.
+        """
+        return self.root_label + _VOLUME
+
+    def list_volumes(self, filters={}):
+        return self._containers_manager.list_volumes(filters)
+
+    def remove_volume(self, volume_name):
+        self._containers_manager.remove_volume(volume_name)
 
     def history(self, container_name):
         id = self.lookup_container_id(container_name)
-        return FileHistorian().list(id)
+        return self._historian.list(id)
+
+    def query_history(self, container_name, since=None, until=None,
+                      limit=None, cursor=None):
+        """
+        Like history, but for datetimes from since until until, at most
+        limit at a time: Returns a generator of HistoryRecords, and the
+        cursor of the last one continues from there.
+        """
+        id = self.lookup_container_id(container_name)
+        return self._historian.query(
+            id, since=since, until=until, limit=limit, cursor=cursor)
 
     @staticmethod
-    def kill(container):
+    def kill(container, reaper=None, volume_pool=None, historian=None,
+             ledger=None):
+        """
+        Removes the container, and then the directories it mounted:
+        If a MountReaper is given, they are handed off to it, and this
+        returns without waiting for the disk to be cleaned up.
+        If a VolumePool is given, its volumes are returned to it instead;
+        if not, pooled volumes are left alone, for a pool to reclaim.
+        If a historian is given, it stops keeping the container in memory.
+        If a MemoryLedger is given, the container's reservation is released.
+        remove_container() passes the wrapper's own.
+        """
         mounts = container.attrs['Mounts']
         container.remove(
             force=True,
             v=True  # Remove volumes associated with the container
         )
+        if ledger is not None:
+            ledger.release([container.name])
+        DEFAULT_ROUTE_CACHE.invalidate(
+            container_name=container.name, container_id=container.id)
+        DEFAULT_PROBER.forget(container.name)
+        discard = getattr(historian, 'discard', None)
+        if discard is not None:
+            discard([container.id])
         for mount in mounts:
             source = mount['Source']
+            if in_store(source):
+                continue  # Shared with other containers.
+            if VolumePool.owns(mount.get('Name')):
+                if volume_pool is not None:
+                    volume_pool.release(mount['Name'], source)
+                continue
             target = source if os.path.isdir(
                 source) else os.path.dirname(source)
-            rmtree(
-                target,
-                ignore_errors=True
-            )
+            if reaper is not None:
+                reaper.reap(target)
+            else:
+                rmtree(
+                    target,
+                    ignore_errors=True
+                )
+
+    def remove_container(self, container):
+        """
+        Like kill(), with this wrapper's reaper, volume pool, historian, and
+        ledger.
+        """
+        self.kill(container, reaper=self._reaper,
+                  volume_pool=self._volume_pool, historian=self._historian,
+                  ledger=self._ledger)
+
+    def _kill_all(self, containers):
+        """
+        Removes the containers concurrently, and returns once they are gone,
+        leaving their mounts to the reaper.
+        """
+        return _in_parallel(
+            self.remove_container, containers, self._max_kill_workers)
 
     def _kill_lru(self, need_to_free):
         '''
         Kill least-recently-used containers until need_to_free reserved memory
-        has been freed. Runs asynchronously: When this returns, the containers
-        are still running, but will shut down shortly.
+        has been freed. Victims are chosen from a single list, and removed in
+        parallel: When this returns the memory has been released, but their
+        mounts may still be in the process of being deleted.
         '''
-        container_ids = [container.id for container in self.list()]
-        lru_sorted = self._historian.sort_lru(container_ids)
+        self._evict(self._lru_victims(self.list(), need_to_free))
+
+    def _evict(self, victims):
+        self._kill_all(victims)
+        if self._metrics is not None:
+            self._metrics.inc('evictions_total', value=len(victims))
+            self._metrics.inc('evicted_mb_total', value=sum(
+                self._mem_mb(victim) for victim in victims))
+
+    def _lru_victims(self, containers, need_to_free):
+        # Idle warm containers have no history, and go first.
+        idle = [container for container in containers
+                if self._is_idle_warm(container)]
+        containers = {container.id: container for container in containers
+                      if not self._is_idle_warm(container)}
+        lru_sorted = [container.id for container in idle] + \
+            self._historian.sort_lru(set(containers))
+        containers.update({container.id: container for container in idle})
         memory_freed = 0
+        victims = []
         while memory_freed < need_to_free:
             if len(lru_sorted) == 0:
                 logger.warn('No more containers to kill, but we still do not '
                             'have the requested memory; Starting anyway!')
                 break
-            next_id = lru_sorted.pop(0)
-            next_container = self._containers_manager.get_container(next_id)
-            mem_reservation_mb = self._mem_reservation_mb(next_container)
+            next_container = containers[lru_sorted.pop(0)]
+            mem_reservation_mb = self._mem_mb(next_container)
             memory_freed += mem_reservation_mb
-            self.kill(next_container)
+            victims.append(next_container)
             logger.warn(
-                'Killed {} to free up {}MB: {}MB freed so far. '
+                'Killing {} to free up {}MB: {}MB freed so far. '
                 'Need to free {}.'.format(
                     next_container.name, mem_reservation_mb, memory_freed,
                     need_to_free))
+        return victims
+
+    @staticmethod
+    def _is_idle_warm(container):
+        return container.name.startswith(_WARM_PREFIX) and any(
+            key.endswith(_WARM) for key in container.labels)
 
     def _mem_reservation_mb(self, container):
         mem_string = container.labels.get(_DEFAULT_LABEL + _MEM_RESERVATION_MB)
@@ -156,19 +351,24 @@ class DockerClientWrapper(object):
             return 0
         return int(mem_string)
 
+    def _mem_mb(self, container):
+        """
+        The memory to account for the container when admitting and evicting.
+        """
+        return self._mem_reservation_mb(container)
+
     def _total_mem_reservation_mb(self):
         containers = self.list()
         return sum(
-            self._mem_reservation_mb(container) for container in containers
+            self._mem_mb(container) for container in containers
         )
 
     def _purge(self, label=None, seconds=None):
         # TODO: Remove. kill_lru should be used instead.
-        for container in self.list({'label': label} if label else {}):
-            # TODO: Confirm that the container belongs to me
-            if seconds and self._is_active(container, seconds):
-                continue
-            self.kill(container)
+        containers = self.list({'label': label or self.root_label})
+        if seconds:
+            containers = self._inactive(containers, seconds)
+        self._kill_all(containers)
 
     def purge_by_label(self, label):
         """
@@ -178,17 +378,36 @@ class DockerClientWrapper(object):
 
     def purge_inactive(self, seconds):
         """
-        Removes containers which do not have recent log entries.
+        Removes containers which were started, and last proxied a request,
+        more than this many seconds ago.
         """
         self._purge(seconds=seconds)
 
-    def _is_active(self, container, seconds):
+    def _inactive(self, containers, seconds):
+        last_accessed = getattr(self._historian, 'last_accessed', None)
+        if last_accessed is None:  # pragma: no cover
+            # A historian of our own would know: Fall back to the logs.
+            return [container for container in containers
+                    if not self._is_active(container, seconds)]
+        old = [container for container in containers
+               if not self._is_young(container, seconds)]
+        last = last_accessed(set(container.id for container in old))
+        cutoff = time() - seconds
+        # No history means it was not started by us: Leave it alone.
+        return [container for container in old
+                if last.get(container.id) is not None
+                and last[container.id] < cutoff]
+
+    def _is_young(self, container, seconds):
         utc_start_string = container.attrs['State']['StartedAt']
         utc_start = datetime.strptime(
             utc_start_string[:19], '%Y-%m-%dT%H:%M:%S')
         utc_now = datetime.utcnow()
         seconds_since_start = (utc_now - utc_start).total_seconds()
-        if seconds_since_start < seconds:
+        return seconds_since_start < seconds
+
+    def _is_active(self, container, seconds):
+        if self._is_young(container, seconds):
             return True
         else:  # pragma: no cover
             recent_log = container.logs(since=int(time() - seconds))
@@ -197,8 +416,23 @@ class DockerClientWrapper(object):
             # https://github.com/docker/docker-py/issues/1515
             return recent_log != ''
 
-    def pull(self, image_name, version="latest"):
-        self._containers_manager.pull(image_name, version=version)
+    def pull(self, image_name, version="latest", progress=None):
+        kwargs = {} if progress is None else {'progress': progress}
+        return self._containers_manager.pull(
+            image_name, version=version, **kwargs)
+
+    def prepull(self, image_names, max_workers=4, on_progress=None):
+        """
+        Starts pulling the images in the background, and returns the
+        ImagePrePuller, which can be asked how they are getting on.
+        Launches of these images will then wait on the pull in flight,
+        rather than starting their own.
+        """
+        if self._prepuller is None:
+            self._prepuller = ImagePrePuller(
+                self.pull, max_workers=max_workers, on_progress=on_progress)
+        self._prepuller.prepull(image_names)
+        return self._prepuller
 
 
 class DockerClientRunWrapper(DockerClientWrapper):
@@ -207,31 +441,224 @@ class DockerClientRunWrapper(DockerClientWrapper):
                  docker_client_spec,
                  manager_class=_DEFAULT_MANAGER,
                  root_label=_DEFAULT_LABEL,
-                 mem_limit_mb=float('inf')):
+                 mem_limit_mb=float('inf'),
+                 registry=None,
+                 historian=None,
+                 reaper=DEFAULT_REAPER,
+                 max_kill_workers=8,
+                 ledger=None,
+                 warm_pool_size=0,
+                 pull_timeout_seconds=600,
+                 prober=None,
+                 metrics=None,
+                 volume_pool_size=0,
+                 mem_policy=RESERVATION,
+                 memory_sampler=None):
+        """
+        :param ledger: Optional MemoryLedger: If provided, admission is
+        atomic across threads and processes sharing the ledger, and the
+        containers are only listed when we might be over the limit.
+        :param warm_pool_size: If greater than 0, keep this many idle
+        containers started for each distinct spec that has been run. A launch
+        claims one by renaming it, and then writes the input to a file
+        mounted from the host: The container finds it at INPUT_JSON_PATH, or
+        fetches INPUT_JSON_URL, but can not rely on INPUT_JSON.
+        :param pull_timeout_seconds: How long a launch will wait on an image
+        that is being prepulled, before going ahead without it.
+        :param prober: Optional ReadinessProber, which will watch each new
+        container until it answers. Pass DEFAULT_PROBER to share it with Proxy,
+        which will then tell clients to wait without trying the container.
+        :param volume_pool_size: If greater than 0, volumes for
+        extra_directories are recycled: Up to this many are kept, wiped,
+        for later launches. Pooled volumes orphaned by an earlier process
+        are reclaimed in the background.
+        :param mem_policy: What a running container counts for, against
+        mem_limit_mb: RESERVATION, its mem_reservation_mb label; OBSERVED,
+        the memory it was last seen using, or the label until it has been
+        sampled; MAX, the greater of the two.
+        :param memory_sampler: MemorySampler for OBSERVED or MAX: If not
+        given, one is started, sampling the containers of this wrapper, and
+        sharing its registry. Call stop() when done with the wrapper, to end
+        that sampler's thread; one passed in is left to its owner.
+        """
         super(DockerClientRunWrapper, self).__init__(
+            historian=historian,
             manager_class=manager_class,
-            root_label=root_label
+            root_label=root_label,
+            registry=registry,
+            reaper=reaper,
+            max_kill_workers=max_kill_workers,
+            metrics=metrics
         )
-        manager_kwargs = {}
-        self._containers_manager = manager_class(root_label, **manager_kwargs)
-        self.root_label = root_label
         self._do_input_json_envvar = docker_client_spec.do_input_json_envvar
         self._input_json_url = docker_client_spec.input_json_url
+        self._input_store = docker_client_spec.input_store
         self._mem_limit_mb = mem_limit_mb
+        self._ledger = ledger
+        self._warm_pool_size = warm_pool_size
+        self._pull_timeout_seconds = pull_timeout_seconds
+        self._prober = prober
+        self._warming = set()
+        self._warming_lock = threading.Lock()
+        assert mem_policy in [RESERVATION, OBSERVED, MAX], mem_policy
+        self._mem_policy = mem_policy
+        self._started_sampler = None
+        if mem_policy != RESERVATION and memory_sampler is None:
+            memory_sampler = MemorySampler(
+                self.list, registry=registry).start()
+            self._started_sampler = memory_sampler
+        self._memory_sampler = memory_sampler
+        if volume_pool_size:
+            manager = self._containers_manager
+            self._volume_pool = VolumePool(
+                manager.create_volume, manager.remove_volume,
+                manager.list_volumes, root_label + _VOLUME_POOL,
+                max_size=volume_pool_size)
+            self._volume_pool.reclaim()
+
+    def stop(self):
+        """
+        Stops the background sampling started by this wrapper, if any.
+        """
+        if self._started_sampler is not None:
+            self._started_sampler.stop()
+
+    def _mem_mb(self, container):
+        reserved = self._mem_reservation_mb(container)
+        if self._mem_policy == RESERVATION:
+            return reserved
+        observed = self._memory_sampler.observed_mb(container.id)
+        if observed is None:
+            return reserved
+        if self._mem_policy == OBSERVED:
+            return observed
+        return max(reserved, observed)
 
     def _make_volume_on_host(self):
-        return self._containers_manager.create_volume().name
+        if self._volume_pool is not None:
+            return self._volume_pool.acquire()
+        return self._containers_manager.create_volume(
+            labels={self.volume_label(): 'true'}).name
 
-    def run(self, container_spec):
+    def run(self, container_spec, wait_until_ready=False):
         """
         Run a given ContainerSpec. Returns the url for the container,
         in contrast to the underlying method, which returns the logs.
-        """
 
-        total_mem_reservation_mb = self._total_mem_reservation_mb()
+        :param wait_until_ready: If True, or a number of seconds, probe the
+        container and do not return until it answers, has failed, or the
+        time is up. Returns the url in any case: is_ready() will tell.
+        """
+        if self._metrics is None:
+            url = self._admit_and_run(container_spec)
+        else:
+            with self._metrics.timed('run_seconds'):
+                url = self._admit_and_run(container_spec)
+        prober = self._prober
+        if prober is None and wait_until_ready:
+            prober = ReadinessProber()
+            self._prober = prober
+        if prober is not None:
+            container_name = container_spec.container_name
+            prober.watch(
+                container_name, self.lookup_container_route(container_name))
+            if wait_until_ready:
+                timeout = None if wait_until_ready is True \
+                    else wait_until_ready
+                if not prober.wait(container_name, timeout=timeout):
+                    logger.warn('{} is not ready'.format(container_name))
+        return url
+
+    def run_many(self, container_specs, max_workers=8):
+        """
+        Runs a batch of ContainerSpecs, as one admission: The containers are
+        listed, and any evictions made, once for the whole batch. Each
+        distinct image is pulled once, and the containers are then started
+        concurrently. The warm pool is not used.
+
+        :param max_workers: How many containers to start at once.
+        :return: A list parallel to the specs, with the url of each
+        container, or the exception which stopped it from starting.
+        """
+        container_specs = list(container_specs)
+        reservations = {
+            spec.container_name: spec.mem_reservation_mb or 0
+            for spec in container_specs
+        }
+        total_mb = sum(reservations.values())
+        if self._ledger is None:
+            self._make_room(total_mb)
+        else:
+            self._ledger.admit_many(
+                reservations, self._mem_limit_mb,
+                lambda pending: self._make_room(total_mb, pending))
+        self.prepull(set(spec.image_name for spec in container_specs))
+        results = _in_parallel(self._run, container_specs, max_workers)
+        failed = [spec.container_name for (spec, result)
+                  in zip(container_specs, results)
+                  if isinstance(result, Exception)]
+        if failed and self._ledger is not None:
+            self._ledger.release(failed)
+        if self._prober is not None:
+            for (spec, result) in zip(container_specs, results):
+                if not isinstance(result, Exception):
+                    self._prober.watch(
+                        spec.container_name,
+                        self.lookup_container_route(spec.container_name))
+        return results
+
+    def is_ready(self, container_name):
+        """
+        :return: True if the prober has seen the container answer, False if
+        it is still starting or failed, None if it is not being probed.
+        """
+        state = None if self._prober is None \
+            else self._prober.state(container_name)
+        return None if state is None else state == READY
+
+    def _admit_and_run(self, container_spec):
+        if self._warm_pool_size:
+            url = self._claim_warm(container_spec)
+            self._refill_in_background(container_spec)
+            if url is not None:
+                return url
         new_mem_reservation_mb = container_spec.mem_reservation_mb or 0
         # If None (ie, unspecified), treat as 0.
+        if self._ledger is None:
+            self._make_room(new_mem_reservation_mb)
+            return self._run(container_spec)
+
+        self._ledger.admit(
+            container_spec.container_name,
+            new_mem_reservation_mb,
+            self._mem_limit_mb,
+            lambda pending: self._make_room(new_mem_reservation_mb, pending))
+        try:
+            return self._run(container_spec)
+        except Exception:
+            self._ledger.release([container_spec.container_name])
+            raise
 
+    def _make_room(self, new_mem_reservation_mb, pending=None):
+        """
+        Kills LRU containers if needed to fit the new reservation under the
+        limit. Returns {container_name: mem_reservation_mb} for the survivors.
+
+        :param pending: {container_name: mem_reservation_mb} admitted by the
+        ledger, perhaps for launches still in progress: Those which are not
+        listed yet are counted, and kept among the survivors.
+        """
+        containers = self.list()
+        reservations = {
+            container.name: self._mem_mb(container)
+            for container in containers
+        }
+        launching = {
+            name: mem_mb for (name, mem_mb) in (pending or {}).items()
+            if name not in reservations
+        }
+        reservations.update(launching)
+        total_mem_reservation_mb = sum(reservations.values())
         need_to_free = (
             new_mem_reservation_mb + total_mem_reservation_mb
             - self._mem_limit_mb)
@@ -243,13 +670,148 @@ class DockerClientRunWrapper(DockerClientWrapper):
                     self._mem_limit_mb,
                     need_to_free
                 ))
-            self._kill_lru(need_to_free)
+            victims = self._lru_victims(containers, need_to_free)
+            self._evict(victims)
+            for victim in victims:
+                del reservations[victim.name]
+        return reservations
 
-        image_name = container_spec.image_name
-        if (':' not in image_name):
-            image_name += ':latest'
-            # Without a tag the SDK pulls every version; not what I expected.
-            # https://github.com/docker/docker-py/issues/1510
+    def warm(self, container_spec):
+        """
+        Starts idle containers for this spec, until there are warm_pool_size
+        of them, or until no more fit under the memory limit: Running
+        containers are never killed to make room for warm ones.
+        Returns the number started.
+        """
+        profile = self._profile(container_spec)
+        started = 0
+        while len(self._idle_warm(profile)) < self._warm_pool_size:
+            mem_reservation_mb = container_spec.mem_reservation_mb or 0
+            warm_spec = DockerContainerSpec(
+                image_name=container_spec.image_name,
+                container_name='{}{}-{}'.format(
+                    _WARM_PREFIX, profile, uuid.uuid4().hex[:8]),
+                mem_reservation_mb=container_spec.mem_reservation_mb,
+                extra_directories=container_spec.extra_directories,
+                labels=dict(container_spec.labels,
+                            **{self.root_label + _WARM: profile}),
+                container_port=container_spec.container_port,
+                cpus=container_spec.cpus)
+            if self._ledger is None:
+                if self._total_mem_reservation_mb() + mem_reservation_mb \
+                        > self._mem_limit_mb:
+                    break
+            else:
+                if self._ledger.total_mb() + mem_reservation_mb \
+                        > self._mem_limit_mb:
+                    break
+                self._ledger.admit(
+                    warm_spec.container_name, mem_reservation_mb,
+                    self._mem_limit_mb,
+                    lambda pending: self._make_room(0, pending))
+            input_dir = tempfile.mkdtemp(prefix=INPUT_DIR_PREFIX)
+            try:
+                self._run(warm_spec, input_dir=input_dir)
+            except Exception:
+                rmtree(input_dir, ignore_errors=True)
+                if self._ledger is not None:
+                    self._ledger.release([warm_spec.container_name])
+                raise
+            started += 1
+        return started
+
+    def _refill_in_background(self, container_spec):
+        profile = self._profile(container_spec)
+        with self._warming_lock:
+            if profile in self._warming:
+                return
+            self._warming.add(profile)
+
+        def refill():
+            try:
+                self.warm(container_spec)
+            except Exception as e:
+                logger.warn('Failed to warm {}: {}'.format(profile, e))
+            finally:
+                with self._warming_lock:
+                    self._warming.discard(profile)
+        thread = threading.Thread(target=refill)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _claim_warm(self, container_spec):
+        """
+        Renames an idle warm container to the requested name, and hands it
+        the input. Returns its url, or None if there were none to claim.
+        """
+        for container in self._idle_warm(self._profile(container_spec)):
+            try:
+                self._containers_manager.rename(
+                    container.name, container_spec.container_name)
+            except docker.errors.NotFound:
+                continue  # Claimed by someone else first.
+            if self._ledger is not None:
+                self._ledger.rename(
+                    container.name, container_spec.container_name)
+            DEFAULT_ROUTE_CACHE.invalidate(
+                container_name=container_spec.container_name)
+            self._write_input(container, container_spec.input)
+            self._historian.create(container.id)
+            return self.lookup_container_url(container_spec.container_name)
+        return None
+
+    def _idle_warm(self, profile):
+        return self.list({
+            'label': '{}={}'.format(self.root_label + _WARM, profile),
+            'name': '^/{}{}-'.format(_WARM_PREFIX, profile)
+        })
+
+    @staticmethod
+    def _write_input(container, input):  # noqa: A002
+        (input_dir,) = [
+            mount['Source'] for mount in container.attrs['Mounts']
+            if mount['Destination'] == _INPUT_DIR
+        ]
+        # Written beside, and then renamed, so the file appears complete.
+        (fd, tmp_path) = tempfile.mkstemp(dir=input_dir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(input, f)
+        os.chmod(tmp_path, 0o644)
+        os.rename(tmp_path, os.path.join(input_dir, _INPUT_FILE))
+
+    def _profile(self, container_spec):
+        """
+        Labels and environment are fixed when a container is created, so
+        warm containers can only stand in for specs identical but for the
+        name and input.
+        """
+        image_name = full_image_name(container_spec.image_name)
+        labels = {key: value for (key, value) in container_spec.labels.items()
+                  if not key.startswith(self.root_label)}
+        return hashlib.sha1(json.dumps([
+            image_name,
+            container_spec.container_port,
+            container_spec.mem_reservation_mb,
+            container_spec.cpus,
+            sorted(container_spec.extra_directories),
+            sorted(labels.items())
+        ]).encode('utf-8')).hexdigest()[:12]
+
+    def _run(self, container_spec, input_dir=None):
+        """
+        :param input_dir: If given, a host directory mounted in the container,
+        and the input will be written there later, rather than being passed
+        in the environment now.
+        """
+        new_mem_reservation_mb = container_spec.mem_reservation_mb or 0
+        image_name = full_image_name(container_spec.image_name)
+        # Without a tag the SDK pulls every version; not what I expected.
+        # https://github.com/docker/docker-py/issues/1510
+        if self._prepuller is not None and \
+                self._prepuller.status(image_name) is not None:
+            # Share the pull in flight, rather than starting another.
+            self._prepuller.wait(image_name, timeout=self._pull_timeout_seconds)
 
         for directory in container_spec.extra_directories:
             if not os.path.isabs(directory):
@@ -269,8 +831,19 @@ class DockerClientRunWrapper(DockerClientWrapper):
         })
 
         environment = {}
-        if self._do_input_json_envvar:
-            environment['INPUT_JSON'] = json.dumps(container_spec.input)
+        if input_dir is not None:
+            volumes[input_dir] = {'mode': 'ro', 'bind': _INPUT_DIR}
+            environment['INPUT_JSON_PATH'] = '{}/{}'.format(
+                _INPUT_DIR, _INPUT_FILE)
+        else:
+            if self._input_store is not None:
+                input_path = self._input_store.put(container_spec.input)
+                volumes[input_path] = {
+                    'mode': 'ro', 'bind': container_spec.container_input_path}
+                environment['INPUT_JSON_PATH'] = \
+                    container_spec.container_input_path
+            if self._do_input_json_envvar:
+                environment['INPUT_JSON'] = json.dumps(container_spec.input)
         if self._input_json_url:  # pragma: no cover
             environment['INPUT_JSON_URL'] = self._input_json_url
 
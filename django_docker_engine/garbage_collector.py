@@ -0,0 +1,194 @@
+"""
+Finds what launches and kills left behind, and removes it in the
+background, so that cleanup stays off the request path.
+"""
+import logging
+import os
+import tempfile
+import threading
+from collections import namedtuple
+from shutil import rmtree
+from time import sleep, time
+
+import docker.errors
+
+from django_docker_engine.docker_utils import INPUT_DIR_PREFIX
+from django_docker_engine.volume_pool import created_at
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+GarbageReport = namedtuple('GarbageReport', [
+    'volumes',  # Labelled volumes no container uses
+    'directories',  # Input directories no container mounts
+    'inputs',  # InputStore files no container mounts
+    'histories',  # Historian records of containers which are gone
+    'bytes_reclaimed'
+])
+
+
+class GarbageCollector():
+    """
+    Periodically compares labelled volumes, input directories and files,
+    and historian records against the containers which exist, and removes
+    those which belong to none. Anything newer than grace_seconds is left
+    alone, since it may belong to a launch in progress.
+    """
+
+    def __init__(self, wrapper, interval_seconds=600, grace_seconds=300,
+                 max_removals_per_second=10, input_parent_dir=None):
+        """
+        :param wrapper: The DockerClientRunWrapper whose leftovers to find.
+        :param interval_seconds: Pause between collections, once started.
+        :param grace_seconds: Minimum age of anything removed.
+        :param max_removals_per_second: Removals are spaced out, so
+        collection does not compete with launches for the disk and daemon.
+        None for no limit.
+        :param input_parent_dir: Where warm pool input directories are made;
+        defaults to the system temporary directory.
+        """
+        self._wrapper = wrapper
+        self.interval_seconds = interval_seconds
+        self.grace_seconds = grace_seconds
+        self.max_removals_per_second = max_removals_per_second
+        self.input_parent_dir = input_parent_dir or tempfile.gettempdir()
+        self.total = GarbageReport(0, 0, 0, 0, 0)
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Collects every interval_seconds, from a background thread.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._collect_periodically)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def collect(self):
+        """
+        One collection, in this thread.
+
+        :return: GarbageReport of what was removed.
+        """
+        containers = self._wrapper.list()
+        mounted = set(
+            mount['Source'] for container in containers
+            for mount in container.attrs.get('Mounts') or [])
+        cutoff = time() - self.grace_seconds
+        (volumes, volume_bytes) = self._collect_volumes(cutoff)
+        (directories, directory_bytes) = self._collect_directories(
+            mounted, cutoff)
+        (inputs, input_bytes) = self._collect_inputs(mounted, cutoff)
+        (histories, history_bytes) = self._collect_histories(
+            containers, cutoff)
+        report = GarbageReport(
+            volumes=volumes, directories=directories, inputs=inputs,
+            histories=histories,
+            bytes_reclaimed=volume_bytes + directory_bytes + input_bytes +
+            history_bytes)
+        self.total = GarbageReport(
+            *[total + new for (total, new) in zip(self.total, report)])
+        if any(report):
+            logger.info('Garbage collected: %s', report)
+        return report
+
+    def _collect_periodically(self):
+        while not self._stopped.wait(self.interval_seconds):
+            try:
+                self.collect()
+            except Exception as e:  # pragma: no cover
+                logger.warn('Garbage collection failed: %s', e)
+
+    def _throttle(self):
+        if self.max_removals_per_second:
+            sleep(1.0 / self.max_removals_per_second)
+
+    def _collect_volumes(self, cutoff):
+        orphans = self._wrapper.list_volumes(
+            {'label': self._wrapper.volume_label(), 'dangling': True})
+        count = 0
+        freed = 0
+        for volume in orphans:
+            if created_at(volume) > cutoff:
+                continue
+            size = _disk_usage(volume.attrs.get('Mountpoint'))
+            try:
+                self._wrapper.remove_volume(volume.name)
+            except docker.errors.APIError as e:
+                # Including NotFound, and in use since it was listed.
+                logger.info('Volume %s not removed: %s', volume.name, e)
+                continue
+            count += 1
+            freed += size
+            self._throttle()
+        return (count, freed)
+
+    def _collect_directories(self, mounted, cutoff):
+        count = 0
+        freed = 0
+        for name in os.listdir(self.input_parent_dir):
+            if not name.startswith(INPUT_DIR_PREFIX):
+                continue
+            path = os.path.join(self.input_parent_dir, name)
+            try:
+                if path in mounted or os.path.getmtime(path) > cutoff:
+                    continue
+            except OSError:  # pragma: no cover
+                continue
+            size = _disk_usage(path)
+            rmtree(path, ignore_errors=True)
+            count += 1
+            freed += size
+            self._throttle()
+        return (count, freed)
+
+    def _collect_inputs(self, mounted, cutoff):
+        store = self._wrapper.input_store
+        if store is None:
+            return (0, 0)
+        count = 0
+        freed = 0
+        for path in store.paths():
+            try:
+                if path in mounted or os.path.getmtime(path) > cutoff:
+                    continue
+            except OSError:  # pragma: no cover
+                continue
+            size = store.remove(path, cutoff)
+            if size is None:
+                continue
+            count += 1
+            freed += size
+            self._throttle()
+        return (count, freed)
+
+    def _collect_histories(self, containers, cutoff):
+        historian = self._wrapper.historian
+        live = set(container.id for container in containers)
+        candidates = historian.container_ids() - live
+        last = historian.last_accessed(candidates)
+        gone = [container_id for container_id in candidates
+                if last.get(container_id) is None
+                or last[container_id] <= cutoff]
+        if not gone:
+            return (0, 0)
+        return (len(gone), historian.forget(gone))
+
+
+def _disk_usage(path):
+    if not path or not os.path.exists(path):
+        return 0
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for (directory, _, names) in os.walk(path):
+        for name in names:
+            try:
+                total += os.lstat(os.path.join(directory, name)).st_size
+            except OSError:  # pragma: no cover
+                pass
+    return total
@@ -1,8 +1,35 @@
 from __future__ import print_function
 
+import atexit
 import errno
+import fcntl
+import logging
 import os
+import sqlite3
+import threading
+from collections import OrderedDict, deque, namedtuple
 from datetime import datetime
+from time import mktime, time
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+
+HistoryRecord = namedtuple('HistoryRecord', [
+    'timestamp',  # isoformat
+    'url',
+    'cursor'  # Pass to query() to continue after this record.
+])
+
+_QUERY_PAGE = 1000
+
+
+def _epoch(timestamp):
+    return mktime(timestamp.timetuple()) + timestamp.microsecond / 1e6
+
+
+def _isoformat(timestamp):
+    return None if timestamp is None else timestamp.isoformat()
 
 
 class FileHistorian():
@@ -12,36 +39,184 @@ class FileHistorian():
     """
 
     DIR = '/tmp/django-docker-file-historian'
+    INDEX_DIR = os.path.join(DIR, '.index')
 
-    def __init__(self):
+    def __init__(self, index_bytes=64 * 1024):
+        """
+        :param index_bytes: Beside each file, a sparse index of timestamps
+        and byte offsets is kept, with an entry for about every index_bytes
+        of records, so that query() can seek to a time.
+        """
         # mkdir -p: https://stackoverflow.com/a/600612
         try:
-            os.makedirs(FileHistorian.DIR)
+            os.makedirs(FileHistorian.INDEX_DIR)
         except OSError as exc:  # Python >2.5
-            if exc.errno == errno.EEXIST and os.path.isdir(FileHistorian.DIR):
+            if exc.errno == errno.EEXIST and \
+                    os.path.isdir(FileHistorian.INDEX_DIR):
                 pass
             else:  # pragma: no cover
                 raise
+        self.index_bytes = index_bytes
+        self._indexed = {}  # container_id -> last offset in the index
+        self._index_lock = threading.Lock()
 
     def _path(self, container_id):
         return os.path.join(FileHistorian.DIR, container_id)
 
+    def _index_path(self, container_id):
+        return os.path.join(FileHistorian.INDEX_DIR, container_id)
+
     def create(self, container_id):
         with open(self._path(container_id), 'w'):
             pass
+        self._drop_index(container_id)
+
+    def record(self, container_id, url, timestamp=None):
+        self.record_many([(container_id, url, timestamp)])
 
-    def record(self, container_id, url):
-        with open(self._path(container_id), 'a') as f:
-            timestamp = datetime.now().isoformat()
-            print('\t'.join([timestamp, '/' + url]), file=f)
+    def record_many(self, records):
+        """
+        :param records: (container_id, url, timestamp) tuples: Each file
+        is opened just once, and locked while it and its index are written,
+        so other writers, in this process or another, do not come between
+        a record and its offset. A timestamp of None means now.
+        """
+        by_id = OrderedDict()
+        for (container_id, url, timestamp) in records:
+            by_id.setdefault(container_id, []).append((url, timestamp))
+        for (container_id, pairs) in by_id.items():
+            with open(self._path(container_id), 'a') as f:
+                # Released on close, once the records are flushed.
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                offset = os.fstat(f.fileno()).st_size
+                for (url, timestamp) in pairs:
+                    timestamp = (timestamp or datetime.now()).isoformat()
+                    self._index(container_id, timestamp, offset)
+                    line = '\t'.join([timestamp, '/' + url]) + '\n'
+                    f.write(line)
+                    offset += len(line if isinstance(line, bytes)
+                                  else line.encode('utf-8'))
+
+    def _index(self, container_id, timestamp, offset):
+        with self._index_lock:
+            last = self._indexed.get(container_id)
+            if last is None:
+                entries = self._index_entries(container_id)
+                last = entries[-1][1] if entries else 0
+            if offset - last < self.index_bytes:
+                self._indexed[container_id] = last
+                return
+            with open(self._index_path(container_id), 'a') as f:
+                print('\t'.join([timestamp, str(offset)]), file=f)
+            self._indexed[container_id] = offset
+
+    def _index_entries(self, container_id):
+        try:
+            with open(self._index_path(container_id)) as f:
+                return [(timestamp, int(offset)) for (timestamp, offset)
+                        in (line.rstrip().split('\t') for line in f)]
+        except (IOError, OSError):
+            return []
+
+    def _drop_index(self, container_id):
+        with self._index_lock:
+            self._indexed.pop(container_id, None)
+            try:
+                os.remove(self._index_path(container_id))
+            except OSError:
+                pass
 
     def list(self, container_id):
         with open(self._path(container_id)) as f:
             return [line.rstrip().split('\t') for line in f]
 
+    def query(self, container_id, since=None, until=None, limit=None,
+              cursor=None):
+        '''
+        Returns a generator of the HistoryRecords from since (inclusive)
+        until (exclusive), at most limit of them, after the cursor, if given.
+        Records are expected to be in time order: Reading starts from the
+        index entry before since, and stops at the first record after until.
+        '''
+        since = _isoformat(since)
+        until = _isoformat(until)
+        if cursor is None:
+            cursor = 0
+            if since is not None:
+                for (timestamp, offset) in self._index_entries(container_id):
+                    if timestamp >= since:
+                        break
+                    cursor = offset
+        return self._read(container_id, since, until, limit, cursor)
+
+    def _read(self, container_id, since, until, limit, offset):
+        if limit == 0:
+            return
+        count = 0
+        with open(self._path(container_id), 'rb') as f:
+            if offset:
+                # If the offset is not at the start of a record, skip ahead.
+                f.seek(offset - 1)
+                if f.read(1) != b'\n':
+                    offset += len(f.readline())
+            f.seek(offset)
+            while True:
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    return  # End of file, or a record still being written.
+                offset += len(line)
+                fields = line.decode('utf-8').rstrip().split('\t')
+                if len(fields) != 2:
+                    continue
+                (timestamp, url) = fields
+                if since is not None and timestamp < since:
+                    continue
+                if until is not None and timestamp >= until:
+                    return
+                yield HistoryRecord(timestamp, url, offset)
+                count += 1
+                if count == limit:
+                    return
+
     def _last_timestamp(self, container_id):
         return os.path.getmtime(self._path(container_id))
 
+    def last_accessed(self, container_id_set):
+        '''
+        Returns {container_id: seconds since the epoch} of the last request,
+        or of creation, with None for containers with no history.
+        '''
+        last = {}
+        for container_id in container_id_set:
+            try:
+                last[container_id] = self._last_timestamp(container_id)
+            except OSError:
+                last[container_id] = None
+        return last
+
+    def container_ids(self):
+        '''
+        Returns the set of container IDs with a history.
+        '''
+        return set(name for name in os.listdir(FileHistorian.DIR)
+                   if not name.startswith('.'))
+
+    def forget(self, container_id_set):
+        '''
+        Removes the history of these containers, and returns the bytes freed.
+        '''
+        freed = 0
+        for container_id in container_id_set:
+            path = self._path(container_id)
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                continue
+            self._drop_index(container_id)
+            freed += size
+        return freed
+
     def sort_lru(self, container_id_set):
         '''
         Returns the container IDs sorted with the least-recently-used first.
@@ -53,3 +228,384 @@ class FileHistorian():
             pair[0] for pair in
             sorted(id_timestamp_pairs, key=lambda pair: pair[1])
         ]
+
+
+class SqliteHistorian():
+    """
+    Records incoming requests to a SQLite database, and provides access to the
+    records. It offers the same interface as FileHistorian, but the last
+    access of every container is kept in its own indexed table, so sort_lru
+    is a single query, and in WAL mode several processes can record at once.
+    """
+
+    PATH = '/tmp/django-docker-historian.sqlite3'
+
+    def __init__(self, path=PATH, timeout_seconds=30):
+        """
+        :param path: Database file, or ':memory:' for a private database.
+        :param timeout_seconds: How long to wait on another writer.
+        """
+        self.path = path
+        self.timeout_seconds = timeout_seconds
+        self._local = threading.local()
+        self._shared = None  # A memory database can't be opened twice.
+        self._shared_lock = threading.Lock()
+        with self._transaction() as connection:
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS requests (
+                    container_id TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    url TEXT NOT NULL);
+                CREATE INDEX IF NOT EXISTS requests_container_timestamp
+                    ON requests (container_id, timestamp);
+                CREATE TABLE IF NOT EXISTS last_access (
+                    container_id TEXT PRIMARY KEY,
+                    timestamp REAL NOT NULL);
+                CREATE INDEX IF NOT EXISTS last_access_timestamp
+                    ON last_access (timestamp);
+            """)
+
+    def _connect(self):
+        connection = sqlite3.connect(
+            self.path, timeout=self.timeout_seconds,
+            check_same_thread=self.path != ':memory:')
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def _connection(self):
+        if self.path == ':memory:':
+            if self._shared is None:
+                self._shared = self._connect()
+            return self._shared
+        # One connection per thread, and a new one after a fork.
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.connection = self._connect()
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def _transaction(self):
+        return _Transaction(
+            self._connection(),
+            self._shared_lock if self.path == ':memory:' else None)
+
+    def create(self, container_id):
+        with self._transaction() as connection:
+            connection.execute(
+                'DELETE FROM requests WHERE container_id = ?',
+                (container_id,))
+            connection.execute(
+                'INSERT OR REPLACE INTO last_access VALUES (?, ?)',
+                (container_id, time()))
+
+    def record(self, container_id, url, timestamp=None):
+        self.record_many([(container_id, url, timestamp)])
+
+    def record_many(self, records):
+        """
+        :param records: (container_id, url, timestamp) tuples, written in a
+        single transaction. A timestamp of None means now.
+        """
+        rows = [(container_id, timestamp or datetime.now(), '/' + url)
+                for (container_id, url, timestamp) in records]
+        last_access = {}
+        for (container_id, timestamp, url) in rows:
+            last_access[container_id] = max(
+                _epoch(timestamp), last_access.get(container_id, 0))
+        with self._transaction() as connection:
+            connection.executemany(
+                'INSERT INTO requests VALUES (?, ?, ?)',
+                [(container_id, timestamp.isoformat(), url)
+                 for (container_id, timestamp, url) in rows])
+            connection.executemany(
+                'INSERT OR REPLACE INTO last_access VALUES (?, ?)',
+                list(last_access.items()))
+
+    def list(self, container_id):
+        with self._transaction() as connection:
+            return [list(row) for row in connection.execute(
+                'SELECT timestamp, url FROM requests WHERE container_id = ? '
+                'ORDER BY rowid', (container_id,))]
+
+    def query(self, container_id, since=None, until=None, limit=None,
+              cursor=None):
+        '''
+        Returns a generator of the HistoryRecords from since (inclusive)
+        until (exclusive), at most limit of them, after the cursor, if given.
+        Rows are fetched a page at a time, by the container and timestamp
+        index.
+        '''
+        return self._query(container_id, _isoformat(since),
+                           _isoformat(until), limit, cursor or 0)
+
+    def _query(self, container_id, since, until, limit, cursor):
+        sql = 'SELECT rowid, timestamp, url FROM requests ' \
+            'WHERE container_id = ? AND rowid > ?'
+        params = [container_id]
+        if since is not None:
+            sql += ' AND timestamp >= ?'
+            params.append(since)
+        if until is not None:
+            sql += ' AND timestamp < ?'
+            params.append(until)
+        sql += ' ORDER BY rowid LIMIT ?'
+        remaining = limit
+        while remaining is None or remaining > 0:
+            page = _QUERY_PAGE if remaining is None \
+                else min(_QUERY_PAGE, remaining)
+            with self._transaction() as connection:
+                rows = connection.execute(
+                    sql, [params[0], cursor] + params[1:] + [page]).fetchall()
+            for (cursor, timestamp, url) in rows:
+                yield HistoryRecord(timestamp, url, cursor)
+            if remaining is not None:
+                remaining -= len(rows)
+            if len(rows) < page:
+                return
+
+    def _last_timestamp(self, container_id):
+        with self._transaction() as connection:
+            row = connection.execute(
+                'SELECT timestamp FROM last_access WHERE container_id = ?',
+                (container_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def last_accessed(self, container_id_set):
+        '''
+        Returns {container_id: seconds since the epoch} of the last request,
+        or of creation, with None for containers with no history.
+        '''
+        last = dict.fromkeys(container_id_set)
+        with self._transaction() as connection:
+            for (container_id, timestamp) in connection.execute(
+                    'SELECT container_id, timestamp FROM last_access'):
+                if container_id in last:
+                    last[container_id] = timestamp
+        return last
+
+    def container_ids(self):
+        '''
+        Returns the set of container IDs with a history.
+        '''
+        with self._transaction() as connection:
+            return set(row[0] for row in connection.execute(
+                'SELECT container_id FROM last_access UNION '
+                'SELECT DISTINCT container_id FROM requests'))
+
+    def forget(self, container_id_set):
+        '''
+        Removes the history of these containers, and returns the bytes freed:
+        Reported by the size of the rows, though the file only shrinks once
+        SQLite reuses the pages.
+        '''
+        ids = [(container_id,) for container_id in container_id_set]
+        with self._transaction() as connection:
+            freed = 0
+            for (container_id,) in ids:
+                row = connection.execute(
+                    'SELECT COALESCE(SUM(LENGTH(container_id) + '
+                    'LENGTH(timestamp) + LENGTH(url)), 0) FROM requests '
+                    'WHERE container_id = ?', (container_id,)).fetchone()
+                freed += row[0]
+            connection.executemany(
+                'DELETE FROM requests WHERE container_id = ?', ids)
+            connection.executemany(
+                'DELETE FROM last_access WHERE container_id = ?', ids)
+        return freed
+
+    def sort_lru(self, container_id_set):
+        '''
+        Returns the container IDs sorted with the least-recently-used first.
+        IDs with no history at all are treated as least recent.
+        '''
+        wanted = set(container_id_set)
+        with self._transaction() as connection:
+            known = [row[0] for row in connection.execute(
+                'SELECT container_id FROM last_access '
+                'ORDER BY timestamp, rowid')
+                if row[0] in wanted]
+        return sorted(wanted.difference(known)) + known
+
+
+class BufferedHistorian():
+    """
+    Wraps another historian so that record() only touches memory: Requests
+    are queued in a bounded buffer and written to the backing historian in
+    batches from a background thread. The containers seen by this process
+    are kept in memory in LRU order, which includes requests which have not
+    been written yet, so sort_lru() only asks the backing historian about
+    containers it has never seen.
+    """
+
+    def __init__(self, historian, flush_seconds=1, max_pending=10000):
+        """
+        :param historian: The backing historian, eg. FileHistorian().
+        :param flush_seconds: Interval between writes to the backing store.
+        :param max_pending: Beyond this, the oldest unwritten requests are
+        dropped; the LRU order is not affected.
+        """
+        self.historian = historian
+        self.flush_seconds = flush_seconds
+        self.dropped = 0
+        self._last_access = OrderedDict()  # Least recent first
+        self._backing_access = {}  # Epochs read for containers not seen
+        self._pending = deque(maxlen=max_pending)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._flush_periodically)
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _touch(self, container_id, timestamp):
+        # Caller holds the lock.
+        self._backing_access.pop(container_id, None)
+        previous = self._last_access.pop(container_id, None)
+        self._last_access[container_id] = \
+            timestamp if previous is None else max(previous, timestamp)
+
+    def create(self, container_id):
+        self.historian.create(container_id)
+        with self._lock:
+            self._touch(container_id, datetime.now())
+
+    def record(self, container_id, url, timestamp=None):
+        timestamp = timestamp or datetime.now()
+        with self._lock:
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped += 1
+            self._pending.append((container_id, url, timestamp))
+            self._touch(container_id, timestamp)
+
+    def flush(self):
+        """
+        Writes everything pending to the backing historian.
+        """
+        with self._lock:
+            if not self._pending:
+                return
+            records = list(self._pending)
+            self._pending.clear()
+        try:
+            if hasattr(self.historian, 'record_many'):
+                self.historian.record_many(records)
+            else:
+                for record in records:
+                    self.historian.record(*record)
+        except Exception as e:  # pragma: no cover
+            logger.warn('Dropped %s records on flush: %s', len(records), e)
+
+    def close(self):
+        self._stopped.set()
+        self.flush()
+        if hasattr(atexit, 'unregister'):  # pragma: no cover
+            atexit.unregister(self.flush)
+
+    def _flush_periodically(self):
+        while not self._stopped.wait(self.flush_seconds):
+            self.flush()
+
+    def list(self, container_id):
+        self.flush()
+        return self.historian.list(container_id)
+
+    def last_accessed(self, container_id_set):
+        '''
+        Returns {container_id: seconds since the epoch} of the last request,
+        or of creation, with None for containers with no history: The later
+        of what this process has seen, and what the backing historian has.
+        '''
+        return self._merged_last_accessed(container_id_set)
+
+    def query(self, container_id, **kwargs):
+        self.flush()
+        return self.historian.query(container_id, **kwargs)
+
+    def container_ids(self):
+        self.flush()
+        return self.historian.container_ids()
+
+    def forget(self, container_id_set):
+        self.flush()
+        self.discard(container_id_set)
+        return self.historian.forget(container_id_set)
+
+    def discard(self, container_id_set):
+        '''
+        Stops keeping these containers in memory, once they are killed:
+        Their history is kept until it is forgotten.
+        '''
+        with self._lock:
+            for container_id in container_id_set:
+                self._last_access.pop(container_id, None)
+                self._backing_access.pop(container_id, None)
+
+    def sort_lru(self, container_id_set):
+        '''
+        Returns the container IDs sorted with the least-recently-used first:
+        Those seen by this process in the order of their last access here,
+        merged by time with the others, whose last access is read from the
+        backing historian the first time they are sorted. IDs with no
+        history at all are treated as least recent.
+        '''
+        ids = set(container_id_set)
+        with self._lock:
+            unseen = [container_id for container_id in ids
+                      if container_id not in self._last_access and
+                      container_id not in self._backing_access]
+        if unseen:
+            backing = self.historian.last_accessed(set(unseen))
+            with self._lock:
+                for container_id in unseen:
+                    if container_id not in self._last_access:
+                        self._backing_access.setdefault(
+                            container_id, backing.get(container_id))
+        with self._lock:
+            seen = [(_epoch(timestamp), container_id) for
+                    (container_id, timestamp) in self._last_access.items()
+                    if container_id in ids]
+            others = sorted(
+                (self._backing_access.get(container_id) is not None,
+                 self._backing_access.get(container_id) or 0, container_id)
+                for container_id in ids
+                if container_id not in self._last_access)
+        lru = []
+        i = 0
+        for (_, epoch, container_id) in others:
+            while i < len(seen) and seen[i][0] < epoch:
+                lru.append(seen[i][1])
+                i += 1
+            lru.append(container_id)
+        return lru + [container_id for (_, container_id) in seen[i:]]
+
+    def _merged_last_accessed(self, container_id_set):
+        with self._lock:
+            seen = {container_id: self._last_access.get(container_id)
+                    for container_id in container_id_set}
+        last = self.historian.last_accessed(set(seen))
+        for (container_id, timestamp) in seen.items():
+            if timestamp is not None:
+                last[container_id] = max(
+                    _epoch(timestamp), last.get(container_id) or 0)
+        return last
+
+
+class _Transaction():
+    # sqlite3's own context manager commits, but does not serialize threads
+    # sharing a connection, and only ':memory:' databases need that.
+
+    def __init__(self, connection, lock):
+        self.connection = connection
+        self.lock = lock
+
+    def __enter__(self):
+        if self.lock:
+            self.lock.acquire()
+        return self.connection.__enter__()
+
+    def __exit__(self, *args):
+        try:
+            return self.connection.__exit__(*args)
+        finally:
+            if self.lock:
+                self.lock.release()
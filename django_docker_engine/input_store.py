@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import tempfile
+import uuid
+
+_MARKER = '.django-docker-input-store'
+_REMOVING = '.removing-'
+
+
+class InputStore():
+    """
+    Container inputs, written to files on the host named by the hash of
+    their content: Identical inputs are stored once, however many
+    containers mount them. Files are written beside, and then renamed,
+    so a container never sees a partial file.
+    """
+
+    PATH = '/tmp/django-docker-inputs'
+
+    def __init__(self, path=PATH):
+        """
+        :param path: Directory for the files. The Docker Engine must be on
+        this host, so it can bind-mount them.
+        """
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        marker = os.path.join(path, _MARKER)
+        if not os.path.exists(marker):
+            open(marker, 'w').close()
+
+    def put(self, input):  # noqa: A002
+        """
+        :param input: Anything json.dumps can serialize.
+        :return: Path of the file holding it.
+        """
+        content = json.dumps(input, sort_keys=True, separators=(',', ':'))
+        digest = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        path = os.path.join(self.path, digest + '.json')
+        try:
+            # Marks it as in use, so garbage collection waits again.
+            os.utime(path, None)
+            return path
+        except OSError:
+            pass  # Not written yet, or collected since.
+        (fd, tmp_path) = tempfile.mkstemp(dir=self.path)
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.rename(tmp_path, path)
+        return path
+
+    def paths(self):
+        """
+        :return: Paths of the files in the store, including any left half
+        written by a process which died.
+        """
+        return [os.path.join(self.path, name)
+                for name in os.listdir(self.path) if name != _MARKER]
+
+    def remove(self, path, unused_since):
+        """
+        Removes a file, unless it has been put since unused_since: The file
+        is moved aside before the last check, so a put at the same moment
+        either marks it first, and it is kept, or writes it again.
+
+        :param unused_since: Seconds since the epoch.
+        :return: Bytes freed, or None if it was kept.
+        """
+        aside = os.path.join(self.path, _REMOVING + uuid.uuid4().hex)
+        try:
+            os.rename(path, aside)
+        except OSError:
+            return None
+        stat = os.stat(aside)
+        if stat.st_mtime > unused_since:
+            os.rename(aside, path)
+            return None
+        os.remove(aside)
+        return stat.st_size
+
+
+def in_store(path):
+    """
+    :return: True if the path is in a directory used by an InputStore, in
+    this process or any other: Such files are shared, and are not removed
+    with the container.
+    """
+    directory = path if os.path.isdir(path) else os.path.dirname(path)
+    return os.path.exists(os.path.join(directory, _MARKER))
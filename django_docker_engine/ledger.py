@@ -0,0 +1,164 @@
+import sqlite3
+from contextlib import contextmanager
+from time import time
+
+
+class MemoryLedger():
+    """
+    Memory reserved by each container, recorded in a SQLite database which
+    every process on the host can share. A reservation is recorded in the
+    same write transaction which checks the total, so concurrent launches,
+    even from different processes, can not both claim the same free memory.
+    Making room, which lists and kills containers, happens outside of any
+    transaction, so it does not hold up other processes.
+    """
+
+    PATH = '/tmp/django-docker-memory-ledger.sqlite3'
+
+    def __init__(self, path=PATH, timeout_seconds=60, reconcile_seconds=300,
+                 pending_seconds=300):
+        """
+        :param path: Database file.
+        :param timeout_seconds: How long to wait for another admission.
+        :param reconcile_seconds: Even below the limit, check the ledger
+        against the real containers this often, in case something was
+        removed behind our back.
+        :param pending_seconds: Reservations made more recently than this
+        may be for containers which are still being launched, and so are
+        not listed yet: make_room is told about them.
+        """
+        self.path = path
+        self.timeout_seconds = timeout_seconds
+        self.reconcile_seconds = reconcile_seconds
+        self.pending_seconds = pending_seconds
+        with self._transaction() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS reservations ('
+                'container_name TEXT PRIMARY KEY, mem_mb REAL NOT NULL, '
+                'admitted_at REAL NOT NULL DEFAULT 0)')
+            columns = [row[1] for row in connection.execute(
+                'PRAGMA table_info(reservations)')]
+            if 'admitted_at' not in columns:
+                # Made by an earlier version: Its rows count as old.
+                connection.execute(
+                    'ALTER TABLE reservations ADD COLUMN '
+                    'admitted_at REAL NOT NULL DEFAULT 0')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS reconciled (timestamp REAL)')
+
+    @contextmanager
+    def _transaction(self):
+        connection = sqlite3.connect(
+            self.path, timeout=self.timeout_seconds, isolation_level=None)
+        try:
+            # Takes the write lock now, rather than at the first write.
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield connection
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+        finally:
+            connection.close()
+
+    def admit(self, container_name, mem_reservation_mb, mem_limit_mb,
+              make_room):
+        """
+        Reserves memory for a new container.
+
+        :param make_room: Called once the new reservation is recorded, if
+        the reservations on record exceed the limit, or if they have not been
+        reconciled recently. It is passed {container_name: mem_mb} for the
+        other pending reservations, admitted within pending_seconds. It
+        should check the real containers, free memory if needed, also leaving
+        room for any pending reservation whose container is not listed yet,
+        and return {container_name: mem_mb} for the real containers remaining
+        and the pending reservations it kept. The ledger is replaced by that,
+        and by anything admitted meanwhile. If it raises, the new
+        reservation is released.
+        """
+        self.admit_many({container_name: mem_reservation_mb},
+                        mem_limit_mb, make_room)
+
+    def admit_many(self, reservations, mem_limit_mb, make_room):
+        """
+        Like admit, but for several containers in one transaction, with at
+        most one call to make_room for all of them.
+
+        :param reservations: {container_name: mem_mb}
+        """
+        mem_reservation_mb = sum(reservations.values())
+        with self._transaction() as connection:
+            total = self._total(connection)
+            row = connection.execute(
+                'SELECT MAX(timestamp) FROM reconciled').fetchone()
+            stale = row[0] is None or \
+                time() - row[0] > self.reconcile_seconds
+            pending = dict(connection.execute(
+                'SELECT container_name, mem_mb FROM reservations '
+                'WHERE admitted_at > ?', (time() - self.pending_seconds,)))
+            admitted_at = time()
+            connection.executemany(
+                'INSERT OR REPLACE INTO reservations VALUES (?, ?, ?)',
+                [(name, mem_mb, admitted_at)
+                 for (name, mem_mb) in reservations.items()])
+        if not stale and total + mem_reservation_mb <= mem_limit_mb:
+            return
+        for name in reservations:
+            pending.pop(name, None)
+        try:
+            remaining = make_room(pending)
+        except BaseException:
+            self.release(reservations)
+            raise
+        with self._transaction() as connection:
+            self._replace(connection, remaining, admitted_at)
+            connection.execute('DELETE FROM reconciled')
+            connection.execute(
+                'INSERT INTO reconciled VALUES (?)', (time(),))
+
+    def _replace(self, connection, remaining, admitted_since):
+        # Rows which remain keep their admitted_at, and those admitted
+        # since make_room was called are kept too.
+        kept = set(remaining)
+        connection.executemany(
+            'DELETE FROM reservations WHERE container_name = ?',
+            [(name,) for (name,) in connection.execute(
+                'SELECT container_name FROM reservations '
+                'WHERE admitted_at < ?', (admitted_since,)).fetchall()
+             if name not in kept])
+        connection.executemany(
+            'INSERT OR IGNORE INTO reservations VALUES (?, ?, 0)',
+            list(remaining.items()))
+        connection.executemany(
+            'UPDATE reservations SET mem_mb = ? WHERE container_name = ?',
+            [(mem_mb, name) for (name, mem_mb) in remaining.items()])
+
+    def release(self, container_names):
+        """
+        Call when containers fail to start, or are removed.
+        """
+        with self._transaction() as connection:
+            connection.executemany(
+                'DELETE FROM reservations WHERE container_name = ?',
+                [(name,) for name in container_names])
+
+    def rename(self, container_name, new_name):
+        with self._transaction() as connection:
+            connection.execute(
+                'UPDATE reservations SET container_name = ? '
+                'WHERE container_name = ?', (new_name, container_name))
+
+    def total_mb(self):
+        with self._transaction() as connection:
+            return self._total(connection)
+
+    def reservations(self):
+        with self._transaction() as connection:
+            return dict(connection.execute(
+                'SELECT container_name, mem_mb FROM reservations'))
+
+    def _total(self, connection):
+        return connection.execute(
+            'SELECT COALESCE(SUM(mem_mb), 0) FROM reservations').fetchone()[0]
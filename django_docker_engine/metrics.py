@@ -0,0 +1,189 @@
+"""
+Counters and histograms, rendered in the Prometheus text format.
+
+Recording takes a lock only long enough to update a dict entry.
+"""
+import threading
+from bisect import bisect_left
+from functools import wraps
+from time import time
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+PREFIX = 'django_docker_engine_'
+
+HELP = {
+    'proxy_request_seconds': 'Time to proxy a request to a container, '
+                             'by image.',
+    'please_wait_total': '503 please-wait responses, by cause.',
+    'run_seconds': 'Time to launch a container.',
+    'evictions_total': 'Containers removed to make room for another.',
+    'evicted_mb_total': 'Reserved memory freed by evictions.',
+    'docker_call_seconds': 'Time spent in calls to the Docker Engine.',
+    'cache_lookups_total':
+        'Lookups in the route cache and container registry.'
+}
+
+
+class Metrics():
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._help = dict(HELP)
+        self._collectors = {}
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def inc(self, name, labels=(), value=1):
+        """
+        :param name: Metric name, without the common prefix.
+        :param labels: Tuple of (key, value) pairs.
+        """
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, labels=()):
+        key = (name, labels)
+        bucket = bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = [[0] * (len(self.buckets) + 1), 0.0]
+                self._histograms[key] = histogram
+            histogram[0][bucket] += 1
+            histogram[1] += seconds
+
+    def add_collector(self, key, collector, kind='gauge'):
+        """
+        :param key: A collector added again under the same key replaces
+        the first.
+        :param collector: Called when rendering; returns a list of
+        (name, labels, value), for state kept elsewhere.
+        :param kind: "gauge", or "counter" for values which only increase.
+        """
+        self._collectors[key] = (collector, kind)
+
+    def timed(self, name, labels=()):
+        """
+        Context manager which observes the seconds spent inside it.
+        """
+        return _Timer(self, name, labels)
+
+    def render(self):
+        """
+        :return: All metrics, in the Prometheus text exposition format.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {
+                key: (list(buckets), total)
+                for (key, (buckets, total)) in self._histograms.items()}
+
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name in described:
+                return
+            described.add(name)
+            if name in self._help:
+                lines.append('# HELP {}{} {}'.format(
+                    PREFIX, name, self._help[name]))
+            lines.append('# TYPE {}{} {}'.format(PREFIX, name, kind))
+
+        for ((name, labels), value) in sorted(counters.items()):
+            header(name, 'counter')
+            lines.append(_sample(name, labels, value))
+        for ((name, labels), (buckets, total)) in sorted(histograms.items()):
+            header(name, 'histogram')
+            cumulative = 0
+            for (bound, count) in zip(self.buckets + ('+Inf',), buckets):
+                cumulative += count
+                lines.append(_sample(
+                    name + '_bucket', labels + (('le', str(bound)),),
+                    cumulative))
+            lines.append(_sample(name + '_sum', labels, total))
+            lines.append(_sample(name + '_count', labels, cumulative))
+        for (collector, kind) in list(self._collectors.values()):
+            for (name, labels, value) in collector():
+                header(name, kind)
+                lines.append(_sample(name, labels, value))
+        return '\n'.join(lines) + '\n'
+
+
+class _Timer():
+
+    def __init__(self, metrics, name, labels):
+        self._metrics = metrics
+        self._name = name
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time()
+        return self
+
+    def __exit__(self, *args):
+        self._metrics.observe(self._name, time() - self._start, self._labels)
+
+
+class InstrumentedManager():
+    """
+    Wraps a container manager, so each call is counted and timed by
+    operation name.
+    """
+
+    def __init__(self, manager, metrics):
+        self._manager = manager
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        attr = getattr(self._manager, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+        metrics = self._metrics
+        labels = (('operation', name),)
+
+        @wraps(attr)
+        def timed(*args, **kwargs):
+            with metrics.timed('docker_call_seconds', labels):
+                return attr(*args, **kwargs)
+        return timed
+
+
+def lookup_counters(cache, counted):
+    """
+    For add_collector, as counters: The hits and misses of a cache.
+
+    :param cache: Value of the cache label.
+    :param counted: Object with hits and misses attributes.
+    """
+    return [
+        ('cache_lookups_total', (('cache', cache), ('result', 'hit')),
+         counted.hits),
+        ('cache_lookups_total', (('cache', cache), ('result', 'miss')),
+         counted.misses)
+    ]
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def _sample(name, labels, value):
+    if labels:
+        label_string = '{' + ','.join(
+            '{}="{}"'.format(key, _escape(label_value))
+            for (key, label_value) in labels) + '}'
+    else:
+        label_string = ''
+    return '{}{}{} {}'.format(PREFIX, name, label_string, repr(float(value)))
+
+
+DEFAULT_METRICS = Metrics()
@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class HostSuffixTable():
+    """
+    Matches request hosts against a fixed set of suffixes, without regexes:
+    Suffixes are grouped by length, so each lookup is a slice and a set
+    membership test for each distinct length.
+    """
+
+    def __init__(self, suffixes):
+        by_length = {}
+        for suffix in suffixes:
+            by_length.setdefault(len(suffix), set()).add(suffix.lower())
+        self._by_length = sorted(by_length.items(), reverse=True)
+        # Longest first, so the most specific suffix wins.
+
+    def container_name(self, http_host):
+        """
+        :return: The subdomain, if the host ends with one of the suffixes;
+        else None.
+        """
+        (host, colon, port) = http_host.rpartition(':')
+        if not colon:
+            host = port
+        lower_host = host.lower()
+        for (length, suffixes) in self._by_length:
+            if len(host) > length and lower_host[-length:] in suffixes:
+                return host[:-length]  # Container names keep their case.
+        return None
+
+
+class FastHostnameRoutingMiddleware():
+    """
+    For requests to a host ending with one of DJANGO_DOCKER_HOST_SUFFIXES
+    (or DJANGO_DOCKER_HOST_SUFFIX), hands the request straight to the proxy,
+    so URL resolution, views, and any middleware after this one are skipped.
+    Other requests pass through untouched.
+
+    The proxy is the Proxy instance named by the dotted path in
+    DJANGO_DOCKER_PROXY, or a default Proxy(). The middleware after this
+    one does not run for container traffic, but Proxy.dispatch makes the
+    CSRF check itself, unless the proxy is csrf_exempt.
+
+    Works both as new-style middleware, and in MIDDLEWARE_CLASSES.
+    """
+
+    def __init__(self, get_response=None):
+        self.get_response = get_response
+        suffixes = getattr(settings, 'DJANGO_DOCKER_HOST_SUFFIXES', None) or \
+            [settings.DJANGO_DOCKER_HOST_SUFFIX]
+        self.table = HostSuffixTable(suffixes)
+        proxy_path = getattr(settings, 'DJANGO_DOCKER_PROXY', None)
+        if proxy_path:
+            self.proxy = import_string(proxy_path)
+        else:
+            from django_docker_engine.proxy import Proxy
+            self.proxy = Proxy()
+
+    def __call__(self, request):
+        response = self.process_request(request)
+        if response is None:
+            response = self.get_response(request)
+        return response
+
+    def process_request(self, request):
+        container_name = self.table.container_name(
+            request.META.get('HTTP_HOST', ''))
+        if not container_name:
+            return None
+        return self.proxy.dispatch(
+            request, container_name, request.path_info[1:])
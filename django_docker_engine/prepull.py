@@ -0,0 +1,158 @@
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+PULLING = 'pulling'
+PULLED = 'pulled'
+FAILED = 'failed'
+
+
+def full_image_name(image_name):
+    """
+    :return: The name with ":latest" added, if it has no tag: A ':' after the
+    last '/' is a tag; before it, a registry port.
+    """
+    if ':' in image_name.split('/')[-1]:
+        return image_name
+    return image_name + ':latest'
+
+
+class _Pull():
+
+    def __init__(self):
+        self.status = PULLING
+        self.done = threading.Event()
+        self.layers = {}  # layer id -> (current bytes, total bytes)
+        self.image_id = None
+        self.error = None
+
+
+class ImagePrePuller():
+    """
+    Pulls images in the background, a few at a time, so that launches do
+    not wait on a pull inside a request. Launches still name the image by
+    its tag: The pull only warms the daemon's cache. The local image id each
+    pull found is kept, and resolve() reports it.
+    """
+
+    def __init__(self, pull, max_workers=4, on_progress=None):
+        """
+        :param pull: Called as pull(image_name, version, progress=f), where f
+        is called with each progress event from the daemon. Should return
+        the pulled SDK Image: DockerClientWrapper.pull will do.
+        :param max_workers: How many pulls run at once.
+        :param on_progress: Optional f(image_name, status, bytes_done,
+        bytes_total), called as each pull progresses.
+        """
+        self._pull = pull
+        self._max_workers = max_workers
+        self._on_progress = on_progress
+        self._pool = None
+        self._pulls = {}
+        self._lock = threading.Lock()
+
+    def prepull(self, image_names):
+        """
+        Starts pulling each image, unless a pull is already in flight or
+        done. Returns immediately.
+        """
+        for image_name in image_names:
+            self._start(full_image_name(image_name))
+
+    def status(self, image_name):
+        """
+        :return: "pulling", "pulled", "failed", or None if never requested.
+        """
+        pull = self._pulls.get(full_image_name(image_name))
+        return None if pull is None else pull.status
+
+    def progress(self, image_name):
+        """
+        :return: (bytes_done, bytes_total) over the layers reported so far,
+        or None if never requested.
+        """
+        pull = self._pulls.get(full_image_name(image_name))
+        if pull is None:
+            return None
+        layers = list(pull.layers.values())
+        return (sum(layer[0] for layer in layers),
+                sum(layer[1] for layer in layers))
+
+    def wait(self, image_name, timeout=None):
+        """
+        Blocks until the image has been pulled, starting the pull if needed,
+        so that concurrent launches share one pull rather than each starting
+        their own.
+
+        :return: True if the image is ready, False if the pull failed or
+        the timeout expired.
+        """
+        pull = self._start(full_image_name(image_name))
+        pull.done.wait(timeout)
+        return pull.status == PULLED
+
+    def resolve(self, image_name):
+        """
+        :return: The local image id the pull found, if this image has been
+        pulled, or else None. It is not refreshed if the image is removed or
+        the tag moves, until forget() is called.
+        """
+        pull = self._pulls.get(full_image_name(image_name))
+        if pull is None or pull.status != PULLED:
+            return None
+        return pull.image_id
+
+    def forget(self, image_name):
+        """
+        Drops a cached result, for instance after a tag has been pushed
+        again, so the next request pulls afresh.
+        """
+        with self._lock:
+            pull = self._pulls.get(full_image_name(image_name))
+            if pull is not None and pull.status != PULLING:
+                del self._pulls[full_image_name(image_name)]
+
+    def _start(self, full_name):
+        with self._lock:
+            pull = self._pulls.get(full_name)
+            if pull is not None and pull.status != FAILED:
+                return pull
+            pull = _Pull()
+            self._pulls[full_name] = pull
+            if self._pool is None:
+                self._pool = ThreadPool(self._max_workers)
+        self._pool.apply_async(self._work, (full_name, pull))
+        return pull
+
+    def _work(self, full_name, pull):
+        (image_name, _, version) = full_name.rpartition(':')
+
+        def progress(event):
+            detail = event.get('progressDetail') or {}
+            if 'id' in event and 'total' in detail:
+                pull.layers[event['id']] = (detail['current'], detail['total'])
+            self._report(full_name, pull)
+
+        try:
+            image = self._pull(image_name, version, progress=progress)
+            pull.image_id = getattr(image, 'id', None)
+            pull.status = PULLED
+        except Exception as e:
+            logger.warn('Failed to pull {}: {}'.format(full_name, e))
+            pull.error = e
+            pull.status = FAILED
+        finally:
+            pull.done.set()
+            self._report(full_name, pull)
+
+    def _report(self, full_name, pull):
+        if self._on_progress is None:
+            return
+        (done, total) = self.progress(full_name)
+        try:
+            self._on_progress(full_name, pull.status, done, total)
+        except Exception as e:  # pragma: no cover
+            logger.warn('Progress callback failed: {}'.format(e))
@@ -0,0 +1,185 @@
+import logging
+import socket
+import threading
+from time import time
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+STARTING = 'starting'
+READY = 'ready'
+FAILED = 'failed'
+
+
+class _Target():
+
+    def __init__(self, route):
+        self.route = route
+        self.state = STARTING
+        self.ready = threading.Event()
+        self.done = threading.Event()
+        self.done_at = None
+        self.callbacks = []
+
+
+class ReadinessProber():
+    """
+    Probes new containers from background threads, with exponential backoff,
+    until they answer, and keeps the result, so the proxy can tell a client
+    to wait without trying to connect itself. The state is per-process:
+    A container started by another process is unknown here, and is proxied
+    as usual, and one killed by another process is only forgotten here
+    keep_seconds after its probe finished.
+    """
+
+    def __init__(self,
+                 http_path='/',
+                 connect_timeout_seconds=1,
+                 initial_delay_seconds=0.1,
+                 max_delay_seconds=5,
+                 give_up_seconds=300,
+                 keep_seconds=3600):
+        """
+        :param http_path: Path to GET: Any HTTP response at all means the
+        container is ready. If None, a TCP connection is enough; but if the
+        port is published by docker-proxy, it accepts connections even before
+        the container is listening.
+        :param give_up_seconds: After this, the container is "failed", and
+        the proxy goes back to trying it on each request.
+        :param keep_seconds: How long the result is kept, once a container
+        is ready or failed. After that it is not watched any more.
+        """
+        self._http_path = http_path
+        self._connect_timeout_seconds = connect_timeout_seconds
+        self._initial_delay_seconds = initial_delay_seconds
+        self._max_delay_seconds = max_delay_seconds
+        self._give_up_seconds = give_up_seconds
+        self._keep_seconds = keep_seconds
+        self._targets = {}
+        self._lock = threading.Lock()
+
+    def watch(self, container_name, route):
+        """
+        Starts probing the container, unless it is already being probed.
+
+        :param route: ContainerRoute, with the host and port to probe.
+        """
+        with self._lock:
+            self._prune()
+            target = self._targets.get(container_name)
+            if target is not None and target.route == route:
+                return
+            target = _Target(route)
+            self._targets[container_name] = target
+        thread = threading.Thread(
+            target=self._probe_until_done, args=(container_name, target))
+        thread.daemon = True
+        thread.start()
+
+    def state(self, container_name):
+        """
+        :return: "starting", "ready", "failed", or None if not watched.
+        """
+        target = self._targets.get(container_name)
+        return None if target is None else target.state
+
+    def wait(self, container_name, timeout=None):
+        """
+        Blocks until the container is ready, has failed, or the timeout
+        expires. Returns True only if it is ready.
+        """
+        target = self._targets.get(container_name)
+        if target is None:
+            return False
+        target.done.wait(timeout)
+        return target.state == READY
+
+    def ready_event(self, container_name):
+        """
+        :return: threading.Event, set once the container is ready,
+        or None if not watched.
+        """
+        target = self._targets.get(container_name)
+        return None if target is None else target.ready
+
+    def on_done(self, container_name, callback):
+        """
+        Calls callback() from the probing thread, once the container is
+        ready, has failed, or is forgotten; or now, if that has happened.
+        Returns False, without calling it, if the container is not watched.
+        """
+        with self._lock:
+            target = self._targets.get(container_name)
+            if target is None:
+                return False
+            if not target.done.is_set():
+                target.callbacks.append(callback)
+                return True
+        callback()
+        return True
+
+    def forget(self, container_name):
+        with self._lock:
+            target = self._targets.pop(container_name, None)
+        if target is not None:
+            self._finish(target)  # Stops the probe, and releases waiters.
+
+    def _prune(self):
+        # Caller holds the lock.
+        cutoff = time() - self._keep_seconds
+        for (container_name, target) in list(self._targets.items()):
+            if target.done_at is not None and target.done_at <= cutoff:
+                del self._targets[container_name]
+
+    def _finish(self, target):
+        with self._lock:
+            target.done_at = time()
+            target.done.set()
+            (callbacks, target.callbacks) = (target.callbacks, [])
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warn('Readiness callback failed: {}'.format(e))
+
+    def probe(self, route):
+        """
+        A single probe: Returns True if the container answered.
+        """
+        try:
+            connection = socket.create_connection(
+                (route.host, int(route.port)),
+                timeout=self._connect_timeout_seconds)
+        except (socket.error, socket.timeout):
+            return False
+        try:
+            if self._http_path is None:
+                return True
+            connection.sendall(
+                'GET {} HTTP/1.0\r\nHost: {}\r\n\r\n'.format(
+                    self._http_path, route.host).encode('ascii'))
+            return connection.recv(5) == b'HTTP/'
+        except (socket.error, socket.timeout):
+            return False
+        finally:
+            connection.close()
+
+    def _probe_until_done(self, container_name, target):
+        deadline = time() + self._give_up_seconds
+        delay = self._initial_delay_seconds
+        while not target.done.is_set():
+            if self.probe(target.route):
+                target.state = READY
+                target.ready.set()
+                break
+            if time() + delay > deadline:
+                logger.warn('{} not ready after {}s; giving up'.format(
+                    container_name, self._give_up_seconds))
+                target.state = FAILED
+                break
+            target.done.wait(delay)
+            delay = min(delay * 2, self._max_delay_seconds)
+        self._finish(target)
+
+
+DEFAULT_PROBER = ReadinessProber()
@@ -7,7 +7,9 @@ from collections import namedtuple
 from sys import version_info
 
 from django.conf.urls import url
-from django.http import HttpResponse
+from django.http import (HttpResponse, HttpResponseBadRequest,
+                         HttpResponseNotFound, StreamingHttpResponse)
+from django.middleware.csrf import CsrfViewMiddleware
 from django.template.backends.django import DjangoTemplates
 from django.views.decorators.csrf import csrf_exempt as csrf_exempt_decorator
 from django.views.defaults import page_not_found
@@ -17,6 +19,11 @@ from revproxy.views import ProxyView
 from urllib3.exceptions import MaxRetryError
 
 from django_docker_engine.historian import FileHistorian
+from django_docker_engine.metrics import DEFAULT_METRICS, lookup_counters
+from django_docker_engine.prober import DEFAULT_PROBER, STARTING
+from django_docker_engine.route_cache import DEFAULT_ROUTE_CACHE
+from django_docker_engine.tracing import DockerCallTracer
+from django_docker_engine.upstream_pool import UpstreamPool
 
 from .container_managers.docker_engine import DockerEngineManagerError
 from .docker_utils import DockerClientWrapper
@@ -45,20 +52,66 @@ class _AnonUser():  # pragma: no cover
         return True
 
 
+class _PooledProxyView(ProxyView):
+    upstream_pool = None
+
+    def __init__(self, *args, **kwargs):
+        super(_PooledProxyView, self).__init__(*args, **kwargs)
+        if self.upstream_pool is not None:
+            self.http = self.upstream_pool
+
+
 class Proxy():
     def __init__(self,
                  historian=FileHistorian(),
                  please_wait_title='Please wait',
                  please_wait_body_html='<h1>Please wait</h1>',
                  csrf_exempt=True,
-                 logs_path=None):
+                 logs_path=None,
+                 route_cache=DEFAULT_ROUTE_CACHE,
+                 max_connections_per_container=10,
+                 upstream_idle_seconds=60,
+                 connect_timeout_seconds=None,
+                 read_timeout_seconds=None,
+                 prober=DEFAULT_PROBER,
+                 park_seconds=0,
+                 metrics=DEFAULT_METRICS,
+                 metrics_path=None,
+                 trace_docker_calls=False):
+        """
+        :param park_seconds: If the prober knows a container is starting,
+        hold requests for it up to this long, and proxy them as soon as it is
+        ready, rather than answering please-wait at once. Under WSGI, each
+        parked request holds a worker thread; AsyncProxy holds none.
+        :param metrics: Metrics, to record proxied requests, please-wait
+        responses, and Docker calls; or None.
+        :param metrics_path: If given, the metrics are served at this path,
+        in the Prometheus text format.
+        :param trace_docker_calls: If True, log a summary of the Docker calls
+        made for each proxied request which needed any.
+        """
         self.historian = historian
+        self.route_cache = route_cache
+        self.prober = prober
+        self.park_seconds = park_seconds
+        self.upstream_pool = UpstreamPool(
+            max_connections_per_container=max_connections_per_container,
+            idle_seconds=upstream_idle_seconds,
+            connect_timeout_seconds=connect_timeout_seconds,
+            read_timeout_seconds=read_timeout_seconds)
         self.csrf_exempt = csrf_exempt
         self.content = self._render({
             'title': please_wait_title,
             'body_html': please_wait_body_html
         })
         self.logs_path = logs_path
+        self.metrics = metrics
+        self.metrics_path = metrics_path
+        self.trace_docker_calls = trace_docker_calls
+        if metrics is not None:
+            metrics.add_collector(
+                ('route_cache', id(route_cache)),
+                lambda: lookup_counters('route', route_cache), 'counter')
 
     def _render(self, context):
         template_path = os.path.join(
@@ -81,44 +134,113 @@ class Proxy():
             csrf_exempt_decorator(self._proxy_view) if self.csrf_exempt
             else self._proxy_view
         )
+        patterns = [proxy_url]
         if self.logs_path:
-            return [
-                url(
-                    r'^(?P<container_name>[^/]*)/{}$'.format(self.logs_path),
-                    csrf_exempt_decorator(self._logs_view) if self.csrf_exempt
-                    else self._logs_view
-                ),
-                proxy_url
-            ]
-        return [proxy_url]
-
-    def _internal_proxy_view(self, request, container_url, path_url):
+            patterns.insert(0, url(
+                r'^(?P<container_name>[^/]*)/{}$'.format(self.logs_path),
+                csrf_exempt_decorator(self._logs_view) if self.csrf_exempt
+                else self._logs_view
+            ))
+        if self.metrics_path:
+            patterns.insert(0, url(
+                r'^{}$'.format(self.metrics_path), self._metrics_view))
+        return patterns
+
+    def _internal_proxy_view(self, request, container_name,
+                             container_url, path_url):
         # Any dependencies on the 3rd party proxy should be contained here.
         try:  # pragma: no cover
-            view = ProxyView.as_view(
+            view = _PooledProxyView.as_view(
                 upstream=container_url,
+                upstream_pool=self.upstream_pool,
                 add_remote_user=True)
             if not hasattr(request, 'user'):
                 request.user = _AnonUser()
             return view(request, path=path_url)
         except MaxRetryError as e:  # pragma: no cover
             logger.info('Normal transient error: %s', e)
+            self.route_cache.invalidate(container_name)
+            self.upstream_pool.discard(container_url)
             view = self._please_wait_view_factory(e).as_view()
             return view(request)
 
+    def _lookup_route(self, container_name):
+        route = self.route_cache.get(container_name)
+        if route is None:
+            route = self._fetch_route(container_name)
+        return route
+
+    def _fetch_route(self, container_name):
+        route = self._client().lookup_container_route(container_name)
+        self.route_cache.put(container_name, route)
+        return route
+
+    def _client(self):
+        return DockerClientWrapper(metrics=self.metrics)
+
+    def dispatch(self, request, container_name, url):
+        """
+        Serves a request for a container, as url_patterns() would, for
+        callers which route by other means: The logs, if url is logs_path,
+        or else the proxied response. Unless csrf_exempt, the request is
+        checked as CsrfViewMiddleware would, first.
+        """
+        if self.logs_path and url == self.logs_path:
+            (view, view_kwargs) = (self._logs_view, {})
+        else:
+            (view, view_kwargs) = (self._proxy_view, {'url': url})
+        if not self.csrf_exempt:
+            rejected = CsrfViewMiddleware().process_view(
+                request, view, (), view_kwargs)
+            if rejected is not None:
+                return rejected
+        return view(request, container_name, **view_kwargs)
+
+    def _starting_view(self, request, container_name):
+        """
+        Returns the please-wait page if the prober knows the container is
+        still starting, so there is no need to try to connect, and it does
+        not become ready while parked; else None.
+        """
+        if self.prober is None or \
+                self.prober.state(container_name) != STARTING:
+            return None
+        if self.park_seconds and self.prober.wait(
+                container_name, timeout=self.park_seconds):
+            return None
+        view = self._please_wait_view_factory('Starting').as_view()
+        return view(request)
+
     def _proxy_view(self, request, container_name, url):
+        if not self.trace_docker_calls:
+            return self._untraced_proxy_view(request, container_name, url)
+        with DockerCallTracer(label=container_name) as tracer:
+            response = self._untraced_proxy_view(request, container_name, url)
+        if tracer.calls:
+            logger.info(tracer.summary())
+        return response
+
+    def _untraced_proxy_view(self, request, container_name, url):
+        starting = self._starting_view(request, container_name)
+        if starting is not None:
+            return starting
         try:  # pragma: no cover
-            client = DockerClientWrapper()
-            self.historian.record(
-                client.lookup_container_id(container_name), url)
-            container_url = client.lookup_container_url(container_name)
-            return self._internal_proxy_view(request, container_url, url)
+            route = self._lookup_route(container_name)
+            self.historian.record(route.id, url)
+            if self.metrics is None:
+                return self._internal_proxy_view(
+                    request, container_name, route.url, url)
+            with self.metrics.timed('proxy_request_seconds', (
+                    ('image', route.image or ''),)):
+                return self._internal_proxy_view(
+                    request, container_name, route.url, url)
         except (DockerEngineManagerError, NotFound, BadStatusLine) as e:
             # TODO: Can we reproduce any of these?
             # Make tests if so, and move to _internal_proxy_view
             logger.info(
                 'Normal transient error. '
                 'Container: %s, Exception: %s', container_name, e)
+            self.route_cache.invalidate(container_name)
             view = self._please_wait_view_factory(e).as_view()
             return view(request)
         except socket.error as e:  # pragma: no cover
@@ -127,6 +249,7 @@ class Proxy():
             logger.info(
                 'Container not yet listening. '
                 'Container: %s, Exception: %s', container_name, e)
+            self.route_cache.invalidate(container_name)
             view = self._please_wait_view_factory(e).as_view()
             return view(request)
         except HTTPError as e:  # pragma: no cover
@@ -136,6 +259,11 @@ class Proxy():
             # but this seems ok.
 
     def _please_wait_view_factory(self, message):
+        if self.metrics is not None:
+            reason = message.__class__.__name__ \
+                if isinstance(message, Exception) else message
+            self.metrics.inc('please_wait_total', (('reason', reason),))
+
         class PleaseWaitView(View):
             def get(inner_self, request, *args, **kwargs):  # noqa: N805
                 response = HttpResponse(self.content)
@@ -149,8 +277,42 @@ class Proxy():
         return PleaseWaitView
 
     def _logs_view(self, request, container_name):
+        """
+        Streams the logs. Query parameters:
+        tail: Number of lines from the end, or "all".
+        since, until: Unix timestamps.
+        follow: If "true", keep the response open for new lines.
+        """
+        try:
+            logs_kwargs = _logs_kwargs(request.GET)
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e), content_type='text/plain')
         try:
-            logs = DockerClientWrapper().logs(container_name)
-        except:
-            logs = traceback.format_exc()
-        return HttpResponse(logs, content_type='text/plain')
+            logs = self._client().logs(
+                container_name, stream=True, **logs_kwargs)
+        except NotFound as e:
+            return HttpResponseNotFound(str(e), content_type='text/plain')
+        except Exception:
+            logger.exception('Logs failed. Container: %s', container_name)
+            return HttpResponse(
+                traceback.format_exc(), content_type='text/plain', status=500)
+        return StreamingHttpResponse(logs, content_type='text/plain')
+
+    def _metrics_view(self, request):
+        return HttpResponse(
+            self.metrics.render() if self.metrics is not None else '',
+            content_type='text/plain; version=0.0.4')
+
+
+def _logs_kwargs(query):
+    logs_kwargs = {}
+    tail = query.get('tail')
+    if tail is not None:
+        logs_kwargs['tail'] = tail if tail == 'all' else int(tail)
+    for key in ['since', 'until']:
+        value = query.get(key)
+        if value is not None:
+            logs_kwargs[key] = int(float(value))
+    # Always given: If not, the SDK follows whenever it streams.
+    logs_kwargs['follow'] = query.get('follow', '').lower() in ['1', 'true']
+    return logs_kwargs
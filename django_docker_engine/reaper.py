@@ -0,0 +1,52 @@
+import logging
+import threading
+from shutil import rmtree
+from sys import version_info
+
+if version_info >= (3,):  # pragma: no cover
+    from queue import Queue
+else:  # pragma: no cover
+    from Queue import Queue
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+
+class MountReaper():
+    """
+    Deletes directories from a background thread, so that disk cleanup
+    after a container is removed does not hold up the caller.
+    The thread is started on first use.
+    """
+
+    def __init__(self):
+        self._queue = Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def reap(self, directory):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work)
+                self._thread.daemon = True
+                self._thread.start()
+        self._queue.put(directory)
+
+    def join(self):
+        """
+        Blocks until everything queued so far has been deleted.
+        """
+        self._queue.join()
+
+    def _work(self):
+        while True:
+            directory = self._queue.get()
+            try:
+                rmtree(directory, ignore_errors=True)
+            except Exception as e:  # pragma: no cover
+                logger.warn('Failed to remove %s: %s', directory, e)
+            finally:
+                self._queue.task_done()
+
+
+DEFAULT_REAPER = MountReaper()
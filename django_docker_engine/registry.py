@@ -0,0 +1,243 @@
+import logging
+import re
+import threading
+from collections import namedtuple
+from time import sleep, time
+
+import docker
+import docker.errors
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+_MEM_RESERVATION_MB = '.mem_reservation_mb'
+
+# Any of these may change something we track, so the container is
+# re-inspected. Everything else (exec_*, attach, top...) is ignored.
+_REFRESH_ACTIONS = {
+    'create', 'start', 'restart', 'die', 'stop', 'kill', 'oom',
+    'pause', 'unpause', 'rename', 'update'
+}
+_REMOVE_ACTIONS = {'destroy'}
+
+
+class RegistryEntry(namedtuple('RegistryEntry', [
+        'id', 'name', 'state', 'port', 'mem_reservation_mb', 'host_port',
+        'container'])):
+    """
+    What we know about one labelled container. "container" is the Docker SDK
+    Container, as of the last time it was inspected.
+    """
+    __slots__ = ()
+
+
+class ContainerRegistry():
+    """
+    In-memory table of the containers carrying the root label. After one
+    initial list, it is kept current by following the Docker events stream
+    in a background thread, so lookups do not need to hit the daemon.
+    """
+
+    def __init__(self, root_label, client=None, retry_seconds=5):
+        """
+        :param string root_label:
+        :param client: A DockerClient; defaults to docker.from_env().
+        :param retry_seconds: Pause before reconnecting to the events stream.
+        """
+        self._root_label = root_label
+        self._client = docker.from_env() if client is None else client
+        self._retry_seconds = retry_seconds
+        self._entries = {}  # id -> RegistryEntry
+        self._observed_mb = {}  # id -> MB, from a MemorySampler
+        self._ids_by_name = {}
+        self._lock = threading.Lock()
+        self._synced = False
+        self._stopped = threading.Event()
+        self._events = None
+        self._thread = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def synced(self):
+        """
+        False until the first list completes, and again whenever the events
+        stream has been interrupted and we may have missed something.
+        """
+        return self._synced
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._watch)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        events = self._events
+        if events is not None and hasattr(events, 'close'):
+            events.close()
+
+    def sync(self):
+        """
+        Rebuild the whole table from a single list call.
+        """
+        containers = self._client.containers.list(
+            all=True, filters={'label': self._root_label})
+        entries = [self._entry(container) for container in containers]
+        with self._lock:
+            self._entries = {entry.id: entry for entry in entries}
+            self._ids_by_name = {entry.name: entry.id for entry in entries}
+            self._observed_mb = {
+                container_id: mb for (container_id, mb)
+                in self._observed_mb.items() if container_id in self._entries}
+            self._synced = True
+
+    def refresh(self, container_id):
+        """
+        Re-inspect a single container, dropping it if it is gone.
+        """
+        try:
+            container = self._client.containers.get(container_id)
+        except docker.errors.NotFound:
+            self.remove(container_id)
+        else:
+            self._put(self._entry(container))
+
+    def remove(self, container_id):
+        with self._lock:
+            entry = self._entries.pop(container_id, None)
+            self._observed_mb.pop(container_id, None)
+            if entry is not None \
+                    and self._ids_by_name.get(entry.name) == container_id:
+                del self._ids_by_name[entry.name]
+
+    def handle_event(self, event):
+        action = event.get('Action') or event.get('status') or ''
+        action = action.split(':')[0]  # eg. "health_status: healthy"
+        container_id = event.get('id') or event.get('Actor', {}).get('ID')
+        if container_id is None:  # pragma: no cover
+            return
+        if action in _REMOVE_ACTIONS:
+            self.remove(container_id)
+        elif action in _REFRESH_ACTIONS:
+            self.refresh(container_id)
+
+    def get(self, name_or_id):
+        """
+        :param name_or_id:
+        :return: RegistryEntry, or None if the container is not known.
+        """
+        with self._lock:
+            container_id = self._ids_by_name.get(name_or_id, name_or_id)
+            entry = self._entries.get(container_id)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def set_observed_mb(self, container_id, mb):
+        with self._lock:
+            if container_id in self._entries:
+                self._observed_mb[container_id] = mb
+
+    def observed_mb(self, container_id):
+        """
+        :return: The memory the container was last seen using, or None.
+        """
+        with self._lock:
+            return self._observed_mb.get(container_id)
+
+    def entries(self):
+        with self._lock:
+            return list(self._entries.values())
+
+    def list(self, filters={}):
+        """
+        :param dict filters: The subset of SDK filters which can be evaluated
+        in memory: "label", "name", "id", and "status".
+        :return: List of Docker SDK Containers, or None if the filters
+        can not be handled here, and the caller should ask the daemon.
+        """
+        matchers = []
+        for (key, value) in filters.items():
+            values = value if isinstance(value, list) else [value]
+            matcher = _MATCHERS.get(key)
+            if matcher is None:
+                return None
+            matchers.extend(
+                (lambda entry, m=matcher, v=v: m(entry, v)) for v in values)
+        return [
+            entry.container for entry in self.entries()
+            if all(match(entry) for match in matchers)
+        ]
+
+    def _put(self, entry):
+        with self._lock:
+            previous = self._entries.get(entry.id)
+            if previous is not None and previous.name != entry.name:
+                self._ids_by_name.pop(previous.name, None)  # renamed
+            self._entries[entry.id] = entry
+            self._ids_by_name[entry.name] = entry.id
+
+    def _entry(self, container):
+        labels = container.attrs['Config']['Labels'] or {}
+        port = labels.get(self._root_label + '.port')
+        mem_string = labels.get(self._root_label + _MEM_RESERVATION_MB)
+        try:
+            mem_reservation_mb = int(mem_string)
+        except (TypeError, ValueError):
+            mem_reservation_mb = None
+        host_port = None
+        port_infos = container.attrs.get(
+            'NetworkSettings', {}).get('Ports') or {}
+        port_info = port_infos.get('{}/tcp'.format(port))
+        if port_info:
+            host_port = port_info[0]['HostPort']
+        return RegistryEntry(
+            id=container.id,
+            name=container.name,
+            state=container.attrs['State']['Status'],
+            port=port,
+            mem_reservation_mb=mem_reservation_mb,
+            host_port=host_port,
+            container=container
+        )
+
+    def _watch(self):
+        while not self._stopped.is_set():
+            try:
+                # Subscribe from before the list, so nothing falls between.
+                since = int(time())
+                self.sync()
+                self._events = self._client.events(
+                    since=since, decode=True,
+                    filters={'type': 'container', 'label': self._root_label})
+                for event in self._events:
+                    self.handle_event(event)
+                    if self._stopped.is_set():
+                        break
+            except Exception as e:  # pragma: no cover
+                logger.warn('Docker events stream interrupted: %s', e)
+            self._synced = False
+            if not self._stopped.is_set():  # pragma: no cover
+                sleep(self._retry_seconds)
+
+
+def _match_label(entry, value):
+    labels = entry.container.labels
+    (key, _, expected) = value.partition('=')
+    if key not in labels:
+        return False
+    return not expected or labels[key] == expected
+
+
+_MATCHERS = {
+    'label': _match_label,
+    # Docker matches the name as a regex against the name with its '/'.
+    'name': lambda entry, value: re.search(value, '/' + entry.name),
+    'id': lambda entry, value: entry.id.startswith(value),
+    'status': lambda entry, value: entry.state == value
+}
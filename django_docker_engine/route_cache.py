@@ -0,0 +1,67 @@
+import threading
+from collections import OrderedDict
+from time import time
+
+
+class RouteCache():
+    """
+    Bounded, TTL-based cache of container name -> ContainerRoute,
+    so that steady-state proxying does not need to inspect the container
+    on every request. Entries are dropped explicitly when a container is
+    killed, and should be dropped by the caller when the upstream stops
+    answering, since the container may have been replaced.
+    """
+
+    def __init__(self, max_size=1000, ttl_seconds=30):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._routes = OrderedDict()  # name -> (expires, route)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, container_name):
+        """
+        :param container_name:
+        :return: The cached route, or None if missing or expired.
+        """
+        with self._lock:
+            entry = self._routes.pop(container_name, None)
+            if entry is None or entry[0] < time():
+                self.misses += 1
+                return None
+            self._routes[container_name] = entry  # Now most recently used.
+            self.hits += 1
+            return entry[1]
+
+    def put(self, container_name, route):
+        with self._lock:
+            self._routes.pop(container_name, None)
+            self._routes[container_name] = (time() + self.ttl_seconds, route)
+            while len(self._routes) > self.max_size:
+                self._routes.popitem(last=False)
+
+    def invalidate(self, container_name=None, container_id=None):
+        """
+        Drops any entry matching either the container name or the id.
+        """
+        with self._lock:
+            self._routes.pop(container_name, None)
+            if container_id is not None:
+                stale = [name for (name, (expires, route))
+                         in self._routes.items()
+                         if route.id == container_id]
+                for name in stale:
+                    del self._routes[name]
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+
+    def __len__(self):
+        return len(self._routes)
+
+
+# Shared by default, so that kills in this process invalidate the routes
+# used by the proxy in this process. Other processes rely on the TTL.
+DEFAULT_ROUTE_CACHE = RouteCache()
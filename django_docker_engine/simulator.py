@@ -0,0 +1,151 @@
+"""
+Replays recorded traffic against DockerClientRunWrapper over a
+SimulatedManager, on a virtual clock, to see how eviction would behave
+with a given memory limit, without Docker, and faster than real time.
+"""
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+from django_docker_engine.container_managers.simulated import SimulatedManager
+from django_docker_engine.docker_utils import (DockerClientRunWrapper,
+                                               DockerClientSpec,
+                                               DockerContainerSpec)
+from django_docker_engine.historian import SqliteHistorian, _epoch
+
+TraceEvent = namedtuple('TraceEvent', ['timestamp', 'container_name', 'url'])
+
+SimulationReport = namedtuple('SimulationReport', [
+    'requests',  # Number of events replayed
+    'launches',  # First launches of a container
+    'relaunches',  # Launches of a container which had been evicted
+    'evictions',  # Containers removed to make room
+    'freed_mb',  # Memory freed by those removals
+    'launch_seconds',  # Total time spent in run(), on the virtual clock
+    'added_launch_seconds'  # Of that, the time spent on relaunches
+])
+
+
+class VirtualClock():
+    """
+    sleep() advances the time, rather than waiting.
+    """
+
+    def __init__(self, now=0):
+        self._now = now
+        self._lock = threading.Lock()
+
+    def time(self):
+        return self._now
+
+    def sleep(self, seconds):
+        with self._lock:
+            self._now += seconds
+
+    def advance_to(self, timestamp):
+        with self._lock:
+            self._now = max(self._now, timestamp)
+
+
+class _NullReaper():
+
+    def reap(self, directory):
+        pass
+
+
+def trace_from_historian(historian, container_ids):
+    """
+    :param historian: FileHistorian or SqliteHistorian with the recorded
+    requests.
+    :param container_ids: The containers to include.
+    :return: List of TraceEvents, in time order. The first request to each
+    container stands for its launch.
+    """
+    events = []
+    for container_id in container_ids:
+        for (timestamp, url) in historian.list(container_id):
+            events.append(TraceEvent(
+                _epoch(_parse_isoformat(timestamp)), container_id, url))
+    return sorted(events)
+
+
+def _parse_isoformat(timestamp):
+    return datetime.strptime(
+        timestamp, '%Y-%m-%dT%H:%M:%S.%f' if '.' in timestamp
+        else '%Y-%m-%dT%H:%M:%S')
+
+
+def simulate(trace, mem_limit_mb,
+             mem_reservation_mb=lambda container_name: 100,
+             run_seconds=2, inspect_seconds=0.01, remove_seconds=0.5,
+             list_seconds=0.05, wrapper_class=DockerClientRunWrapper,
+             **wrapper_kwargs):
+    """
+    :param trace: TraceEvents, in time order.
+    :param mem_limit_mb: The limit to simulate.
+    :param mem_reservation_mb: Function from container name to its
+    reservation.
+    :param run_seconds, inspect_seconds, remove_seconds, list_seconds:
+    Latencies of the simulated Docker Engine.
+    :param wrapper_class: To compare eviction policies, a subclass of
+    DockerClientRunWrapper, constructed with wrapper_kwargs.
+    :return: SimulationReport
+    """
+    clock = VirtualClock(trace[0].timestamp if trace else 0)
+    managers = []
+
+    def manager_class(root_label, **kwargs):
+        manager = SimulatedManager(
+            root_label, clock=clock, run_seconds=run_seconds,
+            inspect_seconds=inspect_seconds, remove_seconds=remove_seconds,
+            list_seconds=list_seconds, **kwargs)
+        managers.append(manager)
+        return manager
+    wrapper_kwargs.setdefault('historian', SqliteHistorian(path=':memory:'))
+    wrapper_kwargs.setdefault('reaper', _NullReaper())
+    wrapper_kwargs.setdefault('max_kill_workers', 1)
+    # Removals one at a time, so their latencies add up on the clock.
+    wrapper = wrapper_class(
+        DockerClientSpec(do_input_json_envvar=True),
+        manager_class=manager_class,
+        mem_limit_mb=mem_limit_mb,
+        **wrapper_kwargs)
+    (manager,) = managers
+    historian = wrapper_kwargs['historian']
+
+    launched = set()
+    live_ids = {}
+    counts = {'launches': 0, 'relaunches': 0}
+    launch_seconds = 0
+    added_launch_seconds = 0
+    for event in trace:
+        clock.advance_to(event.timestamp)
+        name = event.container_name
+        container_id = live_ids.get(name)
+        if container_id is None or not manager.is_running(container_id):
+            start = clock.time()
+            wrapper.run(DockerContainerSpec(
+                image_name='simulated', container_name=name,
+                mem_reservation_mb=mem_reservation_mb(name), labels={}))
+            elapsed = clock.time() - start
+            launch_seconds += elapsed
+            if name in launched:
+                counts['relaunches'] += 1
+                added_launch_seconds += elapsed
+            else:
+                counts['launches'] += 1
+                launched.add(name)
+            live_ids[name] = wrapper.lookup_container_id(name)
+        historian.record(
+            live_ids[name], event.url,
+            timestamp=datetime.fromtimestamp(clock.time()))
+
+    return SimulationReport(
+        requests=len(trace),
+        launches=counts['launches'],
+        relaunches=counts['relaunches'],
+        evictions=len(manager.removed),
+        freed_mb=sum(wrapper._mem_reservation_mb(container)
+                     for container in manager.removed),
+        launch_seconds=launch_seconds,
+        added_launch_seconds=added_launch_seconds)
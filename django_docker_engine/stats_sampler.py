@@ -0,0 +1,116 @@
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+_MB = 1024 * 1024
+
+
+class MemorySampler():
+    """
+    Periodically asks the Docker Engine how much memory each running
+    container really uses, so that admission and eviction need not trust
+    the mem_reservation_mb labels, which are only guesses. Page cache which
+    the kernel can reclaim is not counted.
+    """
+
+    def __init__(self, list_containers, interval_seconds=30, max_workers=8,
+                 registry=None):
+        """
+        :param list_containers: Returns the SDK Containers to sample, eg.
+        DockerClientWrapper.list.
+        :param interval_seconds: Pause between samples, once started.
+        :param max_workers: Containers sampled at once: Each sample is a
+        separate request, which can take a second or two.
+        :param registry: Optional ContainerRegistry: If given, observations
+        are kept there, beside the rest of what is known about each
+        container, rather than here.
+        """
+        self._list_containers = list_containers
+        self.interval_seconds = interval_seconds
+        self._max_workers = max_workers
+        self._registry = registry
+        self._observed = {}  # container_id -> MB
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Samples every interval_seconds, from a background thread.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._sample_periodically)
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def observed_mb(self, container_id):
+        """
+        :return: Memory in use at the last sample, or None if the container
+        has not been sampled.
+        """
+        if self._registry is not None:
+            return self._registry.observed_mb(container_id)
+        with self._lock:
+            return self._observed.get(container_id)
+
+    def sample(self):
+        """
+        One round of samples, in this thread.
+
+        :return: {container_id: MB} for the containers sampled.
+        """
+        containers = [container for container in self._list_containers()
+                      if container.status == 'running']
+        if len(containers) > 1:
+            pool = ThreadPool(min(self._max_workers, len(containers)))
+            try:
+                usage = pool.map(_usage_mb, containers)
+            finally:
+                pool.close()
+        else:
+            usage = [_usage_mb(container) for container in containers]
+        observed = {container.id: mb
+                    for (container, mb) in zip(containers, usage)
+                    if mb is not None}
+        if self._registry is not None:
+            for (container_id, mb) in observed.items():
+                self._registry.set_observed_mb(container_id, mb)
+        else:
+            with self._lock:
+                self._observed = observed
+        return observed
+
+    def _sample_periodically(self):
+        while True:
+            try:
+                self.sample()
+            except Exception as e:  # pragma: no cover
+                logger.warn('Failed to sample memory: %s', e)
+            if self._stopped.wait(self.interval_seconds):
+                return
+
+
+def _usage_mb(container):
+    try:
+        stats = container.stats(stream=False)
+    except Exception as e:
+        logger.info('No stats for %s: %s', container.name, e)
+        return None
+    memory = stats.get('memory_stats') or {}
+    usage = memory.get('usage')
+    if usage is None:
+        return None
+    details = memory.get('stats') or {}
+    # cgroup v2 reports inactive_file; v1, total_inactive_file or cache.
+    for key in ['inactive_file', 'total_inactive_file', 'cache']:
+        if key in details:
+            usage -= details[key]
+            break
+    return max(usage, 0) / float(_MB)
@@ -0,0 +1,168 @@
+"""
+Records each HTTP call the Docker SDK makes to the daemon, with the code
+that caused it, so that hidden fan-out (an inspect for each container in a
+list, a get for each victim of an eviction) shows up in tests and logs.
+
+Nothing is recorded, and the SDK is not touched, until a DockerCallTracer
+is first entered.
+"""
+import logging
+import sys
+import threading
+from collections import namedtuple
+from functools import wraps
+from time import time
+
+import docker
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+DockerCall = namedtuple('DockerCall', [
+    'method',  # eg. "GET"
+    'path',  # eg. "/v1.35/containers/json?all=1"
+    'caller',  # "module:function:line" of the code outside the SDK
+    'seconds',
+    'sent_bytes',
+    'received_bytes'  # None for streamed responses
+])
+
+# Frames in these modules are skipped when looking for the caller.
+_SKIPPED_MODULES = ('docker.', 'requests.', 'urllib3.', 'http.', 'httplib',
+                    'django_docker_engine.tracing',
+                    'django_docker_engine.metrics')
+
+_local = threading.local()
+_instrumented = []
+_instrument_lock = threading.Lock()
+
+
+class DockerCallBudgetExceeded(Exception):
+    pass
+
+
+class DockerCallTracer():
+    """
+    Context manager which records the Docker calls made by this thread,
+    and by work it hands to _in_parallel, while it is active. Tracers can
+    be nested, and each records all the calls made inside it.
+    """
+
+    def __init__(self, budget=None, label=None):
+        """
+        :param budget: If given, leaving the context raises
+        DockerCallBudgetExceeded when more calls than this were made.
+        :param label: Identifies the traced code in the summary.
+        """
+        self.budget = budget
+        self.label = label
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        _instrument()
+        _active().append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        _active().remove(self)
+        if exc_type is None and self.budget is not None \
+                and len(self.calls) > self.budget:
+            raise DockerCallBudgetExceeded(
+                'Budget of {} exceeded: {}'.format(
+                    self.budget, self.summary()))
+
+    def record(self, call):
+        with self._lock:
+            self.calls.append(call)
+
+    def summary(self):
+        """
+        :return: One line with the count and total time, then one line for
+        each caller and method, most frequent first.
+        """
+        by_caller = {}
+        for call in list(self.calls):
+            key = (call.caller, call.method)
+            (count, seconds) = by_caller.get(key, (0, 0))
+            by_caller[key] = (count + 1, seconds + call.seconds)
+        lines = ['{}{} Docker calls in {:.3f}s'.format(
+            '{}: '.format(self.label) if self.label else '',
+            len(self.calls), sum(call.seconds for call in self.calls))]
+        for ((caller, method), (count, seconds)) in sorted(
+                by_caller.items(), key=lambda item: (-item[1][0], item[0])):
+            lines.append('  {} x{} in {:.3f}s from {}'.format(
+                method, count, seconds, caller))
+        return '\n'.join(lines)
+
+
+def propagate(f):
+    """
+    :return: f, wrapped so that calls it makes in another thread are
+    recorded by the tracers active in this one.
+    """
+    tracers = list(_active())
+    if not tracers:
+        return f
+
+    @wraps(f)
+    def traced(*args, **kwargs):
+        active = _active()
+        active.extend(tracers)
+        try:
+            return f(*args, **kwargs)
+        finally:
+            for tracer in tracers:
+                active.remove(tracer)
+    return traced
+
+
+def _active():
+    try:
+        return _local.tracers
+    except AttributeError:
+        _local.tracers = []
+        return _local.tracers
+
+
+def _instrument():
+    with _instrument_lock:
+        if _instrumented:
+            return
+        send = docker.APIClient.send
+
+        @wraps(send)
+        def traced_send(api_client, request, **kwargs):
+            tracers = _active()
+            if not tracers:
+                return send(api_client, request, **kwargs)
+            start = time()
+            response = send(api_client, request, **kwargs)
+            seconds = time() - start
+            if kwargs.get('stream'):
+                received_bytes = None
+            else:
+                received_bytes = len(response.content or b'')
+            call = DockerCall(
+                method=request.method,
+                path=request.path_url,
+                caller=_caller(),
+                seconds=seconds,
+                sent_bytes=len(request.body or b''),
+                received_bytes=received_bytes)
+            for tracer in list(tracers):
+                tracer.record(call)
+            return response
+        docker.APIClient.send = traced_send
+        _instrumented.append(send)
+
+
+def _caller():
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if not module.startswith(_SKIPPED_MODULES):
+            return '{}:{}:{}'.format(
+                module, frame.f_code.co_name, frame.f_lineno)
+        frame = frame.f_back
+    return None
@@ -0,0 +1,88 @@
+import threading
+from time import time
+
+import urllib3
+from urllib3.util.url import parse_url
+
+
+class UpstreamPool():
+    """
+    Keep-alive HTTP/1.1 connections to the containers, bounded per container,
+    with pools for containers which have gone idle closed and dropped.
+    Quacks enough like a urllib3.PoolManager to be used by the proxy view.
+    """
+
+    def __init__(self,
+                 max_connections_per_container=10,
+                 max_containers=100,
+                 idle_seconds=60,
+                 connect_timeout_seconds=None,
+                 read_timeout_seconds=None,
+                 pool_timeout_seconds=10):
+        """
+        :param max_connections_per_container: When this many connections to
+        one container are in use, further requests wait for one to free up.
+        :param max_containers: Pools for the least recently used containers
+        are closed beyond this.
+        :param idle_seconds: Pools unused for this long are closed.
+        :param connect_timeout_seconds: None to wait indefinitely.
+        :param read_timeout_seconds: None to wait indefinitely.
+        :param pool_timeout_seconds: How long to wait for a free connection.
+        """
+        self.idle_seconds = idle_seconds
+        self.pool_timeout_seconds = pool_timeout_seconds
+        self.pool_manager = urllib3.PoolManager(
+            num_pools=max_containers,
+            maxsize=max_connections_per_container,
+            block=True,
+            timeout=urllib3.Timeout(
+                connect=connect_timeout_seconds,
+                read=read_timeout_seconds)
+        )
+        self._last_used = {}  # (host, port) -> timestamp
+        self._next_sweep = time() + idle_seconds
+        self._lock = threading.Lock()
+
+    def urlopen(self, method, url, **kwargs):
+        (host, port) = self._host_port(url)
+        now = time()
+        self._last_used[(host, port)] = now
+        if now > self._next_sweep:
+            self.evict_idle(now)
+        kwargs.setdefault('pool_timeout', self.pool_timeout_seconds)
+        return self.pool_manager.urlopen(method, url, **kwargs)
+
+    def evict_idle(self, now=None):
+        """
+        Closes the pools of containers which have not been used recently.
+        """
+        now = time() if now is None else now
+        with self._lock:
+            self._next_sweep = now + self.idle_seconds
+            idle = [host_port for (host_port, last_used)
+                    in list(self._last_used.items())
+                    if now - last_used > self.idle_seconds]
+            for host_port in idle:
+                self._discard(*host_port)
+
+    def discard(self, url):
+        """
+        Closes the pool for this upstream, if any: Call this when the
+        container is gone, since the port may be reused by another.
+        """
+        with self._lock:
+            self._discard(*self._host_port(url))
+
+    def _discard(self, host, port):
+        self._last_used.pop((host, port), None)
+        for key in list(self.pool_manager.pools.keys()):
+            if (key.key_host, key.key_port) == (host, port):
+                # Removal from the container closes the pool.
+                del self.pool_manager.pools[key]
+
+    def _host_port(self, url):
+        parsed = parse_url(url)
+        return (parsed.host.lower(), parsed.port or 80)
+
+    def __len__(self):
+        return len(self.pool_manager.pools)
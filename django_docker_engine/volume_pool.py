@@ -0,0 +1,240 @@
+import calendar
+import errno
+import logging
+import os
+import threading
+import uuid
+from shutil import rmtree
+from sys import version_info
+from time import strptime, time
+
+if version_info >= (3,):  # pragma: no cover
+    from queue import Queue
+else:  # pragma: no cover
+    from Queue import Queue
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+
+_PREFIX = 'django-docker-pool-'
+_CLAIMED = '.claimed-'
+
+
+class VolumePool():
+    """
+    Docker volumes for extra_directories, recycled rather than created for
+    each launch and abandoned after each kill: A returned volume is wiped
+    from a background thread, and then kept for the next launch, or
+    removed if the pool is full. Pooled volumes are named with a common
+    prefix, so any process can recognize them, and labelled, so those
+    orphaned by a process that died can be found.
+
+    Docker labels can not be changed once a volume exists, so the pool
+    holding each volume, free or acquired, is recorded with its process id
+    in a lease file on the host. Another pool only reclaims a volume whose
+    holder's process is gone.
+    """
+
+    LEASE_DIR = '/tmp/django-docker-volume-leases'
+
+    def __init__(self, create_volume, remove_volume, list_volumes, label,
+                 max_size=10, lease_dir=LEASE_DIR, grace_seconds=300):
+        """
+        :param create_volume: Called with name and labels; returns a Volume.
+        :param remove_volume: Called with a volume name.
+        :param list_volumes: Called with filters; returns Volumes.
+        :param label: Label key marking pooled volumes.
+        :param max_size: Most clean volumes to keep.
+        :param lease_dir: Shared by every pool on the host.
+        :param grace_seconds: Volumes created or leased more recently than
+        this are never reclaimed, even if their holder seems to be gone.
+        """
+        self._create_volume = create_volume
+        self._remove_volume = remove_volume
+        self._list_volumes = list_volumes
+        self._label = label
+        self.max_size = max_size
+        self.lease_dir = lease_dir
+        self.grace_seconds = grace_seconds
+        self._owner = '{} {}'.format(os.getpid(), uuid.uuid4().hex)
+        self._free = []
+        self._lock = threading.Lock()
+        self._queue = Queue()
+        self._thread = None
+        try:
+            os.makedirs(lease_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:  # pragma: no cover
+                raise
+
+    def acquire(self):
+        """
+        :return: The name of a clean volume, created if none is free.
+        """
+        with self._lock:
+            name = self._free.pop() if self._free else None
+        if name is None:
+            name = self._create_volume(
+                name=_PREFIX + uuid.uuid4().hex,
+                labels={self._label: 'true'}).name
+        self._lease(name)
+        return name
+
+    @staticmethod
+    def owns(volume_name):
+        return volume_name is not None and volume_name.startswith(_PREFIX)
+
+    def release(self, volume_name, directory):
+        """
+        Call once the container using the volume has been removed.
+
+        :param directory: Where the volume's content is on the host.
+        """
+        self._submit(lambda: self._recycle(volume_name, directory))
+
+    def reclaim(self):
+        """
+        In the background, recycles pooled volumes which no container is
+        using, and which no live process holds: Those left behind by a
+        process which did not release them.
+        """
+        self._submit(self._reclaim)
+
+    def free_count(self):
+        with self._lock:
+            return len(self._free)
+
+    def join(self):
+        """
+        Blocks until everything queued so far has been done.
+        """
+        self._queue.join()
+
+    def _submit(self, task):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work)
+                self._thread.daemon = True
+                self._thread.start()
+        self._queue.put(task)
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            try:
+                task()
+            except Exception as e:  # pragma: no cover
+                logger.warn('Volume pool task failed: %s', e)
+            finally:
+                self._queue.task_done()
+
+    def _reclaim(self):
+        orphans = self._list_volumes(
+            {'label': self._label, 'dangling': True})
+        for volume in orphans:
+            if self._claim(volume):
+                self._recycle(volume.name, volume.attrs.get('Mountpoint'))
+
+    def _recycle(self, volume_name, directory):
+        if directory:
+            _wipe(directory)
+        with self._lock:
+            if len(self._free) < self.max_size:
+                self._free.append(volume_name)
+                keep = True
+            else:
+                keep = False
+        if keep:
+            self._lease(volume_name)
+            return
+        self._remove_volume(volume_name)
+        try:
+            os.remove(self._lease_path(volume_name))
+        except OSError:
+            pass
+
+    def _lease_path(self, volume_name):
+        return os.path.join(self.lease_dir, volume_name)
+
+    def _lease(self, volume_name):
+        path = self._lease_path(volume_name)
+        tmp_path = path + _CLAIMED + uuid.uuid4().hex
+        with open(tmp_path, 'w') as f:
+            f.write(self._owner)
+        os.rename(tmp_path, path)
+
+    def _claim(self, volume):
+        """
+        Takes the lease of a volume whose holder is gone, or which has none:
+        If several processes try at once, only one succeeds.
+
+        :return: True if this process now holds the volume.
+        """
+        path = self._lease_path(volume.name)
+        cutoff = time() - self.grace_seconds
+        try:
+            with open(path) as f:
+                owner = f.read()
+            pid = int(owner.split()[0])
+            leased_at = os.path.getmtime(path)
+        except (IOError, OSError, IndexError, ValueError):
+            owner = None
+        if owner is not None:
+            if owner == self._owner or _alive(pid) or leased_at > cutoff:
+                return False
+            stale_path = path + _CLAIMED + uuid.uuid4().hex
+            try:
+                os.rename(path, stale_path)
+            except OSError:
+                return False  # Another process took it first.
+            os.remove(stale_path)
+        elif created_at(volume) > cutoff:
+            return False  # Perhaps not leased yet.
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except OSError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            f.write(self._owner)
+        return True
+
+
+def created_at(volume):
+    """
+    :return: Seconds since the epoch, or 0 if unknown, so unknown volumes
+    count as old.
+    """
+    timestamp = volume.attrs.get('CreatedAt')
+    if not timestamp:
+        return 0
+    try:
+        return calendar.timegm(strptime(timestamp[:19], '%Y-%m-%dT%H:%M:%S'))
+    except ValueError:  # pragma: no cover
+        return 0
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def _wipe(directory):
+    """
+    Deletes what is in the directory, but not the directory.
+    """
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(directory, name)
+        if os.path.isdir(path) and not os.path.islink(path):
+            rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError as e:  # pragma: no cover
+                logger.warn('Failed to remove %s: %s', path, e)
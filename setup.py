@@ -34,7 +34,7 @@ setup(
     install_requires=[
         # Latest django does not work with python2.
         'django' if sys.version_info[0] > 2 else 'django<2.0',
-        'docker>=2.3.0',  # nano_cpus available with this release
+        'docker>=3.0.0',  # logs(until=...) available with this release
         'django-revproxy'
     ],
     packages=find_packages(exclude=['demo_*', 'tests']),
@@ -0,0 +1,245 @@
+"""
+Tests of async_proxy, which is Python 3 only: Imported by
+test_async_proxy, rather than found by test discovery.
+"""
+import asyncio
+import base64
+import hashlib
+import unittest
+
+from django.test import RequestFactory
+from mock import Mock
+
+from django_docker_engine.container_managers.docker_engine import \
+    ContainerRoute
+from django_docker_engine.prober import ReadinessProber
+from django_docker_engine.route_cache import RouteCache
+
+try:
+    from django_docker_engine.async_proxy import (AsyncProxy, encode_frame,
+                                                  read_frame)
+except ImportError:  # pragma: no cover
+    AsyncProxy = None  # Django < 3 does not bring asgiref.
+
+
+async def _http_upstream(reader, writer):
+    head = await reader.readuntil(b'\r\n\r\n')
+    request_line = head.split(b'\r\n')[0]
+    writer.write(
+        b'HTTP/1.1 200 OK\r\n'
+        b'Content-Type: text/plain\r\n'
+        b'Set-Cookie: flavor=chocolate; Path=/\r\n'
+        b'Transfer-Encoding: chunked\r\n\r\n' +
+        b'5\r\nhello\r\n' +
+        '{:x}\r\n'.format(len(request_line)).encode() + request_line +
+        b'\r\n0\r\n\r\n')
+    await writer.drain()
+    writer.close()
+
+
+async def _empty_upstream(reader, writer):
+    # Promises a body, but sends none, as for HEAD, or 204 with a length.
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = b'200 OK' if head.startswith(b'HEAD ') else b'204 No Content'
+    writer.write(b'HTTP/1.1 ' + status + b'\r\nContent-Length: 5\r\n\r\n')
+    await writer.drain()
+    writer.close()
+
+
+async def _large_upstream(reader, writer):
+    head = await reader.readuntil(b'\r\n\r\n')
+    if head.startswith(b'GET /chunked '):
+        writer.write(b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+                     b'6\r\nhello!\r\n0\r\n\r\n')
+    else:
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: 6\r\n\r\nhello!')
+    await writer.drain()
+    writer.close()
+
+
+async def _bad_websocket_upstream(reader, writer):
+    await _accept_websocket(reader, writer)
+    writer.write(encode_frame(0x1, b'\xff', mask=False))
+    await writer.drain()
+    await reader.read()
+
+
+async def _accept_websocket(reader, writer):
+    head = await reader.readuntil(b'\r\n\r\n')
+    headers = dict(
+        line.split(': ', 1) for line in head.decode().split('\r\n')[1:] if line)
+    accept = base64.b64encode(hashlib.sha1(
+        headers['Sec-WebSocket-Key'].encode() +
+        b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11').digest())
+    writer.write(
+        b'HTTP/1.1 101 Switching Protocols\r\n'
+        b'Upgrade: websocket\r\nConnection: Upgrade\r\n'
+        b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+
+
+async def _websocket_upstream(reader, writer):
+    await _accept_websocket(reader, writer)
+    while True:
+        (fin, opcode, payload) = await read_frame(reader)
+        if opcode == 0x8:
+            writer.close()
+            return
+        # Echo, in two fragments, to check reassembly:
+        writer.write(
+            bytes([opcode]) + encode_frame(opcode, payload[:1], mask=False)[1:])
+        writer.write(b'\x80' + encode_frame(0x0, payload[1:], mask=False)[1:])
+        await writer.drain()
+
+
+@unittest.skipIf(AsyncProxy is None, 'asgiref not available')
+class AsyncProxyTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.route_cache = RouteCache()
+        self.historian = Mock()
+        self.proxy = AsyncProxy(
+            historian=self.historian,
+            route_cache=self.route_cache)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def serve(self, handler):
+        server = self.loop.run_until_complete(
+            asyncio.start_server(handler, '127.0.0.1', 0))
+        port = server.sockets[0].getsockname()[1]
+        self.route_cache.put('container-name', ContainerRoute(
+            id='container-id', host='127.0.0.1', port=str(port)))
+        return server
+
+    def test_frame_round_trip(self):
+        for payload in [b'', b'x' * 125, b'x' * 126, b'x' * 70000]:
+            for mask in [True, False]:
+                reader = asyncio.StreamReader(loop=self.loop)
+                reader.feed_data(encode_frame(0x2, payload, mask=mask))
+                self.assertEqual(
+                    self.loop.run_until_complete(read_frame(reader)),
+                    (True, 0x2, payload))
+
+    def test_http(self):
+        server = self.serve(_http_upstream)
+        view = self.proxy.url_patterns()[-1].callback
+        response = self.loop.run_until_complete(view(
+            RequestFactory().get('/docker/container-name/path?q=1'),
+            container_name='container-name', url='path'))
+        server.close()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'helloGET /path?q=1 HTTP/1.1')
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertEqual(response.cookies['flavor'].value, 'chocolate')
+        self.historian.record.assert_called_with('container-id', 'path')
+
+    def test_http_without_body(self):
+        server = self.serve(_empty_upstream)
+        view = self.proxy.url_patterns()[-1].callback
+        for (request, status) in [
+                (RequestFactory().head('/docker/container-name/'), 200),
+                (RequestFactory().delete('/docker/container-name/'), 204)]:
+            response = self.loop.run_until_complete(view(
+                request, container_name='container-name', url=''))
+            self.assertEqual(response.status_code, status)
+            self.assertEqual(response.content, b'')
+            self.assertEqual(response['Content-Length'], '5')
+        server.close()
+
+    def test_http_too_large(self):
+        server = self.serve(_large_upstream)
+        self.proxy.max_body_bytes = 5
+        view = self.proxy.url_patterns()[-1].callback
+        for url in ['length', 'chunked']:
+            response = self.loop.run_until_complete(view(
+                RequestFactory().get('/docker/container-name/' + url),
+                container_name='container-name', url=url))
+            self.assertEqual(response.status_code, 502)
+        self.proxy.max_body_bytes = 6
+        response = self.loop.run_until_complete(view(
+            RequestFactory().get('/docker/container-name/chunked'),
+            container_name='container-name', url='chunked'))
+        server.close()
+        self.assertEqual(response.content, b'hello!')
+
+    def test_http_please_wait(self):
+        self.route_cache.put('container-name', ContainerRoute(
+            id='container-id', host='127.0.0.1', port='1'))
+        view = self.proxy.url_patterns()[-1].callback
+        response = self.loop.run_until_complete(view(
+            RequestFactory().get('/docker/container-name/'),
+            container_name='container-name', url=''))
+        self.assertEqual(response.status_code, 503)
+        self.assertIsNone(self.route_cache.get('container-name'))
+
+    def test_http_parked(self):
+        server = self.serve(_http_upstream)
+        route = self.route_cache.get('container-name')
+        self.proxy.prober = ReadinessProber(initial_delay_seconds=0.01)
+        self.proxy.park_seconds = 5
+        self.proxy.prober.watch('container-name', route)
+        # Starting, until the upstream answers the probe:
+        view = self.proxy.url_patterns()[-1].callback
+        response = self.loop.run_until_complete(view(
+            RequestFactory().get('/docker/container-name/path'),
+            container_name='container-name', url='path'))
+        server.close()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.proxy.prober.state('container-name'), 'ready')
+
+    def test_websocket(self):
+        server = self.serve(_websocket_upstream)
+        django_application = Mock()
+        application = self.proxy.asgi_application(django_application)
+        to_app = asyncio.Queue()
+        from_app = []
+
+        async def send(message):
+            from_app.append(message)
+            if message['type'] == 'websocket.send' and len(from_app) == 3:
+                await to_app.put({'type': 'websocket.disconnect',
+                                  'code': 1000})
+
+        for message in [
+                {'type': 'websocket.connect'},
+                {'type': 'websocket.receive', 'text': 'ping'},
+                {'type': 'websocket.receive', 'bytes': b'\x00\x01'}]:
+            to_app.put_nowait(message)
+        self.loop.run_until_complete(asyncio.wait_for(application(
+            {'type': 'websocket', 'path': '/docker/container-name/ws',
+             'query_string': b'', 'headers': []},
+            to_app.get, send), 5))
+        server.close()
+
+        self.assertEqual(from_app, [
+            {'type': 'websocket.accept', 'subprotocol': None},
+            {'type': 'websocket.send', 'text': 'ping'},
+            {'type': 'websocket.send', 'bytes': b'\x00\x01'}
+        ])
+        django_application.assert_not_called()
+
+    def test_websocket_error(self):
+        server = self.serve(_bad_websocket_upstream)
+        application = self.proxy.asgi_application(Mock())
+        to_app = asyncio.Queue()
+        to_app.put_nowait({'type': 'websocket.connect'})
+        from_app = []
+
+        async def send(message):
+            from_app.append(message)
+
+        with self.assertLogs('django_docker_engine.async_proxy') as logs:
+            self.loop.run_until_complete(asyncio.wait_for(application(
+                {'type': 'websocket', 'path': '/docker/container-name/ws',
+                 'query_string': b'', 'headers': []},
+                to_app.get, send), 5))
+        server.close()
+
+        self.assertIn('UnicodeDecodeError', logs.output[0])
+        self.assertEqual(from_app, [
+            {'type': 'websocket.accept', 'subprotocol': None},
+            {'type': 'websocket.close', 'code': 1011}
+        ])
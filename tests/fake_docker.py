@@ -0,0 +1,198 @@
+"""
+In-process stand-in for the parts of docker.DockerClient we use, so that
+the bookkeeping around the SDK can be tested without a Docker Engine.
+"""
+import hashlib
+import itertools
+import re
+
+import docker.errors
+from docker.models.containers import Container
+from docker.models.images import Image
+from docker.models.volumes import Volume
+
+_ids = itertools.count(1)
+
+
+class FakeContainer(Container):
+
+    def __init__(self, attrs, collection):
+        super(FakeContainer, self).__init__(attrs=attrs, collection=collection)
+        self.removed = False
+        self.log_bytes = b''
+
+    def remove(self, **kwargs):
+        self.collection.calls.append(('remove', self.id))
+        self.removed = True
+        self.collection._containers.pop(self.id, None)
+
+    def rename(self, name):
+        self.attrs['Name'] = '/' + name
+
+    def logs(self, **kwargs):
+        self.collection.calls.append(('logs', self.id))
+        return self.log_bytes
+
+    def reload(self):
+        pass
+
+
+class FakeContainersCollection():
+
+    def __init__(self, host_ports):
+        self._containers = {}
+        self._host_ports = host_ports
+        self.calls = []
+
+    def run(self, image, name=None, ports={}, labels={}, volumes={},
+            environment={}, **kwargs):
+        self.calls.append(('run', name))
+        container_id = 'id-{}'.format(next(_ids))
+        port_infos = {
+            port: [{'HostIp': '0.0.0.0',
+                    'HostPort': str(next(self._host_ports))}]
+            for port in ports
+        }
+        attrs = {
+            'Id': container_id,
+            'Name': '/' + (name or container_id),
+            'Config': {
+                'Image': image,
+                'Labels': dict(labels),
+                'Env': ['{}={}'.format(k, v)
+                        for (k, v) in environment.items()]
+            },
+            'State': {'Status': 'running',
+                      'StartedAt': '2018-01-01T00:00:00.000000000Z'},
+            'NetworkSettings': {'Ports': port_infos},
+            'Mounts': [
+                {'Type': 'bind', 'Source': source,
+                 'Destination': spec['bind'], 'RW': spec['mode'] == 'rw'}
+                if source.startswith('/') else
+                {'Type': 'volume', 'Name': source,
+                 'Source': '/fake-volumes/{}/_data'.format(source),
+                 'Destination': spec['bind'], 'RW': spec['mode'] == 'rw'}
+                for (source, spec) in volumes.items()
+            ],
+            'run_kwargs': kwargs
+        }
+        container = FakeContainer(attrs, self)
+        self._containers[container_id] = container
+        return container
+
+    def get(self, name_or_id):
+        self.calls.append(('get', name_or_id))
+        for container in self._containers.values():
+            if name_or_id in [container.id, container.name]:
+                return container
+        raise docker.errors.NotFound(
+            'No such container: {}'.format(name_or_id))
+
+    def list(self, all=False, filters={}):  # noqa: A002
+        self.calls.append(('list', None))
+        containers = list(self._containers.values())
+        label = filters.get('label')
+        if label:
+            (key, _, value) = label.partition('=')
+            containers = [c for c in containers if key in c.labels
+                          and (not value or c.labels[key] == value)]
+        name = filters.get('name')
+        if name:
+            containers = [c for c in containers
+                          if re.search(name, '/' + c.name)]
+        return containers
+
+
+class FakeVolumesCollection():
+
+    def __init__(self, containers=None):
+        self.volumes = {}
+        self._containers = containers
+
+    def create(self, name=None, driver=None, labels=None, **kwargs):
+        name = name or 'volume-{}'.format(next(_ids))
+        volume = Volume(attrs={
+            'Name': name, 'Labels': labels or {},
+            'Mountpoint': '/var/lib/docker/volumes/{}/_data'.format(name),
+            'CreatedAt': '2018-01-01T00:00:00Z'})
+        self.volumes[name] = volume
+        return volume
+
+    def get(self, name):
+        try:
+            return self.volumes[name]
+        except KeyError:
+            raise docker.errors.NotFound('No such volume: {}'.format(name))
+
+    def list(self, filters={}):
+        volumes = list(self.volumes.values())
+        label = filters.get('label')
+        if label:
+            volumes = [v for v in volumes if label in v.attrs['Labels']]
+        if filters.get('dangling') and self._containers is not None:
+            in_use = set(
+                mount.get('Name')
+                for container in self._containers._containers.values()
+                for mount in container.attrs['Mounts'])
+            volumes = [v for v in volumes if v.name not in in_use]
+        return volumes
+
+
+class FakeImagesCollection():
+
+    def __init__(self):
+        self.pulled = []
+
+    def pull(self, name, **kwargs):
+        self.pulled.append(name)
+        return self.get(name)
+
+    def get(self, name):
+        return Image(attrs={'Id': 'sha256:' + hashlib.sha256(
+            name.encode('utf-8')).hexdigest()})
+
+
+class FakeApi():
+
+    def __init__(self, base_url, containers, images, volumes):
+        self.base_url = base_url
+        self._containers = containers
+        self._images = images
+        self._volumes = volumes
+
+    def pull(self, repository, tag=None, stream=False, decode=False):
+        self._images.pulled.append('{}:{}'.format(repository, tag))
+        for current in [0, 50, 100]:
+            yield {'status': 'Downloading', 'id': 'layer',
+                   'progressDetail': {'current': current, 'total': 100}}
+        yield {'status': 'Status: Downloaded newer image'}
+
+    def remove_volume(self, name, force=False):
+        try:
+            del self._volumes.volumes[name]
+        except KeyError:
+            raise docker.errors.NotFound('No such volume: {}'.format(name))
+
+    def rename(self, container, name):
+        # By name only, like the real API for our purposes.
+        for fake in list(self._containers._containers.values()):
+            if fake.name == container:
+                fake.rename(name)
+                return
+        raise docker.errors.NotFound('No such container: {}'.format(container))
+
+
+class FakeDockerClient():
+
+    def __init__(self, base_url='http+docker://localunixsocket',
+                 first_host_port=32768):
+        self.containers = FakeContainersCollection(
+            itertools.count(first_host_port))
+        self.images = FakeImagesCollection()
+        self.volumes = FakeVolumesCollection(self.containers)
+        self.api = FakeApi(
+            base_url, self.containers, self.images, self.volumes)
+        self.event_list = []
+
+    def events(self, **kwargs):
+        return iter(self.event_list)
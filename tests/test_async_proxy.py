@@ -0,0 +1,5 @@
+from sys import version_info
+
+if version_info >= (3, 5):  # pragma: no cover
+    # Coroutines are a SyntaxError before Python 3.5:
+    from tests.async_proxy_tests import AsyncProxyTests  # noqa: F401
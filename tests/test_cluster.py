@@ -0,0 +1,151 @@
+import threading
+import unittest
+from functools import partial
+
+import docker.errors
+from mock import Mock
+
+from django_docker_engine.container_managers.cluster import (ClusterManager,
+                                                             NoEngineFits)
+from django_docker_engine.docker_utils import (DockerClientRunWrapper,
+                                               DockerClientSpec,
+                                               DockerContainerSpec)
+from django_docker_engine.historian import SqliteHistorian
+from tests.fake_docker import FakeDockerClient
+
+LABEL = 'io.github.refinery-project.django_docker_engine'
+
+
+class ClusterManagerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clients = [
+            FakeDockerClient(base_url='http://engine-a:2375',
+                             first_host_port=32768),
+            FakeDockerClient(base_url='http://engine-b:2375',
+                             first_host_port=42768)
+        ]
+        self.manager = ClusterManager(
+            LABEL, clients=self.clients, mem_limits_mb=[40, 40])
+
+    def run_container(self, name, mem_reservation_mb):
+        return self.manager.run(
+            'nginx:latest', name=name, ports={'80/tcp': None},
+            labels={LABEL: 'true', LABEL + '.port': '80',
+                    LABEL + '.mem_reservation_mb': str(mem_reservation_mb)})
+
+    def names_on(self, client):
+        return sorted(c.name for c in client.containers.list())
+
+    def test_best_fit(self):
+        for (name, mb) in [('a', 30), ('b', 20), ('c', 15), ('d', 10)]:
+            self.run_container(name, mb)
+        self.assertEqual(self.names_on(self.clients[0]), ['a', 'd'])
+        self.assertEqual(self.names_on(self.clients[1]), ['b', 'c'])
+        with self.assertRaises(NoEngineFits):
+            self.run_container('e', 10)
+        self.assertEqual(len(self.manager.list()), 4)
+
+    def test_listed_once(self):
+        self.run_container('a', 30)
+        self.run_container('b', 20)
+        self.assertEqual(
+            [call for client in self.clients
+             for call in client.containers.calls if call[0] == 'list'],
+            [('list', None)] * 2)
+
+        # Removed behind our back, so listed again once nothing fits:
+        self.clients[0].containers.get('a').remove()
+        self.run_container('c', 30)
+        self.assertEqual(self.names_on(self.clients[0]), ['c'])
+
+    def test_concurrent_placement(self):
+        started = threading.Event()
+        release = threading.Event()
+        run = self.clients[0].containers.run
+
+        def slow_run(*args, **kwargs):
+            started.set()
+            release.wait(5)
+            return run(*args, **kwargs)
+        self.clients[0].containers.run = slow_run
+        thread = threading.Thread(target=self.run_container, args=('a', 30))
+        thread.start()
+        self.assertTrue(started.wait(5))
+        # "a" is not listed yet, but its room is taken:
+        self.run_container('b', 30)
+        with self.assertRaises(NoEngineFits):
+            self.run_container('c', 30)
+        release.set()
+        thread.join()
+        self.assertEqual(self.names_on(self.clients[0]), ['a'])
+        self.assertEqual(self.names_on(self.clients[1]), ['b'])
+
+    def test_lookups_routed(self):
+        self.run_container('a', 30)
+        self.run_container('b', 20)
+        fresh = ClusterManager(LABEL, clients=self.clients)
+        self.assertEqual(fresh.get_url('a'), 'http://engine-a:32768')
+        self.assertEqual(fresh.get_url('b'), 'http://engine-b:42768')
+        self.assertEqual(
+            fresh.get_id('b'), self.clients[1].containers.get('b').id)
+        self.assertEqual(sorted(c.name for c in fresh.list()), ['a', 'b'])
+        with self.assertRaises(docker.errors.NotFound):
+            fresh.get_url('c')
+
+        self.clients[1].containers.get('b').log_bytes = b'hello'
+        self.assertEqual(fresh.logs('b'), b'hello')
+
+        fresh.rename('b', 'b2')
+        self.assertEqual(fresh.get_url('b2'), 'http://engine-b:42768')
+        with self.assertRaises(docker.errors.NotFound):
+            fresh.rename('b', 'b3')
+
+    def test_route_inspects_once(self):
+        self.run_container('a', 30)
+        del self.clients[0].containers.calls[:]
+        self.assertEqual(
+            self.manager.get_route('a').url, 'http://engine-a:32768')
+        self.assertEqual(self.clients[0].containers.calls, [('get', 'a')])
+
+    def test_placement_pruned(self):
+        self.run_container('a', 30)
+        self.clients[0].containers.get('a').remove()
+        self.manager.list()
+        self.assertEqual(self.manager._placement, {})
+
+    def test_deferred_volume_labelled(self):
+        volume = self.manager.create_volume(labels={LABEL + '.volume': 'true'})
+        self.manager.run(
+            'nginx:latest', name='a', ports={'80/tcp': None},
+            volumes={volume.name: {'bind': '/data', 'mode': 'rw'}},
+            labels={LABEL: 'true', LABEL + '.port': '80',
+                    LABEL + '.mem_reservation_mb': '30'})
+        self.assertEqual(
+            [v.name for v in self.manager.list_volumes(
+                {'label': LABEL + '.volume'})],
+            [volume.name])
+
+    def test_run_wrapper(self):
+        wrapper = DockerClientRunWrapper(
+            DockerClientSpec(do_input_json_envvar=True),
+            manager_class=partial(
+                ClusterManager, clients=self.clients, mem_limits_mb=[40, 40]),
+            historian=SqliteHistorian(path=':memory:'),
+            reaper=Mock(),
+            mem_limit_mb=80)
+        for name in ['a', 'b', 'c']:
+            url = wrapper.run(DockerContainerSpec(
+                image_name='nginx', container_name=name,
+                mem_reservation_mb=20, labels={},
+                extra_directories=['/data']))
+        self.assertEqual(url, 'http://engine-b:42768')
+        self.assertEqual(self.names_on(self.clients[0]), ['a', 'b'])
+        self.assertEqual(self.names_on(self.clients[1]), ['c'])
+        with self.assertRaises(NoEngineFits):
+            # Room is made overall, but not on any one engine:
+            wrapper.run(DockerContainerSpec(
+                image_name='nginx', container_name='d',
+                mem_reservation_mb=30, labels={}))
+        self.assertEqual(wrapper.lookup_container_url('c'),
+                         'http://engine-b:42768')
@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+from functools import partial
+from shutil import rmtree
+
+from mock import Mock
+
+from django_docker_engine.container_managers.docker_engine import \
+    DockerEngineManager
+from django_docker_engine.docker_utils import (DockerClientRunWrapper,
+                                               DockerClientSpec,
+                                               DockerContainerSpec)
+from django_docker_engine.garbage_collector import (GarbageCollector,
+                                                    GarbageReport)
+from django_docker_engine.historian import SqliteHistorian
+from django_docker_engine.input_store import InputStore
+from tests.fake_docker import FakeDockerClient
+
+
+class GarbageCollectorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.client = FakeDockerClient()
+        self.historian = SqliteHistorian(path=':memory:')
+        self.wrapper = DockerClientRunWrapper(
+            DockerClientSpec(do_input_json_envvar=True),
+            manager_class=partial(DockerEngineManager, client=self.client),
+            historian=self.historian,
+            reaper=Mock())
+        self.collector = GarbageCollector(
+            self.wrapper, grace_seconds=0, max_removals_per_second=None,
+            input_parent_dir=self.tmp_dir)
+
+    def tearDown(self):
+        rmtree(self.tmp_dir)
+
+    def run_container(self, name):
+        self.wrapper.run(DockerContainerSpec(
+            image_name='nginx', container_name=name, mem_reservation_mb=15,
+            extra_directories=['/data'], labels={}))
+        return self.client.containers.get(name)
+
+    def test_nothing_to_collect(self):
+        self.run_container('one')
+        self.assertEqual(
+            self.collector.collect(), GarbageReport(0, 0, 0, 0, 0))
+        self.assertEqual(len(self.client.volumes.volumes), 1)
+
+    def test_orphans_collected(self):
+        live = self.run_container('live')
+        gone = self.run_container('gone')
+        self.historian.record(gone.id, 'path')
+        gone.remove()
+        self.client.volumes.create(name='unlabelled')
+        leftover = tempfile.mkdtemp(
+            prefix='django-docker-input-', dir=self.tmp_dir)
+        with open(os.path.join(leftover, 'input.json'), 'w') as f:
+            f.write('{"1234": 5678}')
+        unrelated = tempfile.mkdtemp(dir=self.tmp_dir)
+
+        report = self.collector.collect()
+        self.assertEqual(report.volumes, 1)
+        self.assertEqual(report.directories, 1)
+        self.assertEqual(report.histories, 1)
+        self.assertGreater(report.bytes_reclaimed, 14)
+        self.assertEqual(
+            sorted(self.client.volumes.volumes),
+            sorted(['unlabelled', live.attrs['Mounts'][0]['Name']]))
+        self.assertFalse(os.path.exists(leftover))
+        self.assertTrue(os.path.exists(unrelated))
+        self.assertEqual(self.historian.container_ids(), {live.id})
+        self.assertEqual(self.collector.total, report)
+
+    def test_inputs_collected(self):
+        store = InputStore(os.path.join(self.tmp_dir, 'store'))
+        wrapper = DockerClientRunWrapper(
+            DockerClientSpec(input_store=store),
+            manager_class=partial(DockerEngineManager, client=self.client),
+            historian=self.historian,
+            reaper=Mock())
+        collector = GarbageCollector(
+            wrapper, grace_seconds=0, max_removals_per_second=None)
+        for (name, input) in [('one', 1), ('two', 2), ('also-two', 2)]:
+            wrapper.run(DockerContainerSpec(
+                image_name='nginx', container_name=name,
+                mem_reservation_mb=15, labels={}, input=input))
+        self.client.containers.get('one').remove()
+        self.client.containers.get('two').remove()
+        report = collector.collect()
+        self.assertEqual((report.inputs, report.bytes_reclaimed), (1, 1))
+        self.assertEqual(
+            store.paths(),
+            [self.client.containers.get('also-two').attrs['Mounts'][0][
+                'Source']])
+
+        path = store.put(3)
+        self.assertIsNone(store.remove(path, unused_since=0))
+        self.assertEqual(sorted(store.paths()), sorted([store.put(2), path]))
+
+    def test_grace(self):
+        self.run_container('gone').remove()
+        self.collector.grace_seconds = 300
+        report = self.collector.collect()
+        self.assertEqual(report.histories, 0)
+        self.assertEqual(report.volumes, 1)
+        # Fake volumes were all created long ago.
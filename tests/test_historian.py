@@ -1,9 +1,45 @@
+import atexit
+import os
 import re
+import tempfile
+import threading
 import unittest
-from datetime import datetime
-from time import sleep
+from datetime import datetime, timedelta
+from shutil import rmtree
+from time import mktime, sleep, time
 
-from django_docker_engine.historian import FileHistorian
+from mock import patch
+
+from django_docker_engine.historian import (BufferedHistorian, FileHistorian,
+                                            SqliteHistorian)
+
+
+def _check_query(test, historian, container_id):
+    start = datetime(2018, 1, 1, 12, 0, 0)
+    for i in range(100):
+        historian.record(
+            container_id, str(i), timestamp=start + timedelta(minutes=i))
+
+    def urls(records):
+        return [int(record.url[1:]) for record in records]
+    test.assertEqual(urls(historian.query(container_id)), list(range(100)))
+    test.assertEqual(
+        urls(historian.query(
+            container_id, since=start + timedelta(minutes=90))),
+        list(range(90, 100)))
+    test.assertEqual(
+        urls(historian.query(
+            container_id, since=start + timedelta(minutes=10, seconds=30),
+            until=start + timedelta(minutes=15))),
+        [11, 12, 13, 14])
+
+    page = list(historian.query(container_id, since=start, limit=3))
+    test.assertEqual(urls(page), [0, 1, 2])
+    test.assertEqual(page[0].timestamp, start.isoformat())
+    test.assertEqual(
+        urls(historian.query(container_id, limit=3, cursor=page[-1].cursor)),
+        [3, 4, 5])
+    test.assertEqual(list(historian.query(container_id, limit=0)), [])
 
 
 class FileHistorianTests(unittest.TestCase):
@@ -47,3 +83,274 @@ class FileHistorianTests(unittest.TestCase):
 
         lru = historian.sort_lru({id_1, id_2, id_3, id_4})
         self.assertNotEqual(lru[0], id_1)
+
+        last = historian.last_accessed({id_1, id_2, timestamp + '-none'})
+        self.assertGreater(last[id_1], last[id_2])
+        self.assertIsNone(last[timestamp + '-none'])
+
+        self.assertTrue({id_1, id_2}.issubset(historian.container_ids()))
+        self.assertGreater(historian.forget({id_1, id_3}), 0)
+        self.assertFalse({id_1, id_3} & historian.container_ids())
+        self.assertIn(id_2, historian.container_ids())
+
+    def test_query(self):
+        container_id = re.sub(r'\W', '-', datetime.now().isoformat())
+        historian = FileHistorian(index_bytes=100)
+        historian.create(container_id)
+        # One record at a time, so the index has many entries.
+        start = datetime(2018, 1, 1, 12, 0, 0)
+        for i in range(100):
+            historian.record(container_id, str(i),
+                             timestamp=start + timedelta(minutes=i))
+        entries = historian._index_entries(container_id)
+        self.assertGreater(len(entries), 10)
+        self.assertEqual(
+            [int(record.url[1:]) for record in historian.query(
+                container_id, since=start + timedelta(minutes=50),
+                limit=2)],
+            [50, 51])
+        historian.forget({container_id})
+        self.assertEqual(historian._index_entries(container_id), [])
+
+        historian.create(container_id)
+        _check_query(self, historian, container_id)
+        historian.forget({container_id})
+
+    def test_concurrent_writers_indexed(self):
+        container_id = re.sub(r'\W', '-', datetime.now().isoformat())
+        FileHistorian().create(container_id)
+        start = datetime(2018, 1, 1, 12, 0, 0)
+
+        def write(n):
+            historian = FileHistorian(index_bytes=100)
+            for i in range(20):
+                historian.record_many([
+                    (container_id, '{}-{}-{}'.format(n, i, j),
+                     start + timedelta(seconds=i))
+                    for j in range(5)])
+        threads = [threading.Thread(target=write, args=(n,))
+                   for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        historian = FileHistorian()
+        self.assertEqual(len(historian.list(container_id)), 400)
+        with open(historian._path(container_id)) as f:
+            for (timestamp, offset) in historian._index_entries(container_id):
+                f.seek(offset)
+                self.assertTrue(f.readline().startswith(timestamp + '\t'))
+        historian.forget({container_id})
+
+    def test_cursor_mid_record(self):
+        container_id = re.sub(r'\W', '-', datetime.now().isoformat())
+        historian = FileHistorian()
+        historian.create(container_id)
+        historian.record(container_id, 'first')
+        historian.record(container_id, 'second')
+        self.assertEqual(
+            [record.url for record in historian.query(
+                container_id, cursor=5)],
+            ['/second'])
+        historian.forget({container_id})
+
+    def test_batch_indexed(self):
+        container_id = re.sub(r'\W', '-', datetime.now().isoformat())
+        historian = FileHistorian(index_bytes=100)
+        historian.create(container_id)
+        start = datetime(2018, 1, 1, 12, 0, 0)
+        historian.record_many([
+            (container_id, str(i), start + timedelta(minutes=i))
+            for i in range(100)])
+        entries = historian._index_entries(container_id)
+        self.assertGreater(len(entries), 10)
+        with open(historian._path(container_id)) as f:
+            for (timestamp, offset) in entries:
+                f.seek(offset)
+                self.assertTrue(f.readline().startswith(timestamp + '\t'))
+        self.assertEqual(
+            [int(record.url[1:]) for record in historian.query(
+                container_id, since=start + timedelta(minutes=50),
+                limit=2)],
+            [50, 51])
+        historian.forget({container_id})
+
+
+class SqliteHistorianTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.historian = SqliteHistorian(
+            path=os.path.join(self.tmp_dir, 'history.sqlite3'))
+
+    def tearDown(self):
+        rmtree(self.tmp_dir)
+
+    def test_sqlite_historian(self):
+        historian = self.historian
+        for id in ['id-1', 'id-2', 'id-3', 'id-4']:
+            historian.create(id)
+        historian.record('id-1', 'foo?')
+        historian.record('id-2', 'bar?')
+        historian.record('id-1', 'FOO!')
+        historian.record('id-2', 'BAR!')
+        historian.record('id-3', 'zig')
+        historian.record('id-4', 'zag')
+
+        self.assertEqual(
+            ['/foo?', '/FOO!'],
+            [pair[1] for pair in historian.list('id-1')]
+        )
+        self.assertEqual(
+            historian.sort_lru({'id-1', 'id-2', 'id-3', 'id-4'}),
+            ['id-1', 'id-2', 'id-3', 'id-4'])
+
+        historian.record('id-1', 'no longer the least recent!')
+        self.assertEqual(
+            historian.sort_lru({'id-1', 'id-2', 'id-4', 'id-5'}),
+            ['id-5', 'id-2', 'id-4', 'id-1'])
+        # With no history, id-5 is least recent.
+
+        historian.create('id-1')
+        self.assertEqual(historian.list('id-1'), [])
+
+    def test_last_accessed(self):
+        self.historian.create('id-1')
+        then = datetime(2018, 1, 1, 12, 0, 0)
+        self.historian.record('id-2', 'foo', timestamp=then)
+        last = self.historian.last_accessed({'id-1', 'id-2', 'id-3'})
+        self.assertAlmostEqual(last['id-1'], time(), delta=10)
+        self.assertEqual(last['id-2'], mktime(then.timetuple()))
+        self.assertIsNone(last['id-3'])
+
+    def test_query(self):
+        _check_query(self, self.historian, 'id-1')
+
+    def test_forget(self):
+        self.historian.create('id-1')
+        self.historian.record('id-2', 'foo')
+        self.historian.record('id-3', 'bar')
+        self.assertEqual(self.historian.container_ids(),
+                         {'id-1', 'id-2', 'id-3'})
+        self.assertEqual(self.historian.forget({'id-1', 'id-2'}),
+                         len('id-2') + len(self.historian.list('id-3')[0][0])
+                         + len('/foo'))
+        self.assertEqual(self.historian.container_ids(), {'id-3'})
+
+    def test_shared_between_instances_and_threads(self):
+        path = os.path.join(self.tmp_dir, 'history.sqlite3')
+
+        def record(i):
+            SqliteHistorian(path=path).record('id-1', str(i))
+        threads = [threading.Thread(target=record, args=(i,))
+                   for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.historian.list('id-1')), 10)
+
+    def test_memory(self):
+        historian = SqliteHistorian(path=':memory:')
+        historian.record('id-1', 'foo')
+        self.assertEqual(
+            [pair[1] for pair in historian.list('id-1')], ['/foo'])
+
+
+class BufferedHistorianTests(unittest.TestCase):
+
+    def setUp(self):
+        self.backing = SqliteHistorian(path=':memory:')
+        self.historian = BufferedHistorian(self.backing, flush_seconds=60)
+
+    def tearDown(self):
+        self.historian.close()
+
+    def test_record_is_buffered(self):
+        self.historian.record('id-1', 'foo')
+        self.historian.record('id-1', 'bar')
+        self.assertEqual(self.backing.list('id-1'), [])
+        self.assertEqual(
+            [pair[1] for pair in self.historian.list('id-1')],
+            ['/foo', '/bar'])
+        self.assertEqual(len(self.backing.list('id-1')), 2)
+
+    def test_timestamps_preserved(self):
+        then = datetime(2018, 1, 1, 12, 0, 0, 1)
+        self.historian.record('id-1', 'foo', timestamp=then)
+        self.historian.flush()
+        self.assertEqual(self.backing.list('id-1')[0][0], then.isoformat())
+
+    def test_sort_lru_merged(self):
+        self.backing.create('id-old-1')
+        self.backing.create('id-old-2')
+        self.historian.create('id-new')
+        self.historian.record('id-old-1', 'foo')
+        self.assertEqual(
+            self.historian.sort_lru({'id-old-1', 'id-old-2', 'id-new'}),
+            ['id-old-2', 'id-new', 'id-old-1'])
+
+        # Unflushed, so only in memory:
+        self.historian.record('id-new', 'bar')
+        self.assertEqual(
+            self.historian.sort_lru({'id-old-1', 'id-old-2', 'id-new'}),
+            ['id-old-2', 'id-old-1', 'id-new'])
+
+        # Recorded by another process, and not seen here before:
+        self.backing.record('id-other', 'baz')
+        ids = {'id-old-1', 'id-old-2', 'id-new', 'id-other'}
+        self.assertEqual(self.historian.sort_lru(ids),
+                         ['id-old-2', 'id-old-1', 'id-new', 'id-other'])
+
+        # Now all are known, so the backing historian is not asked:
+        self.backing.last_accessed = None
+        self.assertEqual(self.historian.sort_lru(ids),
+                         ['id-old-2', 'id-old-1', 'id-new', 'id-other'])
+
+    def test_close_unregisters(self):
+        if not hasattr(atexit, 'unregister'):  # pragma: no cover
+            return
+        historian = BufferedHistorian(self.backing, flush_seconds=60)
+        with patch('atexit.unregister') as unregister:
+            historian.close()
+        unregister.assert_called_with(historian.flush)
+
+    def test_discard(self):
+        self.historian.record('id-1', 'foo')
+        self.historian.discard({'id-1'})
+        self.assertEqual(self.historian._last_access, {})
+        self.assertEqual(self.historian.container_ids(), {'id-1'})
+
+    def test_last_accessed(self):
+        then = datetime(2018, 1, 1, 12, 0, 0)
+        self.backing.record('id-old', 'foo', timestamp=then)
+        # Seen by this process, but older than what another recorded:
+        self.historian.record('id-old', 'foo', timestamp=datetime(2017, 1, 1))
+        self.historian.record('id-new', 'bar')
+        last = self.historian.last_accessed({'id-old', 'id-new', 'id-none'})
+        self.assertEqual(last['id-old'], mktime(then.timetuple()))
+        self.assertAlmostEqual(last['id-new'], time(), delta=10)
+        self.assertIsNone(last['id-none'])
+
+    def test_forget(self):
+        self.historian.record('id-1', 'foo')
+        self.historian.record('id-2', 'bar')
+        self.historian.forget({'id-1'})
+        self.assertEqual(self.historian.container_ids(), {'id-2'})
+        self.assertEqual(self.historian.sort_lru({'id-1', 'id-2'}),
+                         ['id-1', 'id-2'])
+        # id-1 has no history any more, so it is least recent.
+
+    def test_query(self):
+        _check_query(self, self.historian, 'id-1')
+
+    def test_bounded(self):
+        historian = BufferedHistorian(
+            self.backing, flush_seconds=60, max_pending=2)
+        for url in ['a', 'b', 'c']:
+            historian.record('id-1', url)
+        historian.close()
+        self.assertEqual(historian.dropped, 1)
+        self.assertEqual(
+            [pair[1] for pair in self.backing.list('id-1')], ['/b', '/c'])
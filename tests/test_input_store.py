@@ -0,0 +1,36 @@
+import os
+import tempfile
+import unittest
+from shutil import rmtree
+
+from django_docker_engine.input_store import InputStore, in_store
+
+
+class InputStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store = InputStore(os.path.join(self.tmp_dir, 'store'))
+
+    def tearDown(self):
+        rmtree(self.tmp_dir)
+
+    def test_put(self):
+        path = self.store.put({'b': 2, 'a': 1})
+        self.assertRegexpMatches(path, r'/store/[0-9a-f]{64}\.json$')
+        with open(path) as f:
+            self.assertEqual(f.read(), '{"a":1,"b":2}')
+
+    def test_identical_inputs_stored_once(self):
+        first = self.store.put({'a': 1, 'b': 2})
+        second = self.store.put({'b': 2, 'a': 1})
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, self.store.put({'a': 1}))
+        self.assertEqual(
+            len([name for name in os.listdir(self.store.path)
+                 if name.endswith('.json')]), 2)
+
+    def test_in_store(self):
+        self.assertTrue(in_store(self.store.put({})))
+        self.assertTrue(in_store(self.store.path))
+        self.assertFalse(in_store(self.tmp_dir))
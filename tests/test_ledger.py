@@ -0,0 +1,135 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from shutil import rmtree
+
+from django_docker_engine.ledger import MemoryLedger
+
+
+class MemoryLedgerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'ledger.sqlite3')
+        self.ledger = MemoryLedger(path=self.path)
+
+    def tearDown(self):
+        rmtree(self.tmp_dir)
+
+    def test_admit_and_release(self):
+        make_room_calls = []
+
+        def make_room(pending):
+            make_room_calls.append(pending)
+            return {'existing': 10}
+
+        self.ledger.admit('one', 15, 100, make_room)
+        self.assertEqual(len(make_room_calls), 1)  # Never reconciled
+        self.assertEqual(make_room_calls, [{}])
+        self.ledger.admit('two', 15, 100, make_room)
+        self.assertEqual(len(make_room_calls), 1)  # Under the limit
+        self.assertEqual(self.ledger.total_mb(), 40)
+
+        self.ledger.admit('big', 70, 100, lambda pending: {'two': 15})
+        self.assertEqual(self.ledger.reservations(), {'two': 15, 'big': 70})
+
+        self.ledger.release(['two', 'never-was'])
+        self.assertEqual(self.ledger.reservations(), {'big': 70})
+
+    def test_failed_make_room_rolls_back(self):
+        def make_room(pending):
+            raise Exception('docker is down')
+
+        with self.assertRaises(Exception):
+            self.ledger.admit('one', 15, 100, make_room)
+        self.assertEqual(self.ledger.reservations(), {})
+
+    def test_make_room_outside_transaction(self):
+        other = MemoryLedger(path=self.path, timeout_seconds=1)
+
+        def make_room(pending):
+            # Would time out, if the write lock were held.
+            other.admit('other', 10, 1000, lambda pending: dict(pending))
+            return {}
+
+        self.ledger.admit('one', 15, 100, make_room)
+        self.assertEqual(self.ledger.reservations(), {'one': 15, 'other': 10})
+
+    def test_concurrent_admission_never_overcommits(self):
+        self.ledger.admit('seed', 0, 100, lambda pending: {})
+        reserved = []
+        lock = threading.Lock()
+
+        def make_room(pending):
+            # Simulates evicting everything already admitted.
+            with lock:
+                del reserved[:]
+            return {}
+
+        def launch(i):
+            ledger = MemoryLedger(path=self.path)
+            name = 'container-{}'.format(i)
+            ledger.admit(name, 30, 100, make_room)
+            with lock:
+                reserved.append(name)
+                self.assertLessEqual(30 * len(reserved), 100)
+
+        threads = [threading.Thread(target=launch, args=(i,))
+                   for i in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(self.ledger.total_mb(), 100)
+
+    def test_pending_kept(self):
+        # Nothing is running yet, so make_room keeps what is launching.
+        calls = []
+
+        def make_room(pending):
+            calls.append(pending)
+            return dict(pending)
+
+        self.ledger.admit('x', 60, 100, make_room)
+        self.ledger.admit('y', 60, 100, make_room)
+        self.assertEqual(calls, [{}, {'x': 60}])
+        self.assertEqual(self.ledger.reservations(), {'x': 60, 'y': 60})
+
+        # Older reservations must be listed by make_room to be kept:
+        ledger = MemoryLedger(path=self.path, reconcile_seconds=0,
+                              pending_seconds=0)
+        ledger.admit('z', 10, 200, make_room)
+        self.assertEqual(calls[-1], {})
+        self.assertEqual(ledger.reservations(), {'z': 10})
+
+    def test_concurrent_admission_keeps_pending(self):
+        def launch(i):
+            ledger = MemoryLedger(path=self.path, reconcile_seconds=0)
+            ledger.admit('container-{}'.format(i), 30, 1000,
+                         lambda pending: dict(pending))
+
+        threads = [threading.Thread(target=launch, args=(i,))
+                   for i in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(
+            self.ledger.reservations(),
+            {'container-{}'.format(i): 30 for i in range(12)})
+
+    def test_earlier_schema(self):
+        rmtree(self.tmp_dir)
+        os.mkdir(self.tmp_dir)
+        connection = sqlite3.connect(self.path)
+        connection.execute(
+            'CREATE TABLE reservations ('
+            'container_name TEXT PRIMARY KEY, mem_mb REAL NOT NULL)')
+        connection.execute("INSERT INTO reservations VALUES ('old', 10)")
+        connection.commit()
+        connection.close()
+        ledger = MemoryLedger(path=self.path)
+        ledger.admit('new', 10, 100, lambda pending: dict(pending, old=10))
+        self.assertEqual(ledger.reservations(), {'old': 10, 'new': 10})
@@ -0,0 +1,141 @@
+import threading
+import unittest
+from functools import partial
+
+from django.test import RequestFactory
+from mock import Mock, mock
+
+from django_docker_engine.container_managers.docker_engine import \
+    DockerEngineManager
+from django_docker_engine.docker_utils import (DockerClientRunWrapper,
+                                               DockerClientSpec,
+                                               DockerContainerSpec)
+from django_docker_engine.historian import SqliteHistorian
+from django_docker_engine.metrics import InstrumentedManager, Metrics
+from django_docker_engine.prober import STARTING
+from django_docker_engine.proxy import Proxy
+from django_docker_engine.route_cache import RouteCache
+from tests.fake_docker import FakeDockerClient
+
+
+class MetricsTests(unittest.TestCase):
+
+    def test_counter(self):
+        metrics = Metrics()
+        metrics.inc('things_total', (('kind', 'a'),))
+        metrics.inc('things_total', (('kind', 'a'),), value=2)
+        self.assertEqual(
+            metrics.render(),
+            '# TYPE django_docker_engine_things_total counter\n'
+            'django_docker_engine_things_total{kind="a"} 3.0\n')
+
+    def test_histogram(self):
+        metrics = Metrics(buckets=[0.1, 1])
+        metrics.observe('run_seconds', 0.5)
+        metrics.observe('run_seconds', 2)
+        self.assertEqual(
+            metrics.render(),
+            '# HELP django_docker_engine_run_seconds '
+            'Time to launch a container.\n'
+            '# TYPE django_docker_engine_run_seconds histogram\n'
+            'django_docker_engine_run_seconds_bucket{le="0.1"} 0.0\n'
+            'django_docker_engine_run_seconds_bucket{le="1"} 1.0\n'
+            'django_docker_engine_run_seconds_bucket{le="+Inf"} 2.0\n'
+            'django_docker_engine_run_seconds_sum 2.5\n'
+            'django_docker_engine_run_seconds_count 2.0\n')
+
+    def test_threads_counted(self):
+        metrics = Metrics()
+
+        def count():
+            for i in range(100):
+                metrics.inc('things_total')
+        threads = [threading.Thread(target=count) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertIn('django_docker_engine_things_total 400.0',
+                      metrics.render())
+
+    def test_label_escaping(self):
+        metrics = Metrics()
+        metrics.inc('things_total', (('name', 'a"b\\c'),))
+        self.assertIn('{name="a\\"b\\\\c"}', metrics.render())
+
+    def test_collector_replaced(self):
+        metrics = Metrics()
+        metrics.add_collector('key', lambda: [('gauge', (), 1)])
+        metrics.add_collector('key', lambda: [('gauge', (), 2)])
+        self.assertEqual(
+            metrics.render(),
+            '# TYPE django_docker_engine_gauge gauge\n'
+            'django_docker_engine_gauge 2.0\n')
+
+    def test_instrumented_manager(self):
+        metrics = Metrics()
+        manager = Mock()
+        manager.get_id.return_value = 'id-1'
+        instrumented = InstrumentedManager(manager, metrics)
+        self.assertEqual(instrumented.get_id('name-1'), 'id-1')
+        manager.get_id.assert_called_with('name-1')
+        self.assertIn(
+            'django_docker_engine_docker_call_seconds_count'
+            '{operation="get_id"} 1.0',
+            metrics.render())
+
+
+class RunWrapperMetricsTests(unittest.TestCase):
+
+    def test_evictions(self):
+        metrics = Metrics()
+        wrapper = DockerClientRunWrapper(
+            DockerClientSpec(do_input_json_envvar=True),
+            manager_class=partial(
+                DockerEngineManager, client=FakeDockerClient()),
+            historian=SqliteHistorian(path=':memory:'),
+            reaper=Mock(),
+            mem_limit_mb=40,
+            metrics=metrics)
+        for name in ['one', 'two', 'three']:
+            wrapper.run(DockerContainerSpec(
+                image_name='nginx', container_name=name,
+                mem_reservation_mb=15, labels={}))
+        rendered = metrics.render()
+        self.assertIn('django_docker_engine_evictions_total 1.0', rendered)
+        self.assertIn('django_docker_engine_evicted_mb_total 15.0', rendered)
+        self.assertIn('django_docker_engine_run_seconds_count 3.0', rendered)
+        self.assertIn('{operation="run"} 3.0', rendered)
+
+
+class ProxyMetricsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics()
+        self.proxy = Proxy(metrics=self.metrics, metrics_path='metrics',
+                           route_cache=RouteCache())
+
+    def test_metrics_view(self):
+        (metrics_url, proxy_url) = self.proxy.url_patterns()
+        response = metrics_url.callback(RequestFactory().get('/metrics'))
+        self.assertEqual(response['Content-Type'],
+                         'text/plain; version=0.0.4')
+        self.assertIn(
+            b'# TYPE django_docker_engine_cache_lookups_total counter\n'
+            b'django_docker_engine_cache_lookups_total'
+            b'{cache="route",result="hit"}',
+            response.content)
+
+    def test_please_wait_counted(self):
+        prober = Mock()
+        prober.state.return_value = STARTING
+        self.proxy.prober = prober
+        with mock.patch('django_docker_engine.proxy.DockerClientWrapper'):
+            response = self.proxy.url_patterns()[-1].callback(
+                request=RequestFactory().get('/fake-url'),
+                container_name='fake-container',
+                url='fake-url')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn(
+            'django_docker_engine_please_wait_total{reason="Starting"} 1.0',
+            self.metrics.render())
@@ -1,7 +1,10 @@
 import unittest
 
-from django.test import RequestFactory
+from django.test import RequestFactory, override_settings
+from mock import Mock, patch
 
+from django_docker_engine.middleware.fast_hostname_routing import (
+    FastHostnameRoutingMiddleware, HostSuffixTable)
 from django_docker_engine.middleware.hostname_routing import \
     HostnameRoutingMiddleware
 
@@ -18,3 +21,45 @@ class HostnameRoutingMiddlewareTests(unittest.TestCase):
         self.assertEqual(request.path, path)
         HostnameRoutingMiddleware().process_request(request)
         self.assertEqual(request.path, '/docker/{}{}'.format(name, path))
+
+
+class FastHostnameRoutingMiddlewareTests(unittest.TestCase):
+
+    def setUp(self):
+        self.proxy = Mock()
+        self.proxy.dispatch.return_value = 'proxied'
+        self.get_response = Mock(return_value='django')
+        with override_settings(
+                DJANGO_DOCKER_HOST_SUFFIXES=[
+                    '.docker.localhost', '.tools.example.org'],
+                DJANGO_DOCKER_PROXY='some.proxy'), \
+                patch('django_docker_engine.middleware.fast_hostname_routing'
+                      '.import_string', return_value=self.proxy):
+            self.middleware = FastHostnameRoutingMiddleware(self.get_response)
+
+    def get(self, host, path='/barfoo'):
+        return self.middleware(RequestFactory().get(path, HTTP_HOST=host))
+
+    def test_suffix_table(self):
+        table = HostSuffixTable(['.a.b', '.b', '.C.d'])
+        self.assertEqual(table.container_name('x.a.b'), 'x')
+        self.assertEqual(table.container_name('x.y.b:8000'), 'x.y')
+        self.assertEqual(table.container_name('X.c.D'), 'X')
+        self.assertIsNone(table.container_name('.b'))
+        self.assertIsNone(table.container_name('x.c'))
+
+    def test_proxied(self):
+        self.assertEqual(self.get('foobar.tools.example.org'), 'proxied')
+        self.assertEqual(self.get('foobar.docker.localhost:8000'), 'proxied')
+        (request, name, url) = self.proxy.dispatch.call_args[0]
+        self.assertEqual((name, url), ('foobar', 'barfoo'))
+        self.get_response.assert_not_called()
+
+    def test_case_kept(self):
+        self.get('FooBar.Docker.Localhost', '/docker-logs')
+        (request, name, url) = self.proxy.dispatch.call_args[0]
+        self.assertEqual((name, url), ('FooBar', 'docker-logs'))
+
+    def test_other_hosts(self):
+        self.assertEqual(self.get('localhost:8000'), 'django')
+        self.proxy.dispatch.assert_not_called()
@@ -0,0 +1,65 @@
+import threading
+import unittest
+
+from mock import Mock
+
+from django_docker_engine.prepull import ImagePrePuller, full_image_name
+
+
+class ImagePrePullerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.calls = []
+
+        def pull(image_name, version, progress):
+            self.calls.append((image_name, version))
+            progress({'status': 'Downloading', 'id': 'a',
+                      'progressDetail': {'current': 5, 'total': 10}})
+            self.release.wait(5)
+            if image_name == 'missing':
+                raise Exception('not found')
+            return Mock(id='sha256:' + image_name)
+
+        self.on_progress = Mock()
+        self.prepuller = ImagePrePuller(pull, on_progress=self.on_progress)
+
+    def test_one_pull_for_many_waiters(self):
+        self.prepuller.prepull(['nginx', 'nginx:latest'])
+        self.assertEqual(self.prepuller.status('nginx'), 'pulling')
+        self.assertIsNone(self.prepuller.resolve('nginx'))
+        self.assertFalse(self.prepuller.wait('nginx', timeout=0.01))
+
+        self.release.set()
+        self.assertTrue(self.prepuller.wait('nginx:latest', timeout=5))
+        self.assertEqual(self.calls, [('nginx', 'latest')])
+        self.assertEqual(self.prepuller.status('nginx'), 'pulled')
+        self.assertEqual(self.prepuller.resolve('nginx'), 'sha256:nginx')
+        self.assertEqual(self.prepuller.progress('nginx'), (5, 10))
+        self.on_progress.assert_called_with('nginx:latest', 'pulled', 5, 10)
+
+    def test_registry_port(self):
+        self.release.set()
+        self.assertTrue(self.prepuller.wait('localhost:5000/tool', 5))
+        self.assertEqual(self.calls, [('localhost:5000/tool', 'latest')])
+        self.assertEqual(full_image_name('localhost:5000/tool'),
+                         'localhost:5000/tool:latest')
+        self.assertEqual(full_image_name('localhost:5000/tool:v1'),
+                         'localhost:5000/tool:v1')
+
+    def test_failure_retried(self):
+        self.release.set()
+        self.assertFalse(self.prepuller.wait('missing:v1', timeout=5))
+        self.assertEqual(self.prepuller.status('missing:v1'), 'failed')
+        self.prepuller.wait('missing:v1', timeout=5)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_forget(self):
+        self.release.set()
+        self.prepuller.wait('nginx', timeout=5)
+        self.prepuller.forget('nginx')
+        self.assertIsNone(self.prepuller.status('nginx'))
+
+    def test_unknown(self):
+        self.assertIsNone(self.prepuller.status('nginx'))
+        self.assertIsNone(self.prepuller.progress('nginx'))
@@ -0,0 +1,106 @@
+import socket
+import threading
+import unittest
+
+from django_docker_engine.container_managers.docker_engine import \
+    ContainerRoute
+from django_docker_engine.prober import ReadinessProber
+
+
+def _http_server():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(5)
+
+    def serve():
+        while True:
+            try:
+                (connection, _) = listener.accept()
+            except socket.error:
+                return
+            connection.recv(1024)
+            connection.sendall(b'HTTP/1.0 404 Not Found\r\n\r\n')
+            connection.close()
+    thread = threading.Thread(target=serve)
+    thread.daemon = True
+    thread.start()
+    return listener
+
+
+def _unused_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+class ReadinessProberTests(unittest.TestCase):
+
+    def setUp(self):
+        self.prober = ReadinessProber(
+            initial_delay_seconds=0.01, max_delay_seconds=0.05,
+            give_up_seconds=0.5)
+
+    def route(self, port):
+        return ContainerRoute(id='id', host='127.0.0.1', port=str(port))
+
+    def test_ready(self):
+        listener = _http_server()
+        self.prober.watch('c', self.route(listener.getsockname()[1]))
+        self.assertTrue(self.prober.wait('c', timeout=5))
+        self.assertEqual(self.prober.state('c'), 'ready')
+        self.assertTrue(self.prober.ready_event('c').is_set())
+        listener.close()
+
+    def test_becomes_ready(self):
+        port = _unused_port()
+        self.prober.watch('c', self.route(port))
+        self.assertFalse(self.prober.wait('c', timeout=0.05))
+        self.assertEqual(self.prober.state('c'), 'starting')
+
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', port))
+        listener.listen(5)
+        # Accepting connections is not enough, by default:
+        self.assertFalse(self.prober.probe(self.route(port)))
+        listener.close()
+
+        listener = _http_server()
+        self.prober.watch('c', self.route(listener.getsockname()[1]))
+        self.assertTrue(self.prober.wait('c', timeout=5))
+        listener.close()
+
+    def test_failed(self):
+        self.prober.watch('c', self.route(_unused_port()))
+        self.assertFalse(self.prober.wait('c', timeout=5))
+        self.assertEqual(self.prober.state('c'), 'failed')
+
+    def test_on_done(self):
+        listener = _http_server()
+        done = threading.Event()
+        self.assertFalse(self.prober.on_done('c', done.set))
+        self.prober.watch('c', self.route(listener.getsockname()[1]))
+        self.assertTrue(self.prober.on_done('c', done.set))
+        self.assertTrue(done.wait(5))
+        later = []
+        self.prober.on_done('c', lambda: later.append(True))
+        self.assertEqual(later, [True])
+        listener.close()
+
+    def test_forget(self):
+        self.prober.watch('c', self.route(_unused_port()))
+        self.prober.forget('c')
+        self.assertIsNone(self.prober.state('c'))
+        self.assertFalse(self.prober.wait('c'))
+
+    def test_pruned(self):
+        prober = ReadinessProber(
+            initial_delay_seconds=0.01, give_up_seconds=0.01, keep_seconds=0)
+        prober.watch('c', self.route(_unused_port()))
+        self.assertFalse(prober.wait('c', timeout=5))
+        self.assertEqual(prober.state('c'), 'failed')
+        # Killed by another process, so never forgotten, but pruned:
+        prober.watch('d', self.route(_unused_port()))
+        self.assertIsNone(prober.state('c'))
+        self.assertIsNotNone(prober.state('d'))
@@ -1,8 +1,12 @@
 import unittest
 
 from django.test import RequestFactory
+from docker.errors import NotFound
 from mock import mock
 
+from django_docker_engine.container_managers.docker_engine import \
+    ContainerRoute
+from django_docker_engine.prober import STARTING, ReadinessProber
 from django_docker_engine.proxy import Proxy
 
 
@@ -32,6 +36,59 @@ class CSRFTests(unittest.TestCase):
     def test_csrf_exempt_false(self):
         self._check_proxy_csrf(csrf_exempt=False)
 
+    def _dispatch(self, csrf_exempt, url='fake-url'):
+        proxy = Proxy(csrf_exempt=csrf_exempt, logs_path='docker-logs')
+        # Not Mocks, which would seem to have a csrf_exempt attribute:
+        proxy._proxy_view = lambda request, container_name, url: 'proxied'
+        proxy._logs_view = lambda request, container_name: 'logs'
+        request = self.fake_post_kwargs['request']
+        request._dont_enforce_csrf_checks = False  # Set by RequestFactory
+        return proxy.dispatch(request, 'fake-container', url)
+
+    def test_dispatch_checks_csrf(self):
+        self.assertEqual(self._dispatch(csrf_exempt=False).status_code, 403)
+        self.assertEqual(self._dispatch(csrf_exempt=True), 'proxied')
+        self.assertEqual(
+            self._dispatch(csrf_exempt=True, url='docker-logs'), 'logs')
+
+
+class ProberProxyTests(unittest.TestCase):
+
+    def test_starting(self):
+        prober = mock.Mock()
+        prober.state.return_value = STARTING
+        proxy = Proxy(prober=prober)
+        with mock.patch('django_docker_engine.proxy.DockerClientWrapper') \
+                as wrapper_mock:
+            response = proxy.url_patterns()[-1].callback(
+                request=RequestFactory().get('/fake-url'),
+                container_name='fake-container',
+                url='fake-url')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Starting', response.reason_phrase)
+        wrapper_mock.assert_not_called()
+        prober.state.assert_called_with('fake-container')
+
+    def test_parked_until_ready(self):
+        prober = ReadinessProber()
+        prober.watch('fake-container', ContainerRoute(
+            id='fake-id', host='127.0.0.1', port='1'))
+        proxy = Proxy(prober=prober, park_seconds=5)
+        with mock.patch.object(proxy, 'historian'), \
+                mock.patch.object(proxy, '_lookup_route') as lookup_mock, \
+                mock.patch.object(proxy, '_internal_proxy_view',
+                                  return_value='proxied'), \
+                mock.patch.object(prober, 'wait', return_value=True) as wait:
+            prober._targets['fake-container'].state = STARTING
+            response = proxy.url_patterns()[-1].callback(
+                request=RequestFactory().get('/fake-url'),
+                container_name='fake-container',
+                url='fake-url')
+        self.assertEqual(response, 'proxied')
+        wait.assert_called_with('fake-container', timeout=5)
+        lookup_mock.assert_called_with('fake-container')
+        prober.forget('fake-container')
+
 
 class ProxyTests(unittest.TestCase):
 
@@ -73,3 +130,45 @@ class ProxyTests(unittest.TestCase):
                       str(logs_response.content))
         self.assertIn('No such container: fake-container',
                       str(logs_response.content))
+
+
+class LogsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.view = Proxy(logs_path='docker-logs').url_patterns()[0].callback
+
+    def get(self, query, error=None):
+        with mock.patch('django_docker_engine.proxy.DockerClientWrapper') \
+                as wrapper_mock:
+            wrapper_mock.return_value.logs.return_value = iter([b'a\n', b'b\n'])
+            wrapper_mock.return_value.logs.side_effect = error
+            response = self.view(
+                request=RequestFactory().get('/fake-url', query),
+                container_name='fake-container')
+        return (response, wrapper_mock.return_value.logs)
+
+    def test_stream(self):
+        (response, logs) = self.get({})
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content), b'a\nb\n')
+        logs.assert_called_with('fake-container', stream=True, follow=False)
+
+    def test_query(self):
+        (response, logs) = self.get(
+            {'tail': '10', 'since': '1500000000.5', 'until': '1600000000',
+             'follow': 'true'})
+        logs.assert_called_with(
+            'fake-container', stream=True, tail=10, since=1500000000,
+            until=1600000000, follow=True)
+
+    def test_bad_query(self):
+        (response, logs) = self.get({'tail': 'some'})
+        self.assertEqual(response.status_code, 400)
+        logs.assert_not_called()
+
+    def test_errors(self):
+        (response, logs) = self.get({}, error=NotFound('No such container'))
+        self.assertEqual(response.status_code, 404)
+        (response, logs) = self.get({}, error=Exception('docker is down'))
+        self.assertEqual(response.status_code, 500)
+        self.assertIn(b'docker is down', response.content)
@@ -0,0 +1,78 @@
+import unittest
+
+from django_docker_engine.container_managers.docker_engine import \
+    DockerEngineManager
+from django_docker_engine.registry import ContainerRegistry
+from tests.fake_docker import FakeDockerClient
+
+ROOT_LABEL = 'test-root'
+
+
+class ContainerRegistryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeDockerClient()
+        self.registry = ContainerRegistry(ROOT_LABEL, client=self.client)
+        self.mine = self.run_container('mine', {
+            ROOT_LABEL: 'true',
+            ROOT_LABEL + '.port': '80',
+            ROOT_LABEL + '.mem_reservation_mb': '15'
+        })
+        self.other = self.run_container('other', {})
+        self.registry.sync()
+        self.manager = DockerEngineManager(
+            ROOT_LABEL, client=self.client, registry=self.registry)
+        del self.client.containers.calls[:]
+
+    def run_container(self, name, labels):
+        return self.client.containers.run(
+            'nginx', name=name, labels=labels, ports={'80/tcp': None})
+
+    def test_entry(self):
+        entry = self.registry.get('mine')
+        self.assertEqual(entry.id, self.mine.id)
+        self.assertEqual(entry.state, 'running')
+        self.assertEqual(entry.port, '80')
+        self.assertEqual(entry.mem_reservation_mb, 15)
+        self.assertEqual(entry.host_port, '32768')
+        self.assertEqual(self.registry.get(self.mine.id), entry)
+        self.assertIsNone(self.registry.get('other'))
+
+    def test_list_filters(self):
+        self.assertEqual(self.registry.list(), [self.mine])
+        self.assertEqual(self.registry.list({'name': 'mine'}), [self.mine])
+        self.assertEqual(self.registry.list({'name': 'nope'}), [])
+        self.assertEqual(
+            self.registry.list({'label': ROOT_LABEL + '.port=80'}),
+            [self.mine])
+        self.assertEqual(
+            self.registry.list({'label': ROOT_LABEL + '.port=81'}), [])
+        self.assertIsNone(self.registry.list({'ancestor': 'nginx'}))
+
+    def test_events(self):
+        new = self.run_container('new', {ROOT_LABEL: 'true'})
+        self.registry.handle_event({'Action': 'create', 'id': new.id})
+        self.assertEqual(self.registry.get('new').id, new.id)
+
+        new.rename('renamed')
+        self.registry.handle_event({'Action': 'rename', 'id': new.id})
+        self.assertIsNone(self.registry.get('new'))
+        self.assertEqual(self.registry.get('renamed').id, new.id)
+
+        self.registry.handle_event({'Action': 'exec_start', 'id': new.id})
+        new.remove()
+        self.registry.handle_event({'Action': 'destroy', 'id': new.id})
+        self.assertIsNone(self.registry.get('renamed'))
+
+    def test_manager_reads_from_registry(self):
+        self.assertEqual(self.manager.list(), [self.mine])
+        self.assertEqual(self.manager.get_id('mine'), self.mine.id)
+        self.assertEqual(self.manager.get_url('mine'), 'http://localhost:32768')
+        self.assertEqual(self.client.containers.calls, [])
+
+    def test_manager_falls_back_to_daemon(self):
+        self.assertEqual(self.manager.get_id('other'), self.other.id)
+        self.registry._synced = False
+        self.assertEqual(self.manager.list(), [self.mine])
+        self.assertEqual(
+            self.client.containers.calls, [('get', 'other'), ('list', None)])
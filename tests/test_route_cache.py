@@ -0,0 +1,59 @@
+import unittest
+
+from mock import patch
+
+from django_docker_engine.container_managers.docker_engine import \
+    ContainerRoute
+from django_docker_engine.route_cache import RouteCache
+
+
+class RouteCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.route = ContainerRoute(id='id-1', host='localhost', port='32768')
+
+    def test_route_url(self):
+        self.assertEqual(self.route.url, 'http://localhost:32768')
+
+    def test_get_put(self):
+        cache = RouteCache()
+        self.assertIsNone(cache.get('name-1'))
+        cache.put('name-1', self.route)
+        self.assertEqual(cache.get('name-1'), self.route)
+
+    def test_ttl(self):
+        cache = RouteCache(ttl_seconds=10)
+        with patch('django_docker_engine.route_cache.time', return_value=100):
+            cache.put('name-1', self.route)
+        with patch('django_docker_engine.route_cache.time', return_value=105):
+            self.assertEqual(cache.get('name-1'), self.route)
+        with patch('django_docker_engine.route_cache.time', return_value=111):
+            self.assertIsNone(cache.get('name-1'))
+        self.assertEqual(len(cache), 0)
+
+    def test_hits_and_misses(self):
+        cache = RouteCache()
+        cache.get('name-1')
+        cache.put('name-1', self.route)
+        cache.get('name-1')
+        cache.get('name-1')
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_bounded_lru(self):
+        cache = RouteCache(max_size=2)
+        cache.put('name-1', self.route)
+        cache.put('name-2', self.route)
+        cache.get('name-1')  # name-2 is now least recently used.
+        cache.put('name-3', self.route)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('name-2'))
+        self.assertEqual(cache.get('name-1'), self.route)
+
+    def test_invalidate(self):
+        cache = RouteCache()
+        cache.put('name-1', self.route)
+        cache.put('name-2', self.route._replace(id='id-2'))
+        cache.invalidate(container_name='name-2')
+        self.assertIsNone(cache.get('name-2'))
+        cache.invalidate(container_id='id-1')
+        self.assertIsNone(cache.get('name-1'))
@@ -0,0 +1,427 @@
+import os
+import socket
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from functools import partial
+from shutil import rmtree
+
+from mock import Mock
+
+from django_docker_engine.container_managers.docker_engine import \
+    DockerEngineManager
+from django_docker_engine.docker_utils import (MAX, OBSERVED, RESERVATION,
+                                               DockerClientRunWrapper,
+                                               DockerClientSpec,
+                                               DockerContainerSpec)
+from django_docker_engine.historian import SqliteHistorian
+from django_docker_engine.input_store import InputStore
+from django_docker_engine.ledger import MemoryLedger
+from django_docker_engine.prober import ReadinessProber
+from tests.fake_docker import FakeDockerClient
+
+
+class RunWrapperTests(unittest.TestCase):
+    """
+    DockerClientRunWrapper, over a fake Docker client.
+    """
+
+    def setUp(self):
+        self.client = FakeDockerClient()
+        self.historian = SqliteHistorian(path=':memory:')
+        self.reaper = Mock()
+        self.wrapper = self.make_wrapper()
+
+    def make_wrapper(self, **kwargs):
+        wrapper_kwargs = {
+            'manager_class': partial(DockerEngineManager, client=self.client),
+            'historian': self.historian,
+            'reaper': self.reaper,
+            'mem_limit_mb': 40
+        }
+        wrapper_kwargs.update(kwargs)
+        return DockerClientRunWrapper(
+            DockerClientSpec(do_input_json_envvar=True), **wrapper_kwargs)
+
+    def spec(self, name, **kwargs):
+        spec_kwargs = {
+            'image_name': 'nginx',
+            'container_name': name,
+            'mem_reservation_mb': 15,
+            'labels': {}
+        }
+        spec_kwargs.update(kwargs)
+        return DockerContainerSpec(**spec_kwargs)
+
+    def names(self):
+        return sorted(container.name for container in self.wrapper.list())
+
+    def test_run(self):
+        url = self.wrapper.run(self.spec('one'))
+        self.assertEqual(url, 'http://localhost:32768')
+        self.assertEqual(self.names(), ['one'])
+
+    def test_kill_lru(self):
+        self.wrapper.run(self.spec('one', extra_directories=['/data']))
+        self.wrapper.run(self.spec('two'))
+        self.historian.record(self.wrapper.lookup_container_id('one'), '')
+        del self.client.containers.calls[:]
+
+        self.wrapper.run(self.spec('three'))
+        self.assertEqual(self.names(), ['one', 'three'])
+        self.assertNotIn(
+            'get', [call[0] for call in self.client.containers.calls[:-2]])
+        # Only the lookup of the new url should need a get.
+
+        self.wrapper.run(self.spec('four'))
+        self.assertEqual(self.names(), ['four', 'three'])
+        self.reaper.reap.assert_called_once()
+        self.assertRegexpMatches(
+            self.reaper.reap.call_args[0][0], r'^/fake-volumes/volume-\d+$')
+
+    def test_prepull(self):
+        progress = Mock()
+        prepuller = self.wrapper.prepull(['nginx'], on_progress=progress)
+        self.assertTrue(prepuller.wait('nginx', timeout=5))
+        self.assertEqual(self.client.images.pulled, ['nginx:latest'])
+        self.assertEqual(prepuller.progress('nginx'), (100, 100))
+
+        self.wrapper.run(self.spec('one'))
+        container = self.client.containers.get('one')
+        # Launched by name, so the image label and "docker ps" read well:
+        self.assertEqual(container.attrs['Config']['Image'], 'nginx:latest')
+        self.assertIsNotNone(prepuller.resolve('nginx'))
+
+    def test_prepull_registry_port(self):
+        prepuller = self.wrapper.prepull(['localhost:5000/tool'])
+        self.assertTrue(prepuller.wait('localhost:5000/tool', timeout=5))
+        self.wrapper.run(self.spec('one', image_name='localhost:5000/tool'))
+        self.assertEqual(
+            self.client.containers.get('one').attrs['Config']['Image'],
+            'localhost:5000/tool:latest')
+        self.assertEqual(self.client.images.pulled,
+                         ['localhost:5000/tool:latest'])
+
+    def test_run_many(self):
+        self.wrapper.run(self.spec('one'))
+        self.wrapper.run(self.spec('two'))
+        del self.client.containers.calls[:]
+
+        results = self.wrapper.run_many([
+            self.spec('three'),
+            self.spec('four'),
+            self.spec('bad', mem_reservation_mb=0,
+                      extra_directories=['relative'])])
+        self.assertEqual(
+            [call[0] for call in self.client.containers.calls].count('list'),
+            1)
+        self.assertRegexpMatches(results[0], r'^http://localhost:\d+$')
+        self.assertRegexpMatches(results[1], r'^http://localhost:\d+$')
+        self.assertIsInstance(results[2], Exception)
+        self.assertEqual(self.names(), ['four', 'three'])
+        self.assertEqual(self.client.images.pulled, ['nginx:latest'])
+
+    def test_wait_until_ready(self):
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        # Accepts, but never answers.
+        self.wrapper._prober = ReadinessProber(
+            connect_timeout_seconds=0.01, initial_delay_seconds=0.01,
+            give_up_seconds=0.1)
+        self.wrapper.run(self.spec('one'), wait_until_ready=5)
+        self.assertIs(self.wrapper.is_ready('one'), False)
+        self.assertIsNone(self.wrapper.is_ready('two'))
+        listener.close()
+
+    def test_purge_inactive(self):
+        self.wrapper.run(self.spec('one', extra_directories=['/data']))
+        self.wrapper.run(self.spec('two'))
+        self.wrapper.purge_inactive(60)
+        self.assertEqual(self.names(), ['one', 'two'])
+        # Just created: That counts as access.
+
+        # Not ours, or with no history, though started long ago:
+        self.client.containers.run('nginx', name='other', labels={})
+        self.client.containers.run(
+            'nginx', name='unknown', labels={self.wrapper.root_label: 'true'})
+        self.wrapper.purge_inactive(60)
+        self.assertEqual(self.names(), ['one', 'two', 'unknown'])
+        self.assertIsNotNone(self.client.containers.get('other'))
+        self.client.containers.get('unknown').remove()
+
+        self.historian.record(
+            self.wrapper.lookup_container_id('one'), '',
+            timestamp=datetime.now() - timedelta(hours=1))
+        del self.client.containers.calls[:]
+        self.wrapper.purge_inactive(60)
+        self.assertEqual(self.names(), ['two'])
+        self.assertNotIn(
+            'logs', [call[0] for call in self.client.containers.calls])
+        self.reaper.reap.assert_called_once()
+
+    def test_kill_lru_several(self):
+        for name in ['one', 'two']:
+            self.wrapper.run(self.spec(name))
+        self.wrapper.run(self.spec('big', mem_reservation_mb=40))
+        self.assertEqual(self.names(), ['big'])
+
+
+class LedgerRunWrapperTests(RunWrapperTests):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.ledger = MemoryLedger(
+            path=os.path.join(self.tmp_dir, 'ledger.sqlite3'))
+        super(LedgerRunWrapperTests, self).setUp()
+
+    def tearDown(self):
+        rmtree(self.tmp_dir)
+
+    def make_wrapper(self, **kwargs):
+        return super(LedgerRunWrapperTests, self).make_wrapper(
+            ledger=self.ledger, **kwargs)
+
+    def test_lists_only_when_needed(self):
+        self.wrapper.run(self.spec('one'))
+        del self.client.containers.calls[:]
+        self.wrapper.run(self.spec('two'))
+        self.assertNotIn(
+            'list', [call[0] for call in self.client.containers.calls])
+        self.assertEqual(self.ledger.reservations(), {'one': 15, 'two': 15})
+
+    def test_failed_launch_released(self):
+        self.client.containers.run = Mock(side_effect=Exception('no!'))
+        with self.assertRaises(Exception):
+            self.wrapper.run(self.spec('one'))
+        self.assertEqual(self.ledger.reservations(), {})
+
+    def test_run_many_admitted_together(self):
+        results = self.wrapper.run_many([
+            self.spec('one'),
+            self.spec('bad', extra_directories=['relative'])])
+        self.assertIsInstance(results[1], Exception)
+        self.assertEqual(self.ledger.reservations(), {'one': 15})
+
+    def test_purge_released(self):
+        self.wrapper.run(self.spec('one', labels={'purge-me': 'true'}))
+        self.wrapper.run(self.spec('two'))
+        self.wrapper.purge_by_label('purge-me')
+        self.assertEqual(self.ledger.reservations(), {'two': 15})
+
+    def test_remove_container_released(self):
+        self.wrapper.run(self.spec('one'))
+        self.wrapper.remove_container(self.client.containers.get('one'))
+        self.assertEqual(self.ledger.reservations(), {})
+
+
+class WarmPoolRunWrapperTests(RunWrapperTests):
+
+    def make_wrapper(self, **kwargs):
+        wrapper = super(WarmPoolRunWrapperTests, self).make_wrapper(
+            warm_pool_size=1, **kwargs)
+        wrapper._refill_in_background = Mock()
+        return wrapper
+
+    def tearDown(self):
+        for container in self.client.containers._containers.values():
+            for mount in container.attrs['Mounts']:
+                if mount['Type'] == 'bind':
+                    rmtree(mount['Source'])
+
+    def test_claim(self):
+        self.assertEqual(self.wrapper.warm(self.spec('ignored')), 1)
+        self.assertEqual(self.wrapper.warm(self.spec('ignored')), 0)
+        (warm_name,) = self.names()
+        self.assertRegexpMatches(warm_name, r'^warm-[0-9a-f]{12}-')
+        del self.client.containers.calls[:]
+
+        url = self.wrapper.run(self.spec('one', input={'hello': 'world'}))
+        self.assertEqual(url, 'http://localhost:32768')
+        self.assertEqual(self.names(), ['one'])
+        self.assertNotIn(
+            'run', [call[0] for call in self.client.containers.calls])
+        self.wrapper._refill_in_background.assert_called_once()
+
+        container = self.client.containers.get('one')
+        self.assertIn('INPUT_JSON_PATH=/django_docker_engine_input/input.json',
+                      container.attrs['Config']['Env'])
+        (input_dir,) = [mount['Source'] for mount in container.attrs['Mounts']]
+        with open(os.path.join(input_dir, 'input.json')) as f:
+            self.assertEqual(f.read(), '{"hello": "world"}')
+
+    def test_no_match(self):
+        self.wrapper.warm(self.spec('ignored'))
+        self.wrapper.run(self.spec('one', cpus=1))
+        self.assertEqual(len(self.names()), 2)
+        self.assertIn(
+            'INPUT_JSON={}',
+            self.client.containers.get('one').attrs['Config']['Env'])
+
+    def test_warm_never_kills(self):
+        self.wrapper.run(self.spec('one'))
+        self.wrapper.run(self.spec('two'))
+        self.assertEqual(self.wrapper.warm(self.spec('ignored')), 0)
+        self.assertEqual(self.names(), ['one', 'two'])
+
+    def test_idle_killed_first(self):
+        self.wrapper.warm(self.spec('ignored'))
+        self.wrapper.run(self.spec('one', cpus=1))
+        self.wrapper.run(self.spec('two', cpus=1))
+        self.assertEqual(self.names(), ['one', 'two'])
+
+    def test_refill(self):
+        del self.wrapper._refill_in_background
+        self.wrapper._refill_in_background(self.spec('ignored')).join()
+        self.assertEqual(len(self.names()), 1)
+        self.assertEqual(self.wrapper._warming, set())
+
+
+class InputStoreRunWrapperTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.client = FakeDockerClient()
+        self.reaper = Mock()
+        self.wrapper = DockerClientRunWrapper(
+            DockerClientSpec(input_store=InputStore(self.tmp_dir)),
+            manager_class=partial(DockerEngineManager, client=self.client),
+            historian=SqliteHistorian(path=':memory:'),
+            reaper=self.reaper)
+
+    def tearDown(self):
+        rmtree(self.tmp_dir)
+
+    def test_input_mounted(self):
+        for name in ['one', 'two']:
+            self.wrapper.run(DockerContainerSpec(
+                image_name='nginx', container_name=name,
+                mem_reservation_mb=15, labels={}, input={'big': 'input'}))
+        mounts = [self.client.containers.get(name).attrs['Mounts'][0]
+                  for name in ['one', 'two']]
+        self.assertEqual(mounts[0]['Source'], mounts[1]['Source'])
+        self.assertEqual(mounts[0]['Destination'], '/tmp/input.json')
+        self.assertFalse(mounts[0]['RW'])
+        self.assertEqual(
+            self.client.containers.get('one').attrs['Config']['Env'],
+            ['INPUT_JSON_PATH=/tmp/input.json'])
+
+        DockerClientRunWrapper.kill(
+            self.client.containers.get('one'), reaper=self.reaper)
+        self.reaper.reap.assert_not_called()
+        self.assertTrue(os.path.exists(mounts[1]['Source']))
+
+    def test_envvar_too(self):
+        wrapper = DockerClientRunWrapper(
+            DockerClientSpec(do_input_json_envvar=True,
+                             input_store=InputStore(self.tmp_dir)),
+            manager_class=partial(DockerEngineManager, client=self.client),
+            historian=SqliteHistorian(path=':memory:'),
+            reaper=self.reaper)
+        wrapper.run(DockerContainerSpec(
+            image_name='nginx', container_name='one',
+            mem_reservation_mb=15, labels={}, input={'big': 'input'}))
+        self.assertEqual(
+            sorted(self.client.containers.get('one').attrs['Config']['Env']),
+            ['INPUT_JSON={"big": "input"}', 'INPUT_JSON_PATH=/tmp/input.json'])
+
+
+class VolumePoolRunWrapperTests(unittest.TestCase):
+
+    def test_volumes_recycled(self):
+        client = FakeDockerClient()
+        wrapper = DockerClientRunWrapper(
+            DockerClientSpec(do_input_json_envvar=True),
+            manager_class=partial(DockerEngineManager, client=client),
+            historian=SqliteHistorian(path=':memory:'),
+            reaper=Mock(),
+            volume_pool_size=2)
+
+        def run(name):
+            wrapper.run(DockerContainerSpec(
+                image_name='nginx', container_name=name, mem_reservation_mb=15,
+                extra_directories=['/refinery-data'], labels={}))
+            return client.containers.get(name).attrs['Mounts'][0]['Name']
+
+        volume = run('one')
+        wrapper._purge()
+        wrapper._volume_pool.join()
+        self.assertEqual(run('two'), volume)
+        self.assertEqual(list(client.volumes.volumes), [volume])
+
+    def test_pooled_volume_kept_without_pool(self):
+        client = FakeDockerClient()
+        reaper = Mock()
+        wrapper = DockerClientRunWrapper(
+            DockerClientSpec(do_input_json_envvar=True),
+            manager_class=partial(DockerEngineManager, client=client),
+            historian=SqliteHistorian(path=':memory:'),
+            reaper=reaper, volume_pool_size=2)
+        wrapper.run(DockerContainerSpec(
+            image_name='nginx', container_name='one', mem_reservation_mb=15,
+            extra_directories=['/refinery-data'], labels={}))
+        DockerClientRunWrapper.kill(
+            client.containers.get('one'), reaper=reaper)
+        reaper.reap.assert_not_called()
+
+
+class MemPolicyRunWrapperTests(unittest.TestCase):
+
+    def names_after_three(self, mem_policy):
+        client = FakeDockerClient()
+        historian = SqliteHistorian(path=':memory:')
+        observed = {}
+        sampler = Mock()
+        sampler.observed_mb.side_effect = observed.get
+        wrapper = DockerClientRunWrapper(
+            DockerClientSpec(do_input_json_envvar=True),
+            manager_class=partial(DockerEngineManager, client=client),
+            historian=historian, reaper=Mock(), mem_limit_mb=50,
+            mem_policy=mem_policy, memory_sampler=sampler)
+
+        def run(name):
+            wrapper.run(DockerContainerSpec(
+                image_name='nginx', container_name=name,
+                mem_reservation_mb=15, labels={}))
+            return wrapper.lookup_container_id(name)
+        observed[run('one')] = 40
+        observed[run('two')] = 5
+        historian.record(wrapper.lookup_container_id('two'), '')
+        # So one is least recently used.
+        run('three')
+        return sorted(container.name for container in wrapper.list())
+
+    def test_reservation(self):
+        self.assertEqual(self.names_after_three(RESERVATION),
+                         ['one', 'three', 'two'])
+
+    def test_observed(self):
+        self.assertEqual(self.names_after_three(OBSERVED), ['three', 'two'])
+
+    def test_max(self):
+        self.assertEqual(self.names_after_three(MAX), ['three', 'two'])
+
+    def test_sampler_started_and_stopped(self):
+        registry = Mock()
+        wrapper = DockerClientRunWrapper(
+            DockerClientSpec(do_input_json_envvar=True),
+            manager_class=partial(
+                DockerEngineManager, client=FakeDockerClient()),
+            historian=SqliteHistorian(path=':memory:'), reaper=Mock(),
+            registry=registry, mem_policy=OBSERVED)
+        sampler = wrapper._memory_sampler
+        self.assertIs(sampler._registry, registry)
+        wrapper.stop()
+        sampler._thread.join(5)
+        self.assertFalse(sampler._thread.is_alive())
+
+    def test_given_sampler_not_stopped(self):
+        sampler = Mock()
+        wrapper = DockerClientRunWrapper(
+            DockerClientSpec(do_input_json_envvar=True),
+            manager_class=partial(
+                DockerEngineManager, client=FakeDockerClient()),
+            historian=SqliteHistorian(path=':memory:'), reaper=Mock(),
+            mem_policy=MAX, memory_sampler=sampler)
+        wrapper.stop()
+        sampler.stop.assert_not_called()
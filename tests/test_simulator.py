@@ -0,0 +1,52 @@
+import unittest
+from datetime import datetime
+
+from django_docker_engine.container_managers.simulated import SimulatedManager
+from django_docker_engine.historian import SqliteHistorian
+from django_docker_engine.simulator import (TraceEvent, VirtualClock, simulate,
+                                            trace_from_historian)
+
+
+class SimulatedManagerTests(unittest.TestCase):
+
+    def test_latencies(self):
+        clock = VirtualClock()
+        manager = SimulatedManager(
+            'label', clock=clock, run_seconds=2, inspect_seconds=0.5)
+        manager.run('image', name='a', ports={'80/tcp': None},
+                    labels={'label.port': '80'})
+        self.assertEqual(manager.get_url('a'), 'http://localhost:32768')
+        self.assertEqual(clock.time(), 2.5)
+        self.assertEqual([c.name for c in manager.list({'label': 'label.port'})],
+                         ['a'])
+        manager.get_container('a').remove(force=True)
+        self.assertEqual(manager.list(), [])
+
+
+class SimulatorTests(unittest.TestCase):
+
+    def test_trace_from_historian(self):
+        historian = SqliteHistorian(path=':memory:')
+        historian.record('b', 'b1', timestamp=datetime(2018, 1, 1, 0, 0, 2))
+        historian.record('a', 'a1', timestamp=datetime(2018, 1, 1, 0, 0, 1))
+        historian.record('a', 'a2', timestamp=datetime(2018, 1, 1, 0, 0, 3, 5))
+        trace = trace_from_historian(historian, ['a', 'b'])
+        self.assertEqual([(e.container_name, e.url) for e in trace],
+                         [('a', '/a1'), ('b', '/b1'), ('a', '/a2')])
+        self.assertAlmostEqual(
+            trace[2].timestamp - trace[0].timestamp, 2.000005, places=5)
+
+    def test_simulate(self):
+        trace = [TraceEvent(t, name, '/')
+                 for (t, name) in enumerate(['a', 'b', 'a', 'c', 'b', 'a'])]
+        report = simulate(
+            trace, mem_limit_mb=200, run_seconds=2, inspect_seconds=0,
+            remove_seconds=0.5, list_seconds=0)
+        self.assertEqual(report.requests, 6)
+        self.assertEqual(report.launches, 3)
+        self.assertEqual(report.relaunches, 2)
+        # c evicts b; b evicts a; a evicts c.
+        self.assertEqual(report.evictions, 3)
+        self.assertEqual(report.freed_mb, 300)
+        self.assertEqual(report.added_launch_seconds, 2 * 2.5)
+        self.assertEqual(report.launch_seconds, 3 * 2 + 4 * 2.5 - 2 * 2.5 + 0.5)
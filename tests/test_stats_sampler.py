@@ -0,0 +1,53 @@
+import unittest
+
+from mock import Mock
+
+from django_docker_engine.registry import ContainerRegistry
+from django_docker_engine.stats_sampler import MemorySampler
+from tests.fake_docker import FakeDockerClient
+
+_MB = 1024 * 1024
+
+
+def fake_container(container_id, stats, status='running'):
+    container = Mock(id=container_id, status=status)
+    container.name = container_id
+    container.stats.return_value = stats
+    return container
+
+
+class MemorySamplerTests(unittest.TestCase):
+
+    def test_sample(self):
+        containers = [
+            fake_container('v1', {'memory_stats': {
+                'usage': 100 * _MB, 'stats': {'total_inactive_file': 60 * _MB}}}),
+            fake_container('v2', {'memory_stats': {
+                'usage': 100 * _MB, 'stats': {'inactive_file': 10 * _MB}}}),
+            fake_container('no-stats', {'memory_stats': {}}),
+            fake_container('exited', {}, status='exited')
+        ]
+        sampler = MemorySampler(lambda: containers)
+        self.assertEqual(sampler.sample(), {'v1': 40, 'v2': 90})
+        self.assertEqual(sampler.observed_mb('v1'), 40)
+        self.assertIsNone(sampler.observed_mb('no-stats'))
+        containers[3].stats.assert_not_called()
+
+        containers.pop(0)
+        sampler.sample()
+        self.assertIsNone(sampler.observed_mb('v1'))
+
+    def test_kept_in_registry(self):
+        client = FakeDockerClient()
+        container = client.containers.run(
+            'nginx', name='one', labels={'root.label': 'true'})
+        registry = ContainerRegistry('root.label', client=client)
+        registry.sync()
+        container.stats = Mock(return_value={
+            'memory_stats': {'usage': 20 * _MB}})
+        sampler = MemorySampler(lambda: [container], registry=registry)
+        sampler.sample()
+        self.assertEqual(registry.observed_mb(container.id), 20)
+        self.assertEqual(sampler.observed_mb(container.id), 20)
+        registry.remove(container.id)
+        self.assertIsNone(sampler.observed_mb(container.id))
@@ -0,0 +1,105 @@
+import json
+import threading
+import unittest
+
+import docker
+import requests
+from django.test import RequestFactory
+from mock import Mock, patch
+
+from django_docker_engine.container_managers.docker_engine import \
+    ContainerRoute
+from django_docker_engine.docker_utils import _in_parallel
+from django_docker_engine.proxy import Proxy
+from django_docker_engine.route_cache import RouteCache
+from django_docker_engine.tracing import (DockerCallBudgetExceeded,
+                                          DockerCallTracer)
+
+
+def fake_send(adapter, request, **kwargs):
+    # Answers as a daemon with two containers would.
+    response = requests.Response()
+    response.status_code = 200
+    response.headers['Content-Type'] = 'application/json'
+    if request.path_url.startswith('/v1.35/containers/json'):
+        body = [{'Id': 'id-1'}, {'Id': 'id-2'}]
+    else:
+        body = {'Id': request.path_url.split('/')[3], 'Name': '/name'}
+    response._content = json.dumps(body).encode('utf-8')
+    response.request = request
+    response.url = request.url
+    return response
+
+
+@patch('requests.adapters.HTTPAdapter.send', fake_send)
+class DockerCallTracerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.client = docker.DockerClient(
+            base_url='tcp://127.0.0.1:2375', version='1.35')
+
+    def test_list_fans_out(self):
+        with DockerCallTracer() as tracer:
+            self.client.containers.list(all=True)
+        self.assertEqual(
+            [(call.method, call.path.split('?')[0]) for call in tracer.calls],
+            [('GET', '/v1.35/containers/json'),
+             ('GET', '/v1.35/containers/id-1/json'),
+             ('GET', '/v1.35/containers/id-2/json')])
+        for call in tracer.calls:
+            self.assertRegexpMatches(
+                call.caller, r'^tests\.test_tracing:test_list_fans_out:\d+$')
+            self.assertGreater(call.received_bytes, 0)
+        self.assertRegexpMatches(
+            tracer.summary(),
+            r'^3 Docker calls in \d+\.\d{3}s\n'
+            r'  GET x3 in \d+\.\d{3}s from tests\.test_tracing:')
+
+    def test_nothing_recorded_outside(self):
+        tracer = DockerCallTracer()
+        with tracer:
+            pass
+        self.client.containers.get('id-1')
+        self.assertEqual(tracer.calls, [])
+
+    def test_other_threads_not_recorded(self):
+        with DockerCallTracer() as tracer:
+            thread = threading.Thread(
+                target=lambda: self.client.containers.get('id-1'))
+            thread.start()
+            thread.join()
+        self.assertEqual(tracer.calls, [])
+
+    def test_in_parallel_propagates(self):
+        with DockerCallTracer() as tracer:
+            _in_parallel(self.client.containers.get, ['id-1', 'id-2'], 2)
+        self.assertEqual(len(tracer.calls), 2)
+
+    def test_budget(self):
+        with self.assertRaises(DockerCallBudgetExceeded):
+            with DockerCallTracer(budget=1):
+                self.client.containers.list(all=True)
+        with DockerCallTracer(budget=1):
+            self.client.containers.get('id-1')
+
+    def test_nested(self):
+        with DockerCallTracer() as outer:
+            self.client.containers.get('id-1')
+            with DockerCallTracer() as inner:
+                self.client.containers.get('id-2')
+        self.assertEqual((len(outer.calls), len(inner.calls)), (2, 1))
+
+
+class ProxyBudgetTests(unittest.TestCase):
+
+    def test_cached_route_makes_no_calls(self):
+        route_cache = RouteCache()
+        route_cache.put('container-name', ContainerRoute(
+            id='id-1', host='127.0.0.1', port='1'))
+        proxy = Proxy(route_cache=route_cache, historian=Mock(),
+                      trace_docker_calls=True)
+        proxy._internal_proxy_view = Mock(return_value='proxied')
+        with DockerCallTracer(budget=0):
+            response = proxy._proxy_view(
+                RequestFactory().get('/'), 'container-name', '')
+        self.assertEqual(response, 'proxied')
@@ -0,0 +1,57 @@
+import unittest
+
+from mock import patch
+
+from django_docker_engine.upstream_pool import UpstreamPool
+
+
+class UpstreamPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.upstream_pool = UpstreamPool(
+            max_connections_per_container=3,
+            idle_seconds=10,
+            connect_timeout_seconds=1,
+            read_timeout_seconds=2)
+        self.pool_manager = self.upstream_pool.pool_manager
+
+    def test_pool_per_container(self):
+        pool = self.pool_manager.connection_from_url('http://localhost:32768')
+        self.assertEqual(pool.pool.maxsize, 3)
+        self.assertTrue(pool.block)
+        self.assertEqual(pool.timeout.connect_timeout, 1)
+        self.assertEqual(pool.timeout.read_timeout, 2)
+        self.assertIs(
+            pool,
+            self.pool_manager.connection_from_url('http://localhost:32768/x'))
+        self.pool_manager.connection_from_url('http://localhost:32769')
+        self.assertEqual(len(self.upstream_pool), 2)
+
+    def test_urlopen_delegates(self):
+        with patch.object(self.pool_manager, 'urlopen') as mock_urlopen:
+            self.upstream_pool.urlopen('GET', 'http://localhost:32768/foo')
+        mock_urlopen.assert_called_with(
+            'GET', 'http://localhost:32768/foo', pool_timeout=10)
+
+    def test_discard(self):
+        self.pool_manager.connection_from_url('http://localhost:32768')
+        self.pool_manager.connection_from_url('http://localhost:32769')
+        self.upstream_pool.discard('http://localhost:32768/')
+        self.assertEqual(len(self.upstream_pool), 1)
+
+    def test_evict_idle(self):
+        with patch.object(self.pool_manager, 'urlopen'), \
+                patch('django_docker_engine.upstream_pool.time',
+                      return_value=100):
+            self.upstream_pool.urlopen('GET', 'http://localhost:32768/')
+            self.pool_manager.connection_from_url('http://localhost:32768')
+        with patch.object(self.pool_manager, 'urlopen'), \
+                patch('django_docker_engine.upstream_pool.time',
+                      return_value=105):
+            self.upstream_pool.urlopen('GET', 'http://localhost:32769/')
+            self.pool_manager.connection_from_url('http://localhost:32769')
+
+        self.upstream_pool.evict_idle(now=112)
+        self.assertEqual(len(self.upstream_pool), 1)
+        self.upstream_pool.evict_idle(now=116)
+        self.assertEqual(len(self.upstream_pool), 0)
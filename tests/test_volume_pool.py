@@ -0,0 +1,111 @@
+import os
+import tempfile
+import unittest
+from shutil import rmtree
+
+from docker.models.volumes import Volume
+from mock import Mock, patch
+
+from django_docker_engine.container_managers.docker_engine import \
+    DockerEngineManager
+from django_docker_engine.volume_pool import VolumePool
+from tests.fake_docker import FakeDockerClient
+
+
+class VolumePoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.create_volume = Mock(
+            side_effect=lambda name, labels: Volume(
+                attrs={'Name': name, 'Labels': labels}))
+        self.remove_volume = Mock()
+        self.list_volumes = Mock(return_value=[])
+        self.lease_dir = os.path.join(self.tmp_dir, 'leases')
+        self.pool = VolumePool(
+            self.create_volume, self.remove_volume, self.list_volumes,
+            'pool-label', max_size=1, lease_dir=self.lease_dir)
+
+    def tearDown(self):
+        rmtree(self.tmp_dir)
+
+    def data_dir(self):
+        directory = tempfile.mkdtemp(dir=self.tmp_dir)
+        os.mkdir(os.path.join(directory, 'sub'))
+        open(os.path.join(directory, 'sub', 'file'), 'w').close()
+        open(os.path.join(directory, 'file'), 'w').close()
+        return directory
+
+    def test_recycled(self):
+        name = self.pool.acquire()
+        self.assertTrue(VolumePool.owns(name))
+        self.create_volume.assert_called_once_with(
+            name=name, labels={'pool-label': 'true'})
+
+        directory = self.data_dir()
+        self.pool.release(name, directory)
+        self.pool.join()
+        self.assertEqual(os.listdir(directory), [])
+        self.assertEqual(self.pool.free_count(), 1)
+
+        self.assertEqual(self.pool.acquire(), name)
+        self.create_volume.assert_called_once()
+
+    def test_removed_when_full(self):
+        (first, second) = (self.pool.acquire(), self.pool.acquire())
+        self.pool.release(first, self.data_dir())
+        self.pool.release(second, self.data_dir())
+        self.pool.join()
+        self.assertEqual(self.pool.free_count(), 1)
+        self.remove_volume.assert_called_once_with(second)
+
+    def test_reclaim(self):
+        directory = self.data_dir()
+        self.list_volumes.return_value = [Volume(attrs={
+            'Name': 'orphan', 'Mountpoint': directory})]
+        self.pool.reclaim()
+        self.pool.join()
+        self.list_volumes.assert_called_once_with(
+            {'label': 'pool-label', 'dangling': True})
+        self.assertEqual(os.listdir(directory), [])
+        self.assertEqual(self.pool.acquire(), 'orphan')
+
+    def test_two_pools(self):
+        manager = DockerEngineManager('label', client=FakeDockerClient())
+
+        def pool(**kwargs):
+            return VolumePool(
+                manager.create_volume, manager.remove_volume,
+                manager.list_volumes, 'pool-label',
+                lease_dir=self.lease_dir, **kwargs)
+        (first, second) = (pool(), pool(grace_seconds=0))
+        acquired = first.acquire()  # Not mounted yet, so dangling.
+        free = first.acquire()
+        first.release(free, None)
+        first.join()
+
+        second.reclaim()
+        second.join()
+        self.assertEqual(second.free_count(), 0)
+        self.assertNotIn(second.acquire(), [acquired, free])
+        self.assertEqual(first.acquire(), free)
+        first.release(free, None)
+        first.join()
+
+        # Once the first process is gone, its volumes can be reclaimed:
+        with patch('django_docker_engine.volume_pool._alive',
+                   return_value=False):
+            third = pool()
+            third.reclaim()
+            third.join()
+            self.assertEqual(third.free_count(), 0)  # In the grace period
+            second.reclaim()
+            second.join()
+        self.assertEqual(second.free_count(), 2)
+        self.assertEqual(
+            sorted([second.acquire(), second.acquire()]),
+            sorted([acquired, free]))
+
+    def test_owns(self):
+        self.assertFalse(VolumePool.owns('volume-1'))
+        self.assertFalse(VolumePool.owns(None))